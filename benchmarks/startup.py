@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Startup time of the 'kata' CLI
+
+Runs each command in a fresh interpreter and reports the median wall time.
+The 'eager imports' line is the cost of only importing the heavy dependencies,
+i.e. the minimum every command paid before they were imported lazily.
+
+Usage: python benchmarks/startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+KATA = str(ROOT_DIR / 'bin' / 'kata')
+
+SCENARIOS = {
+    'bare interpreter': [sys.executable, '-c', 'pass'],
+    'eager imports (requests, yaml, schema)': [sys.executable, '-c', 'import requests, yaml, schema'],
+    'kata --help': [sys.executable, KATA, '--help'],
+    'kata debug debug': [sys.executable, KATA, 'debug', 'debug'],
+}
+
+LOAD_CONFIG = """
+import sys
+from pathlib import Path
+from kata.data.io.file import FileReader, FileWriter, ConfigCache
+from kata.data.repos import ConfigRepo
+work_dir = Path(sys.argv[1])
+config_cache = ConfigCache(work_dir / 'config.cache', FileWriter()) if sys.argv[2] == 'cached' else None
+ConfigRepo(work_dir / 'config.yaml', FileReader(), FileWriter(), config_cache)
+"""
+
+
+def median_wall_time(command, runs):
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR / 'src'))
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as work_dir:
+        scenarios = dict(SCENARIOS)
+        scenarios['load config (parse + validate)'] = [sys.executable, '-c', LOAD_CONFIG, work_dir, 'uncached']
+        scenarios['load config (warm cache)'] = [sys.executable, '-c', LOAD_CONFIG, work_dir, 'cached']
+        scenarios['completion: kata init my_kata <TAB>'] = ['env',
+                                                           '_KATA_COMPLETE=bash_complete',
+                                                           'COMP_WORDS=kata init my_kata ',
+                                                           'COMP_CWORD=3',
+                                                           sys.executable, KATA]
+
+        for scenario, command in scenarios.items():
+            print(f"{scenario:<42} {median_wall_time(command, runs) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
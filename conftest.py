@@ -1,4 +1,7 @@
+import subprocess
 from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict
 
 import pytest
 
@@ -6,3 +9,43 @@ import pytest
 @pytest.fixture
 def thread_pool_executor():
     return ThreadPoolExecutor(100)
+
+
+class BareGitRepo:
+    """
+    Local stand-in for a Github repo, served through a 'file://' url
+    """
+    USER = 'frank'
+    REPO = 'bootstraps'
+
+    def __init__(self, root_dir: Path):
+        self.url_template = f'file://{root_dir}/{{user}}/{{repo}}.git'
+        self.bare_dir = root_dir / self.USER / f'{self.REPO}.git'
+        self._work_dir = root_dir / 'work'
+        self._git('init', '--quiet', '--bare', str(self.bare_dir))
+        # Like Github: allow partial clones
+        self._git('config', 'uploadpack.allowFilter', 'true', cwd=self.bare_dir)
+        self._git('clone', '--quiet', str(self.bare_dir), str(self._work_dir))
+
+    def commit(self, files: Dict[str, str]) -> None:
+        for file_path, file_content in files.items():
+            (self._work_dir / file_path).parent.mkdir(parents=True, exist_ok=True)
+            (self._work_dir / file_path).write_text(file_content)
+        self._git('add', '--all', cwd=self._work_dir)
+        self._git('-c', 'user.name=kata', '-c', 'user.email=kata@example.com',
+                  'commit', '--quiet', '--message', 'Update', cwd=self._work_dir)
+        self._git('push', '--quiet', 'origin', 'HEAD:main', cwd=self._work_dir)
+        self._git('symbolic-ref', 'HEAD', 'refs/heads/main', cwd=self.bare_dir)
+
+    @staticmethod
+    def _git(*args, cwd=None):
+        subprocess.run(['git', *args], cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def bare_git_repo(tmp_path: Path):
+    try:
+        subprocess.run(['git', '--version'], check=True, stdout=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('git is not installed')
+    return BareGitRepo(tmp_path / 'remote')
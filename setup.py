@@ -27,7 +27,7 @@ setup(
     license='MIT',
     scripts=['bin/kata'],
     install_requires=[
-        'click',
+        'click>=8.0',
         'requests',
         'pyyaml',
         'schema'
@@ -0,0 +1,106 @@
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, List, Optional, Callable, Dict
+
+from kata.bench.server import FakeGithub
+from kata.bench.shapes import TreeShape
+from kata.data.io.file import FileWriter, PartialFile
+from kata.data.io.network import GithubApi
+from kata.domain.concurrency import AimdLimiter
+from kata.domain.grepo import GRepo
+
+STRATEGIES: Dict[str, Callable[[int], AimdLimiter]] = {
+    # Starts at the given concurrency, then adapts
+    'adaptive': lambda concurrency: AimdLimiter(initial_limit=concurrency,
+                                                max_limit=max(concurrency, AimdLimiter().max_limit)),
+    # Stays at the given concurrency
+    'fixed': lambda concurrency: AimdLimiter(initial_limit=concurrency,
+                                             min_limit=concurrency,
+                                             max_limit=concurrency),
+}
+
+
+class BenchResult(NamedTuple):
+    shape: str
+    strategy: str
+    concurrency: int
+    wall_time: float
+    listing_requests: int
+    download_requests: int
+    p50: float
+    p95: float
+    p99: float
+
+
+class _TimedApi:
+    """
+    Record the latency of each request, as seen by `GRepo`
+    """
+
+    def __init__(self, api: GithubApi):
+        self._api = api
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+
+    def contents(self, user, repo, path=''):
+        return self._timed(self._api.contents, user, repo, path)
+
+    def download_raw_file(self, raw_file_url: str, sha: Optional[str] = None) -> bytes:
+        return self._timed(self._api.download_raw_file, raw_file_url, sha)
+
+    def download_raw_file_to(self, raw_file_url: str, partial_file: PartialFile, size: int,
+                             sha: Optional[str] = None) -> None:
+        return self._timed(self._api.download_raw_file_to, raw_file_url, partial_file, size, sha)
+
+    def _timed(self, request, *args):
+        start = time.perf_counter()
+        try:
+            return request(*args)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(samples: List[float], percent: int) -> float:
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, (len(samples) * percent) // 100)]
+
+
+def run_bench(shape: TreeShape,
+              strategy: str,
+              concurrency: int,
+              latency: float = 0.0,
+              bandwidth: Optional[int] = None) -> BenchResult:
+    """
+    Explore then download the whole `shape` from a `FakeGithub`
+
+    :param latency: In seconds, added to every request
+    :param bandwidth: In bytes per second, per request. Unlimited if None
+    """
+    limiter = STRATEGIES[strategy](concurrency)
+    with FakeGithub(shape, latency, bandwidth) as fake_github, \
+            ThreadPoolExecutor(limiter.max_limit, thread_name_prefix='bench-') as executor, \
+            tempfile.TemporaryDirectory() as kata_dir:
+        api = _TimedApi(GithubApi([], api_base_url=fake_github.api_base_url, raw_base_url=fake_github.raw_base_url))
+        grepo = GRepo(api, FileWriter(), executor, limiter)
+
+        start = time.perf_counter()
+        files = grepo.get_files_to_download(FakeGithub.USER, FakeGithub.REPO, '')
+        grepo.download_files_at_location(Path(kata_dir) / 'kata', files)
+        wall_time = time.perf_counter() - start
+
+    stats = grepo.stats()
+    return BenchResult(shape=shape.name,
+                       strategy=strategy,
+                       concurrency=concurrency,
+                       wall_time=wall_time,
+                       listing_requests=stats['listing_requests'],
+                       download_requests=stats['download_requests'],
+                       p50=percentile(api.latencies, 50),
+                       p95=percentile(api.latencies, 95),
+                       p99=percentile(api.latencies, 99))
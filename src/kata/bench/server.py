@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+
+from kata.bench.shapes import TreeShape
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks run with up to dozens of concurrent requests
+    request_queue_size = 128
+
+
+class FakeGithub:
+    """
+    In-process stand-in for both the Github contents Api and the raw host, serving a synthetic tree
+
+    :param latency: In seconds, added to every request
+    :param bandwidth: In bytes per second, per request. Unlimited if None
+    """
+
+    USER = 'bench'
+    REPO = 'template'
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, shape: TreeShape, latency: float = 0.0, bandwidth: Optional[int] = None):
+        self._shape = shape
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._server: Optional[_Server] = None
+        self._lock = threading.Lock()
+        self.requests_served = 0
+
+    @property
+    def api_base_url(self) -> str:
+        return f'{self._base_url()}/api'
+
+    @property
+    def raw_base_url(self) -> str:
+        return f'{self._base_url()}/raw'
+
+    @property
+    def raw_files_url(self) -> str:
+        return f'{self.raw_base_url}/{self.USER}/{self.REPO}/main/'
+
+    def __enter__(self) -> 'FakeGithub':
+        self._server = _Server(('127.0.0.1', 0), self._handler_class())
+        threading.Thread(target=self._server.serve_forever, name='fake-github', daemon=True).start()
+        return self
+
+    def __exit__(self, *_exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        fake_github = self
+        contents_prefix = f'/api/repos/{self.USER}/{self.REPO}/contents'
+        raw_prefix = f'/raw/{self.USER}/{self.REPO}/main/'
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with fake_github._lock:
+                    fake_github.requests_served += 1
+                time.sleep(fake_github._latency)
+
+                if self.path.startswith(contents_prefix):
+                    listing = fake_github._shape.listing(self.path[len(contents_prefix):].strip('/'),
+                                                         fake_github.raw_files_url)
+                    if listing is not None:
+                        return self._send(json.dumps(listing).encode(), 'application/json')
+                elif self.path.startswith(raw_prefix):
+                    size = fake_github._shape.file_sizes.get(self.path[len(raw_prefix):])
+                    if size is not None:
+                        return self._send(b'x' * size, 'text/plain')
+                self.send_error(404)
+
+            def _send(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                for start in range(0, len(body), fake_github.CHUNK_SIZE):
+                    chunk = body[start:start + fake_github.CHUNK_SIZE]
+                    self.wfile.write(chunk)
+                    if fake_github._bandwidth:
+                        time.sleep(len(chunk) / fake_github._bandwidth)
+
+            def log_message(self, *_args):
+                pass
+
+        return Handler
@@ -0,0 +1,83 @@
+"""
+Synthetic template trees, each stressing a different part of `GRepo`
+"""
+from typing import NamedTuple, Dict, Callable, List, Optional
+
+KIB = 1024
+MIB = 1024 * KIB
+
+
+class TreeShape(NamedTuple):
+    name: str
+    file_sizes: Dict[str, int]
+
+    def listing(self, dir_path: str, raw_url_prefix: str) -> Optional[List[Dict]]:
+        """
+        :param raw_url_prefix: 'download_url' of files is this prefix followed by their path
+        :return: Entries directly in `dir_path`, in the format of the contents Api. None if it doesn't exist
+        """
+        prefix = f'{dir_path}/' if dir_path else ''
+        entries = {}
+        for file_path, size in self.file_sizes.items():
+            if not file_path.startswith(prefix):
+                continue
+            name, *rest = file_path[len(prefix):].split('/', 1)
+            entry_path = prefix + name
+            if rest:
+                entries[entry_path] = {'name': name, 'path': entry_path, 'type': 'dir', 'size': 0,
+                                       'download_url': None}
+            else:
+                entries[entry_path] = {'name': name, 'path': entry_path, 'type': 'file', 'size': size,
+                                       'download_url': f'{raw_url_prefix}{entry_path}'}
+        return list(entries.values()) if entries or not dir_path else None
+
+
+def wide(dirs: int = 50, files_per_dir: int = 10, file_size: int = KIB) -> TreeShape:
+    """
+    Many sibling directories: listings can all be sent concurrently
+    """
+    return TreeShape('wide', {f'dir_{d}/file_{f}.txt': file_size
+                              for d in range(dirs)
+                              for f in range(files_per_dir)})
+
+
+def deep(depth: int = 30, files_per_level: int = 2, file_size: int = KIB) -> TreeShape:
+    """
+    One long chain of nested directories: listings are strictly sequential
+    """
+    file_sizes = {}
+    dir_path = ''
+    for level in range(depth):
+        dir_path += f'level_{level}/'
+        file_sizes.update({f'{dir_path}file_{f}.txt': file_size for f in range(files_per_level)})
+    return TreeShape('deep', file_sizes)
+
+
+def many_tiny_files(count: int = 1000, file_size: int = 64) -> TreeShape:
+    """
+    Dominated by per-request overhead
+    """
+    return TreeShape('many_tiny_files', {f'file_{f}.txt': file_size for f in range(count)})
+
+
+def few_huge_files(count: int = 3, file_size: int = 4 * MIB) -> TreeShape:
+    """
+    Dominated by bandwidth
+    """
+    return TreeShape('few_huge_files', {f'huge_{f}.bin': file_size for f in range(count)})
+
+
+def large_template(count: int = 40, file_size: int = 8 * MIB) -> TreeShape:
+    """
+    A few hundred MB: memory use of the download path must not grow with the size of the template
+    """
+    return TreeShape('large_template', {f'large_{f}.bin': file_size for f in range(count)})
+
+
+SHAPES: Dict[str, Callable[[], TreeShape]] = {'wide': wide,
+                                              'deep': deep,
+                                              'many_tiny_files': many_tiny_files,
+                                              'few_huge_files': few_huge_files,
+                                              'large_template': large_template}
+# Too slow to benchmark by default
+DEFAULT_SHAPES = [shape_name for shape_name in SHAPES if shape_name != 'large_template']
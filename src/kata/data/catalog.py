@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+from typing import List
+
+from kata.data.io.coordination import file_lock
+from kata.data.io.file import FileWriter
+
+
+class CatalogSnapshot:
+    """
+    Local snapshot of the available languages and templates
+
+    Refreshed as a side effect of the commands querying the Github Api, and read by shell completion
+    which must never wait on the network.
+    """
+
+    def __init__(self, snapshot_file: Path, file_writer: FileWriter):
+        self._snapshot_file = snapshot_file
+        self._lock_file = snapshot_file.with_suffix('.lock')
+        self._file_writer = file_writer
+
+    def languages(self) -> List[str]:
+        return self._read().get('languages', [])
+
+    def templates(self, language: str) -> List[str]:
+        return self._read().get('templates', {}).get(language, [])
+
+    def record_languages(self, language_names: List[str]) -> None:
+        with file_lock(self._lock_file):
+            snapshot = self._read()
+            snapshot['languages'] = sorted(language_names)
+            self._file_writer.write_json_to_file(self._snapshot_file, snapshot)
+
+    def record_templates(self, language_name: str, template_names: List[str]) -> None:
+        with file_lock(self._lock_file):
+            snapshot = self._read()
+            snapshot.setdefault('templates', {})[language_name] = sorted(template_names)
+            self._file_writer.write_json_to_file(self._snapshot_file, snapshot)
+
+    def _read(self) -> dict:
+        try:
+            with self._snapshot_file.open('r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
@@ -0,0 +1,222 @@
+"""
+Coordination between multiple 'kata' processes running on the same host, based on file locks
+"""
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Optional, Mapping, Any, Dict
+
+from kata.data.io.file import FileWriter, FileReader
+from kata.diagnostics import metrics
+
+try:
+    import fcntl
+
+
+    def _lock(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+
+    def _unlock(file):
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+except ImportError:  # Windows
+    import msvcrt
+
+
+    def _lock(file):
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+    def _unlock(file):
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(lock_file: Path):
+    """
+    Exclusive lock shared by all processes (and threads) opening the same `lock_file`
+    """
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with lock_file.open('a') as file:
+        _lock(file)
+        try:
+            yield
+        finally:
+            _unlock(file)
+
+
+def _key_hash(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class SharedRateLimitBudget:
+    """
+    Rate-limit budget of each auth token, shared by all processes on the host
+
+    Fed by the 'X-RateLimit-*' headers seen by any process, and consumed before each request.
+    Consumed and observed in memory, and synced with the other processes every `sync_interval_in_seconds`:
+    taking the host-wide lock on every request would serialize them. An exhausted budget is synced right away.
+    Tokens are never stored, only a hash of them.
+    """
+
+    ANONYMOUS = 'anonymous'
+
+    def __init__(self, budget_file: Path, file_reader: FileReader, file_writer: FileWriter, clock=time.time,
+                 sync_interval_in_seconds=1.0):
+        self._budget_file = budget_file
+        self._lock_file = budget_file.with_suffix('.lock')
+        self._file_reader = file_reader
+        self._file_writer = file_writer
+        self._clock = clock
+        self._sync_interval_in_seconds = sync_interval_in_seconds
+        self._lock = threading.Lock()
+        self._budgets: Dict[str, dict] = {}
+        self._taken_since_sync: Dict[str, int] = {}
+        self._changed_since_sync = False
+        self._last_sync: Optional[float] = None
+
+    def take(self, auth_token: Optional[str]) -> bool:
+        """
+        :return: False if the budget for this token is exhausted until its reset time
+        """
+        key = self._key(auth_token)
+        with self._lock:
+            self._sync_if_due()
+            budget = self._budgets.get(key)
+            if budget is None or budget['reset'] <= self._clock():
+                return True
+            if budget['remaining'] <= 0:
+                return False
+            budget['remaining'] -= 1
+            self._taken_since_sync[key] = self._taken_since_sync.get(key, 0) + 1
+            self._changed_since_sync = True
+            return True
+
+    def observe(self, auth_token: Optional[str], headers: Mapping[str, str]) -> None:
+        if 'X-RateLimit-Remaining' not in headers or 'X-RateLimit-Reset' not in headers:
+            return
+
+        key = self._key(auth_token)
+        remaining = int(headers['X-RateLimit-Remaining'])
+        reset = float(headers['X-RateLimit-Reset'])
+        with self._lock:
+            budget = self._budgets.get(key)
+            if budget and budget['reset'] == reset:
+                # Responses from concurrent requests arrive out of order: lowest count is the most recent
+                remaining = min(remaining, budget['remaining'])
+            elif budget and budget['reset'] > reset:
+                # Response from before the last reset
+                return
+            self._budgets[key] = {'remaining': remaining, 'reset': reset}
+            self._taken_since_sync.pop(key, None)
+            self._changed_since_sync = True
+            if remaining == 0:
+                self._sync()
+            else:
+                self._sync_if_due()
+
+    def remaining(self, auth_token: Optional[str]) -> Optional[int]:
+        """
+        :return: None if unknown, or if the budget was reset since last observed
+        """
+        with self._lock:
+            self._sync_if_due()
+            budget = self._budgets.get(self._key(auth_token))
+        if budget is None or budget['reset'] <= self._clock():
+            return None
+        return budget['remaining']
+
+    def reset_time(self, auth_token: Optional[str]) -> Optional[float]:
+        with self._lock:
+            self._sync_if_due()
+            budget = self._budgets.get(self._key(auth_token))
+        return budget['reset'] if budget else None
+
+    def flush(self) -> None:
+        """
+        Share what was consumed and observed since the last sync
+        """
+        with self._lock:
+            if self._changed_since_sync:
+                self._sync()
+
+    def _sync_if_due(self) -> None:
+        if self._last_sync is None or self._clock() - self._last_sync >= self._sync_interval_in_seconds:
+            self._sync()
+
+    def _sync(self) -> None:
+        with file_lock(self._lock_file):
+            shared_budgets = self._read_budgets()
+            for key, budget in self._budgets.items():
+                shared_budget = shared_budgets.get(key)
+                if shared_budget is None or shared_budget['reset'] < budget['reset']:
+                    shared_budgets[key] = budget
+                elif shared_budget['reset'] == budget['reset']:
+                    # Both this process and others consumed the budget since the last sync
+                    taken_here = self._taken_since_sync.get(key, 0)
+                    remaining = min(budget['remaining'], shared_budget['remaining'] - taken_here)
+                    shared_budgets[key] = {'remaining': max(0, remaining), 'reset': budget['reset']}
+            if self._changed_since_sync:
+                self._file_writer.write_json_to_file(self._budget_file, shared_budgets)
+        self._budgets = {key: dict(budget) for key, budget in shared_budgets.items()}
+        self._taken_since_sync = {}
+        self._changed_since_sync = False
+        self._last_sync = self._clock()
+
+    def _read_budgets(self) -> dict:
+        if not self._budget_file.exists():
+            return {}
+        return self._file_reader.read_json(self._budget_file)
+
+    def _key(self, auth_token: Optional[str]) -> str:
+        return _key_hash(auth_token) if auth_token else self.ANONYMOUS
+
+
+class SingleFlight:
+    """
+    When multiple processes need the same result at the same time, only the first one fetches it,
+    the others wait for it and reuse it.
+
+    Results are kept `ttl_in_seconds` only: this is not a cache, merely deduplication of concurrent work.
+    Results must be json-serializable.
+    """
+
+    def __init__(self, results_dir: Path, file_reader: FileReader, file_writer: FileWriter, ttl_in_seconds=60,
+                 clock=time.time):
+        self._results_dir = results_dir
+        self._file_reader = file_reader
+        self._file_writer = file_writer
+        self._ttl_in_seconds = ttl_in_seconds
+        self._clock = clock
+
+    def run(self, key: str, fetch: Callable[[], Any]) -> Any:
+        result_file = self._results_dir / f'{_key_hash(key)}.json'
+        with file_lock(result_file.with_suffix('.lock')):
+            if self._is_fresh(result_file):
+                metrics.inc('kata_cache_hits_total', cache='single_flight')
+                return self._file_reader.read_json(result_file)['result']
+            metrics.inc('kata_cache_misses_total', cache='single_flight')
+            result = fetch()
+            self._file_writer.write_json_to_file(result_file, {'result': result})
+            return result
+
+    def prune(self) -> None:
+        """
+        Remove expired results. Lock files are kept: another process may be waiting on them.
+        """
+        if not self._results_dir.exists():
+            return
+        for result_file in self._results_dir.glob('*.json'):
+            with file_lock(result_file.with_suffix('.lock')):
+                if result_file.exists() and not self._is_fresh(result_file):
+                    result_file.unlink()
+
+    def _is_fresh(self, result_file: Path) -> bool:
+        try:
+            return self._clock() - os.path.getmtime(result_file) < self._ttl_in_seconds
+        except FileNotFoundError:
+            return False
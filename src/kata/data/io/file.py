@@ -1,6 +1,14 @@
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import shutil
+import threading
 from pathlib import Path
+from typing import Optional, Iterable, Iterator, List
 
-import yaml
+from kata.diagnostics import tracing, metrics
 
 
 class FileWriter:
@@ -14,17 +22,240 @@ class FileWriter:
                 file.write(file_content)
 
         file_full_path = root_dir / file_sub_path
-        create_dir_hierarchy_if_does_not_exist()
-        write_to_file()
+        with tracing.span('write', 'io', path=str(file_sub_path), bytes=len(file_content)):
+            create_dir_hierarchy_if_does_not_exist()
+            write_to_file()
+        metrics.inc('kata_files_written_total')
+
+    @staticmethod
+    def write_bytes_to_file_in_sub_path(root_dir: Path, file_sub_path: Path, file_content: bytes):
+        """
+        Binary-safe: contents are written exactly as given
+        """
+        file_full_path = root_dir / file_sub_path
+        with tracing.span('write', 'io', path=str(file_sub_path), bytes=len(file_content)):
+            file_full_path.parent.mkdir(parents=True, exist_ok=True)
+            file_full_path.write_bytes(file_content)
+        metrics.inc('kata_files_written_total')
+
+    @staticmethod
+    def copy_file_to_sub_path(root_dir: Path, file_sub_path: Path, source_file: Path):
+        """
+        Binary-safe. Symlinks are copied as symlinks
+        """
+        file_full_path = root_dir / file_sub_path
+        with tracing.span('write', 'io', path=str(file_sub_path)):
+            file_full_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(str(source_file), str(file_full_path), follow_symlinks=False)
+        metrics.inc('kata_files_written_total')
+
+    @staticmethod
+    def partial_file_in_sub_path(root_dir: Path, file_sub_path: Path) -> 'PartialFile':
+        return PartialFile(root_dir / file_sub_path)
 
     @staticmethod
     def write_yaml_to_file(file_path: Path, yaml_data: dict):
+        import yaml
         with file_path.open('w') as f:
             yaml.dump(yaml_data, f, default_flow_style=False)
 
+    @classmethod
+    def write_json_to_file(cls, file_path: Path, json_data: dict):
+        """
+        Atomic: concurrent readers, even from other processes, never see a partially written file
+        """
+        cls.write_bytes_to_file(file_path, json.dumps(json_data).encode())
+
+    @staticmethod
+    def write_bytes_to_file(file_path: Path, data: bytes):
+        """
+        Atomic: concurrent readers, even from other processes, never see a partially written file
+        """
+        with tracing.span('write', 'io', path=str(file_path), bytes=len(data)):
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file_path = file_path.with_name(f'{file_path.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+            tmp_file_path.write_bytes(data)
+            os.replace(str(tmp_file_path), str(file_path))
+
+
+class PartialFile:
+    """
+    File being downloaded, kept under a temporary name until complete
+
+    Chunks are persisted as they arrive: when interrupted, the next attempt, even from another run, resumes from there.
+    Nothing is created on disk before the first chunk.
+    """
+
+    SUFFIX = '.kata-download'
+
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self._partial_path = file_path.with_name(file_path.name + self.SUFFIX)
+
+    @property
+    def downloaded_size(self) -> int:
+        try:
+            return self._partial_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def append(self, chunks: Iterable[bytes]) -> None:
+        """
+        Not traced as a 'write': chunks are written while they are still being received
+        """
+        self._partial_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._partial_path.open('ab') as partial:
+            for chunk in chunks:
+                partial.write(chunk)
+                partial.flush()
+
+    def read_chunks(self, chunk_size: int) -> Iterator[bytes]:
+        """
+        What was downloaded so far
+        """
+        if not self._partial_path.exists():
+            return
+        with self._partial_path.open('rb') as partial:
+            yield from iter(lambda: partial.read(chunk_size), b'')
+
+    def restart(self) -> None:
+        if self._partial_path.exists():
+            self._partial_path.unlink()
+
+    def complete(self) -> None:
+        if not self._partial_path.exists():
+            # Empty file: nothing was ever streamed
+            self.append([])
+        os.replace(str(self._partial_path), str(self.file_path))
+        metrics.inc('kata_files_written_total')
+
+
+class GitBlobHash:
+    """
+    Hash of a file's contents as git computes it ('git hash-object'), fed incrementally
+
+    The sha1 of a 'blob <size>' header, followed by the contents. It is the 'sha' of files in Github listings.
+    """
+
+    def __init__(self, size: int):
+        self._sha1 = hashlib.sha1(b'blob %d\0' % size)
+
+    def update(self, chunk: bytes) -> None:
+        self._sha1.update(chunk)
+
+    def hashed(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Hash chunks as they are consumed, so that they don't need to be read a second time
+        """
+        for chunk in chunks:
+            self._sha1.update(chunk)
+            yield chunk
+
+    def hexdigest(self) -> str:
+        return self._sha1.hexdigest()
+
+    @classmethod
+    def of_file(cls, file_path: Path) -> str:
+        """
+        Memory-mapped: the contents are hashed straight from the page cache, without being copied
+        """
+        with file_path.open('rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            blob_hash = cls(size)
+            if size:
+                # Empty files can't be mapped
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                    blob_hash.update(contents)
+        return blob_hash.hexdigest()
+
+    @classmethod
+    def of_bytes(cls, contents: bytes) -> str:
+        blob_hash = cls(len(contents))
+        blob_hash.update(contents)
+        return blob_hash.hexdigest()
+
+
+def git_blob_shas(file_paths: List[Path]) -> List[Optional[str]]:
+    """
+    Hash a chunk of files. A plain function, to be sent to a process pool
+
+    :return: Git blob sha of each file, None for files that can't be read: gone missing, now a directory, ...
+    """
+    shas = []
+    for file_path in file_paths:
+        try:
+            shas.append(GitBlobHash.of_file(file_path))
+        except OSError:
+            shas.append(None)
+    return shas
+
 
 class FileReader:
     @staticmethod
     def read_yaml(file_path: Path) -> dict:
+        import yaml
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        with file_path.open('r') as f:
+            return yaml.load(f, Loader=loader)
+
+    @staticmethod
+    def read_json(file_path: Path) -> dict:
         with file_path.open('r') as f:
-            return yaml.load(f)
+            return json.load(f)
+
+
+class ConfigCache:
+    """
+    Keep an already validated config in a fast-loading form, to skip parsing and validation on every run
+
+    Cache is keyed by the config file's mtime and size, and falls back to a hash of its contents
+    so that a simple `touch` doesn't invalidate it.
+    A config cached under another `schema_version` is never returned: it was validated against another schema.
+    """
+
+    def __init__(self, cache_file: Path, file_writer: FileWriter):
+        self._cache_file = cache_file
+        self._file_writer = file_writer
+
+    def get(self, config_file: Path, schema_version: str = '') -> Optional[dict]:
+        config = self._get(config_file, schema_version)
+        metrics.inc('kata_cache_hits_total' if config is not None else 'kata_cache_misses_total', cache='config')
+        return config
+
+    def _get(self, config_file: Path, schema_version: str) -> Optional[dict]:
+        cached = self._read_cache()
+        if not cached or cached.get('schema_version') != schema_version:
+            return None
+
+        stat = config_file.stat()
+        if (cached['mtime_ns'], cached['size']) == (stat.st_mtime_ns, stat.st_size):
+            return cached['config']
+
+        if cached['sha256'] == self._sha256(config_file):
+            self._write_cache(config_file, cached['config'], schema_version)
+            return cached['config']
+
+        return None
+
+    def put(self, config_file: Path, validated_config: dict, schema_version: str = '') -> None:
+        self._write_cache(config_file, validated_config, schema_version)
+
+    def _read_cache(self) -> Optional[dict]:
+        try:
+            with self._cache_file.open('rb') as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _write_cache(self, config_file: Path, config: dict, schema_version: str):
+        stat = config_file.stat()
+        cached = {'schema_version': schema_version,
+                  'mtime_ns': stat.st_mtime_ns,
+                  'size': stat.st_size,
+                  'sha256': self._sha256(config_file),
+                  'config': config}
+        self._file_writer.write_bytes_to_file(self._cache_file, marshal.dumps(cached))
+
+    @staticmethod
+    def _sha256(file_path: Path) -> str:
+        return hashlib.sha256(file_path.read_bytes()).hexdigest()
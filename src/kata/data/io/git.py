@@ -0,0 +1,127 @@
+"""
+Local git plumbing, as an alternative to the Github Api
+"""
+import os
+import re
+import subprocess
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+from kata.data.io.coordination import file_lock
+from kata.domain.exceptions import GitError
+
+
+class GitCli:
+    def __init__(self, git_executable: str = 'git'):
+        self._git_executable = git_executable
+        self._lock = threading.Lock()
+        self.commands_run = 0
+
+    def run(self, *args: str, cwd: Optional[Path] = None, stdin: Optional[str] = None) -> str:
+        command = [self._git_executable, *args]
+        with self._lock:
+            self.commands_run += 1
+        # Never prompt for credentials: fail instead
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        result = subprocess.run(command, cwd=cwd, input=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, env=env)
+        if result.returncode != 0:
+            raise GitError(command, result.stderr)
+        return result.stdout
+
+
+class GitFile(NamedTuple):
+    path: str
+    sha: str
+
+
+class PartialClone:
+    """
+    One blobless partial clone per repo, kept in `clones_dir`
+
+    Only commits and trees are fetched: listings never touch the network once the clone is up to date.
+    File contents (blobs) are fetched on demand, in one batch, when sparsely checking out the files needed.
+    Each repo is fetched at most once per instance, only transferring what changed since the last time.
+    """
+
+    DEFAULT_URL_TEMPLATE = 'https://github.com/{user}/{repo}.git'
+    UP_TO_DATE_REF = 'refs/remotes/origin/HEAD'
+
+    def __init__(self, clones_dir: Path, git: GitCli, url_template: str = DEFAULT_URL_TEMPLATE):
+        """
+        :param url_template: Remote url, formatted with 'user' and 'repo'. Eg: 'file:///srv/git/{user}/{repo}.git'
+        """
+        self._clones_dir = clones_dir
+        self._git = git
+        self._url_template = url_template
+        self._fetched: Set[Tuple[str, str]] = set()
+
+    def latest_commit(self, user: str, repo: str) -> str:
+        clone_dir = self._clone_dir(user, repo)
+        with self._locked(clone_dir):
+            if (user, repo) not in self._fetched:
+                self._clone_or_fetch(user, repo, clone_dir)
+                self._fetched.add((user, repo))
+            return self._git.run('rev-parse', self.UP_TO_DATE_REF, cwd=clone_dir).strip()
+
+    def is_cloned(self, user: str, repo: str) -> bool:
+        return (self._clone_dir(user, repo) / '.git').exists()
+
+    def list_files(self, user: str, repo: str, commit: str, path: str) -> List[GitFile]:
+        """
+        :return: All files found recursively in `path` at `commit`. Paths are relative to the repo root
+        """
+        pathspec = ['--', path] if path else []
+        output = self._git.run('ls-tree', '-r', '-z', '--full-tree', commit, *pathspec,
+                               cwd=self._clone_dir(user, repo))
+
+        def parse(entry: str) -> Optional[GitFile]:
+            metadata, entry_path = entry.split('\t', 1)
+            _mode, object_type, sha = metadata.split(' ')
+            # Submodules ('commit' objects) can't be checked out from here
+            return GitFile(entry_path, sha) if object_type == 'blob' else None
+
+        return [git_file for git_file in map(parse, filter(None, output.split('\0'))) if git_file]
+
+    @contextmanager
+    def checked_out(self, user: str, repo: str, commit: str, paths: List[str]):
+        """
+        Sparse checkout of only `paths` at `commit`
+
+        :return: Directory where `paths` are checked out. Only valid until the context exits
+        """
+        clone_dir = self._clone_dir(user, repo)
+        with self._locked(clone_dir):
+            sparse_patterns = ''.join(f'/{_literal_sparse_pattern(path)}\n' for path in paths)
+            self._git.run('sparse-checkout', 'set', '--no-cone', '--stdin', cwd=clone_dir, stdin=sparse_patterns)
+            self._git.run('checkout', '--quiet', '--force', '--detach', commit, cwd=clone_dir)
+            yield clone_dir
+
+    def _clone_or_fetch(self, user: str, repo: str, clone_dir: Path):
+        if self.is_cloned(user, repo):
+            self._git.run('fetch', '--quiet', '--prune', 'origin', cwd=clone_dir)
+            return
+        clone_dir.parent.mkdir(parents=True, exist_ok=True)
+        self._git.run('clone', '--quiet', '--filter=blob:none', '--no-checkout', '--sparse',
+                      self._url_template.format(user=user, repo=repo), str(clone_dir))
+
+    def _clone_dir(self, user: str, repo: str) -> Path:
+        return self._clones_dir / user / repo
+
+    @staticmethod
+    def _locked(clone_dir: Path):
+        """
+        Clones are shared by all processes on the host
+        """
+        return file_lock(clone_dir.with_name(f'{clone_dir.name}.lock'))
+
+
+def _literal_sparse_pattern(path: str) -> str:
+    """
+    Sparse-checkout patterns follow the '.gitignore' syntax: escape what would otherwise be interpreted
+    """
+    escaped = re.sub(r'([\\*?\[!#])', r'\\\1', path)
+    # Trailing spaces are ignored unless escaped
+    return escaped[:-1] + '\\ ' if escaped.endswith(' ') else escaped
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent import futures
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from kata.data.io.file import FileReader, FileWriter
+
+T = TypeVar('T')
+
+
+class LatencyStats:
+    """
+    Per-endpoint latency samples (in seconds), persisted between runs
+
+    A corrupt stats file is ignored: samples start over. The file is only written when new samples were recorded.
+    """
+
+    def __init__(self,
+                 stats_file: Optional[Path],
+                 file_reader: FileReader,
+                 file_writer: FileWriter,
+                 max_samples_per_endpoint: int = 100):
+        self._stats_file = stats_file
+        self._file_writer = file_writer
+        self._max_samples_per_endpoint = max_samples_per_endpoint
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = {}
+        self._recorded_since_load = False
+
+        if stats_file and stats_file.exists():
+            try:
+                samples = file_reader.read_json(stats_file)
+            except (OSError, ValueError):
+                samples = {}
+            if isinstance(samples, dict):
+                self._samples = samples
+
+    def record(self, endpoint: str, latency: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(endpoint, [])
+            samples.append(latency)
+            del samples[:-self._max_samples_per_endpoint]
+            self._recorded_since_load = True
+
+    def percentile(self, endpoint: str, percent: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint, []))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, (len(samples) * percent) // 100)
+        return samples[index]
+
+    def sample_count(self, endpoint: str) -> int:
+        with self._lock:
+            return len(self._samples.get(endpoint, []))
+
+    def fastest_first(self, endpoints: List[str]) -> List[str]:
+        """
+        Endpoints without any sample yet are tried first, so they get a chance to be measured
+        """
+
+        def median_or_unknown(endpoint):
+            median = self.percentile(endpoint, 50)
+            return -1 if median is None else median
+
+        return sorted(endpoints, key=median_or_unknown)
+
+    def save(self) -> None:
+        if not self._stats_file or not self._recorded_since_load:
+            return
+        with self._lock:
+            samples = {endpoint: list(latencies) for endpoint, latencies in self._samples.items()}
+        self._file_writer.write_json_to_file(self._stats_file, samples)
+
+
+class HedgedRequests:
+    """
+    Send a request to the historically fastest endpoint, and if it hasn't answered within its p95 latency,
+    send a hedge to the next one. Whichever answers first wins.
+    """
+
+    MIN_SAMPLES_FOR_ADAPTIVE_DELAY = 10
+
+    def __init__(self,
+                 latency_stats: LatencyStats,
+                 executor: futures.Executor,
+                 default_hedge_delay: float = 1.0,
+                 min_hedge_delay: float = 0.05):
+        self._latency_stats = latency_stats
+        self._executor = executor
+        self._default_hedge_delay = default_hedge_delay
+        self._min_hedge_delay = min_hedge_delay
+
+    def first_successful(self, attempts: List[Tuple[str, Callable[[], T]]]) -> T:
+        """
+        :param attempts: Pairs of (endpoint, callable performing the request on that endpoint)
+        :return: Result of the first attempt to succeed
+        :raises: Exception of the fastest endpoint if all attempts fail
+        """
+        attempt_for_endpoint = dict(attempts)
+        remaining_endpoints = self._latency_stats.fastest_first([endpoint for endpoint, _ in attempts])
+        errors: Dict[str, Exception] = {}
+        ordered_endpoints = list(remaining_endpoints)
+
+        def send_next():
+            endpoint = remaining_endpoints.pop(0)
+            future = self._executor.submit(self._timed, endpoint, attempt_for_endpoint[endpoint])
+            in_flight[future] = endpoint
+            return endpoint
+
+        in_flight: Dict[futures.Future, str] = {}
+        last_sent = send_next()
+        while in_flight:
+            timeout = self._hedge_delay(last_sent) if remaining_endpoints else None
+            done, _ = futures.wait(in_flight, timeout=timeout, return_when=futures.FIRST_COMPLETED)
+
+            for future in done:
+                endpoint = in_flight.pop(future)
+                try:
+                    return future.result()
+                except Exception as error:
+                    errors[endpoint] = error
+
+            no_response_within_delay = not done
+            all_in_flight_failed = not in_flight
+            if remaining_endpoints and (no_response_within_delay or all_in_flight_failed):
+                last_sent = send_next()
+
+        raise next(errors[endpoint] for endpoint in ordered_endpoints if endpoint in errors)
+
+    def _hedge_delay(self, endpoint: str) -> float:
+        if self._latency_stats.sample_count(endpoint) < self.MIN_SAMPLES_FOR_ADAPTIVE_DELAY:
+            return self._default_hedge_delay
+        return max(self._min_hedge_delay, self._latency_stats.percentile(endpoint, 95))
+
+    def _timed(self, endpoint: str, attempt: Callable[[], T]) -> T:
+        start = time.monotonic()
+        result = attempt()
+        self._latency_stats.record(endpoint, time.monotonic() - start)
+        return result
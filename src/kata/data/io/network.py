@@ -1,6 +1,102 @@
-import requests
+import hashlib
+import threading
+import time
+from contextlib import ExitStack
+from urllib.parse import urlparse
+from typing import NamedTuple, List, Optional, Dict, Mapping, Iterator, TYPE_CHECKING
 
-from kata.domain.exceptions import ApiLimitReached, InvalidAuthToken
+from kata import defaults
+from kata.data.io.coordination import SharedRateLimitBudget, SingleFlight
+from kata.data.io.file import PartialFile, GitBlobHash
+from kata.data.io.hedging import HedgedRequests
+from kata.data.io.watchdog import RequestWatchdog
+from kata.diagnostics import tracing, metrics
+from kata.domain.exceptions import ApiLimitReached, InvalidAuthToken, ApiThrottled, ApiNotFound, IncompleteDownload, \
+    IntegrityError, RangeNotSatisfiable
+
+if TYPE_CHECKING:
+    import requests
+
+
+class UrlRewrite(NamedTuple):
+    from_prefix: str
+    to_prefix: str
+
+
+class Endpoint(NamedTuple):
+    api_base_url: str
+    raw_base_url: str
+
+
+class TokenPool:
+    """
+    Spread requests across multiple auth tokens, favoring the one with the most remaining calls
+
+    A token whose rate-limit is exhausted is retired until its reset time. Without a reset time, or with one already
+    past (clock skew) which would bring it straight back, it is retired for `DEFAULT_RETIREMENT_IN_SECONDS`.
+    """
+
+    DEFAULT_RETIREMENT_IN_SECONDS = 60 * 60
+
+    def __init__(self, tokens: List[str], clock=time.time):
+        self._tokens = list(dict.fromkeys(tokens))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._remaining: Dict[str, int] = {}
+        self._retired_until: Dict[str, float] = {}
+
+    def __bool__(self):
+        return bool(self._tokens)
+
+    @property
+    def tokens(self) -> List[str]:
+        return list(self._tokens)
+
+    def pick(self) -> Optional[str]:
+        """
+        :return: Token with the most remaining calls, or None if the pool is empty
+        :raises ApiLimitReached: if all tokens are retired
+        """
+        if not self._tokens:
+            return None
+
+        def unknown_remaining_counts_as_untouched(token):
+            return self._remaining.get(token, float('inf'))
+
+        with self._lock:
+            now = self._clock()
+            for token, retired_until in list(self._retired_until.items()):
+                if retired_until <= now:
+                    del self._retired_until[token]
+                    del self._remaining[token]
+            available_tokens = [token for token in self._tokens if token not in self._retired_until]
+            if not available_tokens:
+                raise ApiLimitReached()
+            return max(available_tokens, key=unknown_remaining_counts_as_untouched)
+
+    def retire(self, token: str, until: Optional[float] = None) -> None:
+        with self._lock:
+            self._remaining[token] = 0
+            self._retired_until[token] = self._retirement_end(until)
+
+    def update(self, token: Optional[str], headers: Mapping[str, str]) -> None:
+        if token is None or 'X-RateLimit-Remaining' not in headers:
+            return
+
+        with self._lock:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            self._remaining[token] = remaining
+            if remaining == 0:
+                reset = headers.get('X-RateLimit-Reset')
+                self._retired_until[token] = self._retirement_end(float(reset) if reset is not None else None)
+            else:
+                self._retired_until.pop(token, None)
+
+    def _retirement_end(self, reset: Optional[float]) -> float:
+        now = self._clock()
+        if reset is not None and reset > now:
+            return reset
+        return now + self.DEFAULT_RETIREMENT_IN_SECONDS
 
 
 class GithubApi:
@@ -8,47 +104,362 @@ class GithubApi:
     Basic wrapper around the Github Api
     """
 
-    def __init__(self, auth_token: str):
-        self._requests = requests
-        self._auth_token = auth_token
+    STREAM_CHUNK_SIZE = 64 * 1024
+    DOWNLOAD_ATTEMPTS = 3
+    CONNECT_TIMEOUT_IN_SECONDS = 10
+    # Between two reads on the connection: a stalled download fails, to be resumed by the next attempt
+    READ_TIMEOUT_IN_SECONDS = 60
+
+    def __init__(self,
+                 auth_tokens: List[str],
+                 api_base_url: str = defaults.GITHUB_API_BASE_URL,
+                 raw_base_url: str = defaults.GITHUB_RAW_BASE_URL,
+                 url_rewrites: Optional[List[UrlRewrite]] = None,
+                 mirrors: Optional[List[Endpoint]] = None,
+                 hedged_requests: Optional[HedgedRequests] = None,
+                 shared_budget: Optional[SharedRateLimitBudget] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 transport=None,
+                 watchdog: Optional[RequestWatchdog] = None):
+        """
+        :param mirrors: Other endpoints able to serve the same repos. Only used along with `hedged_requests`
+        :param shared_budget: Rate-limit budget shared with other processes on the host
+        :param single_flight: Deduplicate listings concurrently fetched by other processes on the host
+        :param transport: Sends the requests, with the same `get` as 'requests'. Eg: to record or replay responses
+        :param watchdog: Tracks requests in flight, to report the slow ones
+        """
+        self._requests = transport
+        self._token_pool = TokenPool(auth_tokens)
+        self._endpoint = self._normalized(Endpoint(api_base_url, raw_base_url))
+        self._url_rewrites = url_rewrites or []
+        self._mirrors = [self._normalized(mirror) for mirror in mirrors or []]
+        self._hedged_requests = hedged_requests
+        self._shared_budget = shared_budget
+        self._single_flight = single_flight
+        self._watchdog = watchdog
+
+    @property
+    def api_base_url(self) -> str:
+        return self._endpoint.api_base_url
 
     def contents(self, user, repo, path=''):
-        url = f'https://api.github.com/repos/{user}/{repo}/contents'
+        url = f'{self._endpoint.api_base_url}/repos/{user}/{repo}/contents'
         if path:
             url += f'/{path}'
 
-        response = self._get_url(url)
-        return response.json()
+        return self._once_across_processes(url, lambda: self._get_url(url).json())
+
+    def download_raw_file(self, raw_file_url: str, sha: Optional[str] = None) -> bytes:
+        """
+        Contents exactly as received: binary files are left intact, and what was verified against `sha` is what gets
+        written
+
+        :param sha: Git blob sha, as listed. The download is retried when its contents don't match
+        :raises IntegrityError: if the contents still don't match after all attempts
+        """
+        # Unlike listings, not deduplicated across processes: file contents would all be persisted to disk
+        url = self._use_configured_raw_base_url(raw_file_url)
+        for _attempt in range(self.DOWNLOAD_ATTEMPTS):
+            contents = self._get_url(url).content
+            if not sha:
+                return contents
+            actual_sha = GitBlobHash.of_bytes(contents)
+            if actual_sha == sha:
+                return contents
+            metrics.inc('kata_integrity_errors_total')
+        raise IntegrityError(url, sha, actual_sha)
 
-    def download_raw_text_file(self, raw_text_file_url: str):
-        response = self._get_url(raw_text_file_url)
-        return response.text
+    def download_raw_file_to(self, raw_file_url: str, partial_file: PartialFile, size: int,
+                             sha: Optional[str] = None) -> None:
+        """
+        Stream a file to disk as it is received. Interrupted downloads resume with a `Range` request, on retries
+        here or on the next run, when the server supports it. Never deduplicated across processes nor hedged
+
+        :param size: In bytes, as listed. Downloads of files of unknown size (0) always start over
+        :param sha: Git blob sha, as listed. Hashed while streaming, a mismatch restarts the download
+        :raises IncompleteDownload: if still not fully downloaded after all attempts
+        :raises IntegrityError: if the contents still don't match after all attempts
+        """
+        url = self._use_configured_raw_base_url(raw_file_url)
+        last_error = None
+        for _attempt in range(self.DOWNLOAD_ATTEMPTS):
+            try:
+                actual_sha = self._stream_to(url, partial_file, size, sha)
+            except OSError as error:
+                # Includes connection errors, and errors while receiving the body, from 'requests'
+                last_error = error
+                continue
+            if size and partial_file.downloaded_size != size:
+                if partial_file.downloaded_size > size:
+                    # File changed since it was listed: what was downloaded so far can't be trusted
+                    partial_file.restart()
+                continue
+            if actual_sha == sha:
+                return
+            metrics.inc('kata_integrity_errors_total')
+            partial_file.restart()
+            last_error = IntegrityError(url, sha, actual_sha)
+        if isinstance(last_error, IntegrityError):
+            raise last_error
+        raise IncompleteDownload(url, partial_file.downloaded_size, size) from last_error
+
+    def remaining_rate_limit(self) -> Optional[int]:
+        """
+        :return: Api calls left across all tokens, as last seen by any process. None if unknown
+        """
+        if not self._shared_budget:
+            return None
+        remaining_per_token = [self._shared_budget.remaining(token) for token in self._token_pool.tokens or [None]]
+        if None in remaining_per_token:
+            return None
+        return sum(remaining_per_token)
+
+    def _once_across_processes(self, url: str, fetch):
+        if not self._single_flight:
+            return fetch()
+        return self._single_flight.run(url, fetch)
+
+    def _stream_to(self, url: str, partial_file: PartialFile, size: int, sha: Optional[str]) -> Optional[str]:
+        """
+        :return: Git blob sha of the whole file, None if no `sha` to check it against
+        """
+
+        def hash_of_downloaded():
+            # Resuming: only what was downloaded before is read again, to carry on hashing from there
+            blob_hash = GitBlobHash(size)
+            for chunk in partial_file.read_chunks(self.STREAM_CHUNK_SIZE):
+                blob_hash.update(chunk)
+            return blob_hash
+
+        offset = partial_file.downloaded_size if size else 0
+        if offset == 0 or offset > size:
+            # Nothing to resume, or more than listed: the file shrank since, what was downloaded can't be trusted
+            partial_file.restart()
+            offset = 0
+        elif offset == size:
+            # Interrupted right before completion
+            return hash_of_downloaded().hexdigest() if sha else None
+        # Never compressed: ranges, sizes and hashes are then those of the file itself
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+        url_on_endpoint = self._rewrite(self._moved_to_endpoint(url, self._endpoint))
+        # Tracked until the whole body is received: that's when a large download stalls
+        with self._tracking(url_on_endpoint), tracing.span('GET', 'http', url=url, offset=offset) as get_span:
+            try:
+                response = self._get_url_on_endpoint(url, self._endpoint, headers=headers, stream=True)
+            except RangeNotSatisfiable:
+                # The file shrank below what was downloaded, since it was listed: start over
+                partial_file.restart()
+                return self._stream_to(url, partial_file, size, sha)
+            get_span.set(status=response.status_code)
+            try:
+                if offset and response.status_code == 206:
+                    metrics.inc('kata_resumed_downloads_total')
+                    blob_hash = hash_of_downloaded() if sha else None
+                else:
+                    # `Range` not supported: the whole file is sent again
+                    partial_file.restart()
+                    blob_hash = GitBlobHash(size) if sha else None
+                chunks = response.iter_content(self.STREAM_CHUNK_SIZE)
+                if metrics.enabled():
+                    chunks = self._counted(chunks, host=urlparse(url_on_endpoint).netloc)
+                partial_file.append(blob_hash.hashed(chunks) if blob_hash else chunks)
+            finally:
+                response.close()
+        return blob_hash.hexdigest() if blob_hash else None
 
     def _get_url(self, url: str):
-        response = self._requests.get(url, headers=self._headers())
-        self._validate_response(response)
-        return response
+        with tracing.span('GET', 'http', url=url) as get_span:
+            response = self._get_url_on_any_endpoint(url)
+            get_span.set(status=response.status_code, bytes=len(response.content))
+            return response
+
+    def _is_raw(self, url: str) -> bool:
+        """
+        :param url: On the main endpoint
+        """
+        return url.startswith(self._endpoint.raw_base_url)
+
+    def _get_url_on_any_endpoint(self, url: str):
+        if not self._hedged_requests or not self._mirrors:
+            return self._get_url_on_endpoint(url, self._endpoint)
+
+        def attempt_on(endpoint: Endpoint):
+            return lambda: self._get_url_on_endpoint(url, endpoint)
+
+        # Listings and raw downloads are timed separately: they are served by different hosts
+        is_raw = self._is_raw(url)
+        all_endpoints = [self._endpoint] + self._mirrors
+        return self._hedged_requests.first_successful([(endpoint.raw_base_url if is_raw else endpoint.api_base_url,
+                                                        attempt_on(endpoint))
+                                                       for endpoint in all_endpoints])
+
+    def _get_url_on_endpoint(self, url: str, endpoint: Endpoint, headers: Optional[Dict[str, str]] = None,
+                             stream: bool = False):
+        """
+        :param stream: The body is only received while iterating over it. Not tracked by the watchdog: the caller
+                       tracks it for as long as it receives the body
+        """
+        url_on_endpoint = self._rewrite(self._moved_to_endpoint(url, endpoint))
+        for _attempt in range(max(1, len(self._token_pool.tokens))):
+            auth_token = self._token_pool.pick()
+            if not self._take_from_shared_budget(auth_token):
+                continue
+            start = time.perf_counter()
+            with self._tracking(url_on_endpoint) if not stream else ExitStack():
+                response = self._http_client().get(url_on_endpoint,
+                                                   headers={**self._headers(auth_token), **(headers or {})},
+                                                   timeout=(self.CONNECT_TIMEOUT_IN_SECONDS,
+                                                            self.READ_TIMEOUT_IN_SECONDS),
+                                                   **({'stream': True} if stream else {}))
+            if metrics.enabled():
+                self._record_metrics(url_on_endpoint, 'raw' if self._is_raw(url) else 'contents', auth_token, response,
+                                     time.perf_counter() - start, stream)
+            self._token_pool.update(auth_token, response.headers)
+            if self._shared_budget:
+                self._shared_budget.observe(auth_token, response.headers)
+            if auth_token and self._rate_limit_reached(response):
+                # Token is now retired until its reset time: retry with the next one
+                response.close()
+                continue
+            try:
+                self._validate_response(response, auth_token)
+            except Exception:
+                # Streamed responses hold their connection until closed
+                response.close()
+                raise
+            return response
+        # Each token was tried once, and each was exhausted
+        raise ApiLimitReached()
+
+    def _tracking(self, url: str):
+        """
+        An empty `ExitStack` does nothing: `contextlib.nullcontext` is only available from Python 3.7
+        """
+        return self._watchdog.tracking(url) if self._watchdog else ExitStack()
+
+    def _http_client(self):
+        """
+        'requests' is slow to import: only pay for it when actually sending a request
+        """
+        if self._requests is None:
+            import requests
+            self._requests = requests
+        return self._requests
 
-    def _headers(self):
-        if not self._auth_token:
+    @staticmethod
+    def _record_metrics(url: str, endpoint: str, auth_token: Optional[str], response: 'requests.Response',
+                        latency: float, stream: bool):
+        """
+        :param endpoint: 'contents' for the Api, 'raw' for raw files
+        :param stream: The body isn't received yet: its bytes are counted as they are received, see `_counted`
+        """
+        host = urlparse(url).netloc
+        metrics.inc('kata_http_requests_total', host=host, endpoint=endpoint, status=str(response.status_code))
+        metrics.observe('kata_http_request_duration_seconds', latency, host=host, endpoint=endpoint)
+        if not stream:
+            metrics.inc('kata_downloaded_bytes_total', len(response.content), host=host)
+        if 'X-RateLimit-Remaining' in response.headers:
+            # Never expose tokens, only a short hash of them
+            token = hashlib.sha256(auth_token.encode()).hexdigest()[:8] if auth_token else 'anonymous'
+            metrics.set_gauge('kata_rate_limit_remaining', int(response.headers['X-RateLimit-Remaining']), token=token)
+
+    @staticmethod
+    def _counted(chunks: Iterator[bytes], host: str) -> Iterator[bytes]:
+        """
+        Bytes actually received, decoded: unlike 'Content-Length', right for compressed and interrupted bodies
+        """
+        for chunk in chunks:
+            metrics.inc('kata_downloaded_bytes_total', len(chunk), host=host)
+            yield chunk
+
+    def _take_from_shared_budget(self, auth_token: Optional[str]) -> bool:
+        """
+        :return: False if the token was exhausted by another process and has now been retired
+        :raises ApiLimitReached: if unauthenticated requests are exhausted
+        """
+        if not self._shared_budget or self._shared_budget.take(auth_token):
+            return True
+        if not auth_token:
+            raise ApiLimitReached()
+        self._token_pool.retire(auth_token, until=self._shared_budget.reset_time(auth_token))
+        return False
+
+    def _moved_to_endpoint(self, url: str, endpoint: Endpoint) -> str:
+        for base_url, endpoint_base_url in [(self._endpoint.api_base_url, endpoint.api_base_url),
+                                            (self._endpoint.raw_base_url, endpoint.raw_base_url)]:
+            if url.startswith(base_url):
+                return endpoint_base_url + url[len(base_url):]
+        return url
+
+    def _use_configured_raw_base_url(self, raw_url: str) -> str:
+        """
+        The Api always returns absolute 'download_url's. When pointing at a mirror or a local stand-in,
+        these still reference the public raw host and must be re-based onto the configured one.
+        """
+        default_raw_base_url = defaults.GITHUB_RAW_BASE_URL
+        if self._endpoint.raw_base_url == default_raw_base_url or not raw_url.startswith(default_raw_base_url):
+            return raw_url
+        return self._endpoint.raw_base_url + raw_url[len(default_raw_base_url):]
+
+    def _rewrite(self, url: str) -> str:
+        for rewrite in self._url_rewrites:
+            if url.startswith(rewrite.from_prefix):
+                return rewrite.to_prefix + url[len(rewrite.from_prefix):]
+        return url
+
+    @staticmethod
+    def _normalized(endpoint: Endpoint) -> Endpoint:
+        return Endpoint(api_base_url=endpoint.api_base_url.rstrip('/'),
+                        raw_base_url=endpoint.raw_base_url.rstrip('/'))
+
+    @staticmethod
+    def _headers(auth_token: Optional[str]):
+        if not auth_token:
             return {}
-        return {'Authorization': f'token {self._auth_token}'}
+        return {'Authorization': f'token {auth_token}'}
 
-    def _validate_response(self, response: requests.Response):
-        def rate_limit_reached():
-            def unauthorised():
-                return response.status_code == 403
+    @staticmethod
+    def _rate_limit_reached(response: 'requests.Response'):
+        def unauthorised():
+            return response.status_code == 403
 
-            def limit_reached():
-                return int(response.headers.get('X-RateLimit-Remaining', -1)) == 0
+        def limit_reached():
+            return int(response.headers.get('X-RateLimit-Remaining', -1)) == 0
 
-            return unauthorised() and limit_reached()
+        return unauthorised() and limit_reached()
 
+    def _validate_response(self, response: 'requests.Response', auth_token: Optional[str]):
         def invalid_auth():
             return response.status_code == 401
 
-        if rate_limit_reached():
+        def not_found():
+            return response.status_code == 404
+
+        def range_not_satisfiable():
+            return response.status_code == 416
+
+        def throttled():
+            too_many_requests = response.status_code == 429
+            secondary_rate_limit = response.status_code == 403 and 'Retry-After' in response.headers
+            return too_many_requests or secondary_rate_limit
+
+        def retry_after():
+            try:
+                return float(response.headers['Retry-After'])
+            except (KeyError, ValueError):
+                # Missing, or an http date
+                return None
+
+        if self._rate_limit_reached(response):
             raise ApiLimitReached()
+        if throttled():
+            raise ApiThrottled(response.status_code, retry_after())
         if invalid_auth():
-            raise InvalidAuthToken(self._auth_token)
+            raise InvalidAuthToken(auth_token)
+        if not_found():
+            raise ApiNotFound(response.url)
+        if range_not_satisfiable():
+            raise RangeNotSatisfiable(response.url)
         response.raise_for_status()
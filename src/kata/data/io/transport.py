@@ -0,0 +1,123 @@
+"""
+Transports for `GithubApi` recording real responses to a cassette file, and replaying them without any network
+"""
+import base64
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Deque, List, Optional
+
+from kata.data.io.file import FileWriter, FileReader
+from kata.domain.exceptions import ApiError, CassetteMiss
+
+# 2: bodies are recorded as base64 of their bytes, instead of as text
+CASSETTE_VERSION = 2
+
+
+class RecordedResponse:
+    """
+    Implements the subset of `requests.Response` used by `GithubApi`
+    """
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes):
+        # Header names are case-insensitive, as in `requests.Response`, whatever their case when recorded
+        from requests.structures import CaseInsensitiveDict
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size: int = 1):
+        content = self.content
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise ApiError(f"Recorded response is an error | Status: {self.status_code} | Url: '{self.url}'")
+
+
+class RecordingTransport:
+    """
+    Send requests for real, and record every response along with how long it took
+    """
+
+    def __init__(self, cassette_file: Path, file_writer: FileWriter, http_client=None):
+        """
+        :param http_client: Defaults to 'requests'
+        """
+        self._cassette_file = cassette_file
+        self._file_writer = file_writer
+        self._http_client = http_client
+        self._lock = threading.Lock()
+        self._interactions: List[dict] = []
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs):
+        if self._http_client is None:
+            import requests
+            self._http_client = requests
+        start = time.perf_counter()
+        response = self._http_client.get(url, headers=headers, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            # Request headers are never recorded: they contain the auth token
+            self._interactions.append({'url': url,
+                                       'status_code': response.status_code,
+                                       'headers': dict(response.headers),
+                                       'body': base64.b64encode(response.content).decode('ascii'),
+                                       'elapsed': elapsed})
+        return response
+
+    def save(self) -> None:
+        with self._lock:
+            cassette = {'version': CASSETTE_VERSION, 'interactions': list(self._interactions)}
+        self._file_writer.write_json_to_file(self._cassette_file, cassette)
+
+
+class ReplayTransport:
+    """
+    Serve the responses of a cassette, without any network
+
+    Responses to the same url are replayed in the recorded order, the last one being repeated once exhausted.
+    """
+
+    def __init__(self, cassette_file: Path, file_reader: FileReader, original_timing: bool = False):
+        """
+        :param original_timing: Wait as long as the recorded request took before responding
+        """
+        self._original_timing = original_timing
+        self._lock = threading.Lock()
+        self._interactions_by_url: Dict[str, Deque[dict]] = {}
+        cassette = file_reader.read_json(cassette_file)
+        self._version = cassette.get('version', 1)
+        for interaction in cassette['interactions']:
+            self._interactions_by_url.setdefault(interaction['url'], deque()).append(interaction)
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, **_kwargs) -> RecordedResponse:
+        with self._lock:
+            interactions = self._interactions_by_url.get(url)
+            if not interactions:
+                raise CassetteMiss(url)
+            interaction = interactions.popleft() if len(interactions) > 1 else interactions[0]
+
+        if self._original_timing:
+            time.sleep(interaction['elapsed'])
+        return RecordedResponse(url, interaction['status_code'], interaction['headers'], self._content_of(interaction))
+
+    def _content_of(self, interaction: dict) -> bytes:
+        if self._version == 1:
+            # Recorded as text: only text bodies can be replayed exactly
+            return interaction['body'].encode()
+        return base64.b64decode(interaction['body'])
@@ -0,0 +1,151 @@
+"""
+Watchdog over requests in flight: reports the slow ones, and shows what each thread is stuck on
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple, Callable, Optional, Dict, List
+
+from kata.data.io.file import FileWriter, FileReader
+
+
+class InFlightRequest(NamedTuple):
+    url: str
+    thread_name: str
+    # `time.time()`: comparable across processes
+    started_at: float
+
+
+class RequestWatchdog:
+    """
+    Checks run every `check_interval` from a background thread, started along with the first tracked request.
+
+    While requests are in flight, they are also published to `state_file`, for other processes to show them.
+    """
+
+    def __init__(self,
+                 threshold: float,
+                 report: Callable[[str], None],
+                 dump_stacks: bool = False,
+                 state_file: Optional[Path] = None,
+                 file_writer: Optional[FileWriter] = None,
+                 check_interval: float = 1.0,
+                 clock=time.time):
+        """
+        :param threshold: In seconds. Requests in flight for longer are reported, once each
+        :param dump_stacks: Also report the stacks of all threads, the first time a request is slow
+        """
+        self._threshold = threshold
+        self._report = report
+        self._dump_stacks = dump_stacks
+        self._state_file = state_file
+        self._file_writer = file_writer or FileWriter()
+        self._check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._in_flight: Dict[int, InFlightRequest] = {}
+        self._reported = set()
+        self._request_ids = itertools.count()
+        self._stacks_dumped = False
+        self._stopped = threading.Event()
+        self._checker: Optional[threading.Thread] = None
+
+    @contextmanager
+    def tracking(self, url: str):
+        request_id = next(self._request_ids)
+        with self._lock:
+            self._in_flight[request_id] = InFlightRequest(url, threading.current_thread().name, self._clock())
+            self._start_checker_if_not_started()
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._in_flight[request_id]
+                self._reported.discard(request_id)
+
+    def in_flight(self) -> List[InFlightRequest]:
+        """
+        :return: Oldest first
+        """
+        with self._lock:
+            return sorted(self._in_flight.values(), key=lambda request: request.started_at)
+
+    def check(self) -> None:
+        now = self._clock()
+        with self._lock:
+            newly_slow = {request_id: request for request_id, request in self._in_flight.items()
+                          if now - request.started_at > self._threshold and request_id not in self._reported}
+            self._reported.update(newly_slow)
+            dump_stacks = bool(newly_slow) and self._dump_stacks and not self._stacks_dumped
+            self._stacks_dumped = self._stacks_dumped or dump_stacks
+
+        for request in newly_slow.values():
+            self._report(f"Slow request: in flight for {now - request.started_at:.1f}s "
+                         f"| Thread: '{request.thread_name}' | Url: '{request.url}'")
+        if dump_stacks:
+            self._report(all_thread_stacks())
+        self._publish_state()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._checker:
+            self._checker.join()
+        if self._state_file and self._state_file.exists():
+            self._state_file.unlink()
+
+    def _start_checker_if_not_started(self):
+        if self._checker is None:
+            self._checker = threading.Thread(target=self._check_until_stopped, name='request-watchdog', daemon=True)
+            self._checker.start()
+
+    def _check_until_stopped(self):
+        while not self._stopped.wait(self._check_interval):
+            self.check()
+
+    def _publish_state(self):
+        """
+        The state file only exists while requests are in flight
+        """
+        if not self._state_file:
+            return
+        in_flight = self.in_flight()
+        if in_flight:
+            self._file_writer.write_json_to_file(self._state_file, {'pid': os.getpid(),
+                                                                    'requests': [request._asdict()
+                                                                                 for request in in_flight]})
+        elif self._state_file.exists():
+            self._state_file.unlink()
+
+
+def all_thread_stacks() -> str:
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = []
+    for thread_id, frame in sys._current_frames().items():
+        stacks.append(f"Thread '{thread_names.get(thread_id, thread_id)}':\n"
+                      + ''.join(traceback.format_stack(frame)))
+    return '\n'.join(stacks)
+
+
+def read_in_flight_requests(state_dir: Path,
+                            file_reader: FileReader,
+                            max_age: float = 10.0) -> Dict[int, List[InFlightRequest]]:
+    """
+    :param max_age: In seconds. State files not refreshed since are left behind by processes that died
+    :return: Requests in flight per process id
+    """
+    in_flight_per_process = {}
+    for state_file in sorted(state_dir.glob('*.json')) if state_dir.exists() else []:
+        try:
+            if time.time() - state_file.stat().st_mtime > max_age:
+                continue
+            state = file_reader.read_json(state_file)
+        except (OSError, ValueError):
+            # Removed or replaced while being read
+            continue
+        in_flight_per_process[state['pid']] = [InFlightRequest(**request) for request in state['requests']]
+    return in_flight_per_process
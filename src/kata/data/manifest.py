@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+from typing import Optional, Iterable
+
+from kata.data.io.file import FileWriter
+from kata.domain.models import KataManifest, DownloadableFile
+from kata.domain.path_filter import PathFilter
+
+
+class KataManifestRepo:
+    """
+    Manifest of a kata, kept in the kata itself so that it follows the kata wherever it is copied
+
+    Written as `MANIFEST_PATH` in every kata initialized: its own directory keeps it apart from the files of the
+    template.
+    """
+
+    MANIFEST_PATH = Path('.kata', 'manifest.json')
+
+    def __init__(self, file_writer: FileWriter):
+        self._file_writer = file_writer
+
+    @classmethod
+    def in_the_way(cls, files: Iterable[DownloadableFile]) -> Optional[DownloadableFile]:
+        """
+        :return: The file of a template that the manifest would overwrite, or that stands where its directory goes
+        """
+        manifest_paths = {cls.MANIFEST_PATH, *cls.MANIFEST_PATH.parents} - {Path('.')}
+        return next((file for file in files if file.file_path in manifest_paths), None)
+
+    def save(self, kata_dir: Path, manifest: KataManifest) -> None:
+        self._file_writer.write_json_to_file(kata_dir / self.MANIFEST_PATH, {
+            'user': manifest.user,
+            'repo': manifest.repo,
+            'path': manifest.path,
+            'include': [*manifest.path_filter.include],
+            'exclude': [*manifest.path_filter.exclude],
+            'files': [[file.file_path.as_posix(), file.download_url, file.size, file.sha] for file in manifest.files]
+        })
+
+    def get(self, kata_dir: Path) -> Optional[KataManifest]:
+        """
+        :return: None if the kata has no manifest, or an unreadable one
+        """
+        try:
+            with (kata_dir / self.MANIFEST_PATH).open('r') as f:
+                manifest = json.load(f)
+            return KataManifest(user=manifest['user'],
+                                repo=manifest['repo'],
+                                path=manifest['path'],
+                                path_filter=PathFilter(include=tuple(manifest['include']),
+                                                       exclude=tuple(manifest['exclude'])),
+                                files=[DownloadableFile(Path(file_path), download_url, size, sha)
+                                       for file_path, download_url, size, sha in manifest['files']])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
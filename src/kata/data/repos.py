@@ -1,24 +1,47 @@
+import hashlib
 import re
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import List, Optional
-
-import schema
+from typing import List, Optional, Callable, TypeVar
 
 from kata import defaults
-from kata.data.io.file import FileReader, FileWriter
-from kata.data.io.network import GithubApi
-from kata.domain.exceptions import InvalidConfig
-from kata.domain.models import KataTemplate, KataLanguage
+from kata.data.catalog import CatalogSnapshot
+from kata.data.io.file import FileReader, FileWriter, ConfigCache
+from kata.data.io.git import PartialClone
+from kata.data.io.network import GithubApi, UrlRewrite, Endpoint
+from kata.domain.exceptions import InvalidConfig, ApiNotFound
+from kata.domain.models import KataTemplate, KataLanguage, KataGRepoSource
+from kata.domain.path_filter import PathFilter
+
+T = TypeVar('T')
 
 
 class ConfigRepo:
-    def __init__(self, config_file: Path, file_reader: FileReader, file_writer: FileWriter):
+    def __init__(self,
+                 config_file: Path,
+                 file_reader: FileReader,
+                 file_writer: FileWriter,
+                 config_cache: Optional[ConfigCache] = None):
         self._file_reader = file_reader
         self._file_writer = file_writer
 
         self._create_config_file_with_defaults_if_doesnt_exist(config_file)
-        self._load_config(config_file)
-        self._validate_config()
+        schema_version = self.schema_hash() if config_cache else None
+        cached_config = config_cache.get(config_file, schema_version) if config_cache else None
+        if cached_config is not None:
+            self._config = cached_config
+        else:
+            self._load_config(config_file)
+            self._validate_config()
+            if config_cache:
+                config_cache.put(config_file, self._config, schema_version)
+
+    @staticmethod
+    def schema_hash() -> str:
+        """
+        :return: Hash of the code validating the config: changes whenever the schema may have changed
+        """
+        return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
 
     def get_kata_grepo_username(self) -> str:
         return self._config['KataGRepo']['User']
@@ -26,20 +49,76 @@ class ConfigRepo:
     def get_kata_grepo_reponame(self) -> str:
         return self._config['KataGRepo']['Repo']
 
+    def get_kata_grepo_sources(self) -> List[KataGRepoSource]:
+        """
+        :return: 'KataGRepo' (named 'default') and all 'KataGRepos', highest priority first
+        """
+        default_source = KataGRepoSource(name='default',
+                                         user=self.get_kata_grepo_username(),
+                                         repo=self.get_kata_grepo_reponame(),
+                                         priority=self._config['KataGRepo'].get('Priority', 0))
+        other_sources = [KataGRepoSource(name=source['Name'],
+                                         user=source['User'],
+                                         repo=source['Repo'],
+                                         priority=source.get('Priority', 0))
+                         for source in self._config.get('KataGRepos', [])]
+        return sorted([default_source] + other_sources, key=lambda source: -source.priority)
+
     def has_template_at_root(self, language: KataLanguage) -> Optional[bool]:
         """
         :return: True if yes, False if no, None if unknown
         """
         return self._config['HasTemplateAtRoot'].get(language.name, None)
 
+    def get_path_filter(self, language: KataLanguage) -> PathFilter:
+        """
+        :return: Default include / exclude globs for the templates of `language`
+        """
+        language_filters = self._config.get('Filters', {}).get(language.name, {})
+        return PathFilter(include=tuple(language_filters.get('Include', [])),
+                          exclude=tuple(language_filters.get('Exclude', [])))
+
     def get_auth_token(self) -> Optional[str]:
         if 'Token' not in self._config['Auth']:
             return None
         return self._config['Auth']['Token']
 
+    def get_auth_tokens(self) -> List[str]:
+        """
+        :return: 'Token' followed by all tokens in the 'Tokens' pool
+        """
+        main_token = [self.get_auth_token()] if self.get_auth_token() else []
+        return main_token + self._config['Auth'].get('Tokens', [])
+
     def should_skip_not_logged_in_warning(self):
         return self._config['Auth']['SkipNotLoggedInWarning']
 
+    def get_api_base_url(self) -> str:
+        return self._github_config().get('ApiBaseUrl', defaults.GITHUB_API_BASE_URL)
+
+    def get_raw_base_url(self) -> str:
+        return self._github_config().get('RawBaseUrl', defaults.GITHUB_RAW_BASE_URL)
+
+    def get_url_rewrites(self) -> List[UrlRewrite]:
+        return [UrlRewrite(from_prefix=rewrite['From'], to_prefix=rewrite['To'])
+                for rewrite in self._github_config().get('UrlRewrites', [])]
+
+    def get_mirrors(self) -> List[Endpoint]:
+        return [Endpoint(api_base_url=mirror['ApiBaseUrl'], raw_base_url=mirror['RawBaseUrl'])
+                for mirror in self._github_config().get('Mirrors', [])]
+
+    def use_git_backend(self) -> bool:
+        """
+        :return: True if templates are downloaded through local partial clones instead of the Github Api
+        """
+        return self._config.get('GitBackend', {}).get('Enabled', False)
+
+    def get_git_url_template(self) -> str:
+        return self._config.get('GitBackend', {}).get('UrlTemplate', PartialClone.DEFAULT_URL_TEMPLATE)
+
+    def _github_config(self) -> dict:
+        return self._config.get('Github', {})
+
     def _create_config_file_with_defaults_if_doesnt_exist(self, config_file):
         if not config_file.exists():
             self._file_writer.write_yaml_to_file(config_file, defaults.DEFAULT_CONFIG)
@@ -48,38 +127,96 @@ class ConfigRepo:
         self._config = self._file_reader.read_yaml(config_file)
 
     def _validate_config(self):
+        import schema
+        url = schema.Regex(r'^https?://')
         expected_schema = schema.Schema({'KataGRepo': {'User': str,
-                                                       'Repo': str},
+                                                       'Repo': str,
+                                                       schema.Optional('Priority'): int},
+                                         schema.Optional('KataGRepos'): [{'Name': schema.Regex(r'^[^:\s]+$'),
+                                                                          'User': str,
+                                                                          'Repo': str,
+                                                                          schema.Optional('Priority'): int}],
                                          'HasTemplateAtRoot': {schema.Optional(str): bool},
+                                         schema.Optional('Filters'): {schema.Optional(str): {
+                                             schema.Optional('Include'): [str],
+                                             schema.Optional('Exclude'): [str]}},
+                                         schema.Optional('GitBackend'): {'Enabled': bool,
+                                                                         schema.Optional('UrlTemplate'): str},
                                          'Auth': {'SkipNotLoggedInWarning': bool,
-                                                  schema.Optional('Token'): str}})
+                                                  schema.Optional('Token'): str,
+                                                  schema.Optional('Tokens'): [str]},
+                                         schema.Optional('Github'): {schema.Optional('ApiBaseUrl'): url,
+                                                                     schema.Optional('RawBaseUrl'): url,
+                                                                     schema.Optional('UrlRewrites'): [
+                                                                         {'From': str,
+                                                                          'To': str}],
+                                                                     schema.Optional('Mirrors'): [
+                                                                         {'ApiBaseUrl': url,
+                                                                          'RawBaseUrl': url}]}})
         try:
             expected_schema.validate(self._config)
         except schema.SchemaError as error:
             raise InvalidConfig(error)
 
 
+def _query_all_sources(sources: List[KataGRepoSource],
+                       query: Callable[[KataGRepoSource], List[T]],
+                       executor: Optional[Executor]) -> List[T]:
+    """
+    Query all sources concurrently when an executor is available: latency is the one of the slowest source
+
+    :return: Results of all sources, in the order of `sources`
+    """
+    if executor and len(sources) > 1:
+        results_per_source = executor.map(query, sources)
+    else:
+        results_per_source = map(query, sources)
+    return [result for results in results_per_source for result in results]
+
+
 class KataTemplateRepo:
-    def __init__(self, api: GithubApi, config_repo: ConfigRepo):
+    def __init__(self,
+                 api: GithubApi,
+                 config_repo: ConfigRepo,
+                 catalog: Optional[CatalogSnapshot] = None,
+                 executor: Optional[Executor] = None):
+        """
+        :param catalog: Refreshed with the templates found, for shell completion
+        :param executor: Used to query all template sources concurrently
+        """
         self._api = api
         self._config_repo = config_repo
+        self._catalog = catalog
+        self._executor = executor
 
     def get_for_language(self, language: KataLanguage) -> List[KataTemplate]:
-        contents_of_language_root_dir = self._api.contents(self._config_repo.get_kata_grepo_username(),
-                                                           self._config_repo.get_kata_grepo_reponame(),
-                                                           language.name)
-
-        if self._has_template_at_root(language, contents_of_language_root_dir):
-            template_at_root = KataTemplate(language=language, template_name=None)
-            return [template_at_root]
-
-        available_template_names = self._extract_available_template_names(contents_of_language_root_dir)
-
-        def all_kata_templates_for_language():
-            for template_name in available_template_names:
-                yield KataTemplate(language, template_name)
-
-        return list(all_kata_templates_for_language())
+        """
+        :return: Templates of all sources, highest priority source first
+        """
+        def templates_in_source(source: KataGRepoSource) -> List[KataTemplate]:
+            try:
+                contents_of_language_root_dir = self._api.contents(source.user, source.repo, language.name)
+            except ApiNotFound:
+                # Not all sources provide all languages
+                return []
+
+            if self._has_template_at_root(language, contents_of_language_root_dir):
+                template_at_root = KataTemplate(language=language, template_name=None, source=source)
+                return [template_at_root]
+
+            available_template_names = self._extract_available_template_names(contents_of_language_root_dir)
+            return [KataTemplate(language, template_name, source) for template_name in available_template_names]
+
+        all_kata_templates_for_language = _query_all_sources(self._config_repo.get_kata_grepo_sources(),
+                                                             templates_in_source,
+                                                             self._executor)
+        self._record_in_catalog(language, all_kata_templates_for_language)
+        return all_kata_templates_for_language
+
+    def _record_in_catalog(self, language: KataLanguage, templates: List[KataTemplate]):
+        if self._catalog:
+            template_names = [template.template_name for template in templates if template.template_name]
+            self._catalog.record_templates(language.name, list(dict.fromkeys(template_names)))
 
     def _has_template_at_root(self, language, dir_contents):
 
@@ -115,16 +252,39 @@ class KataTemplateRepo:
 
 
 class KataLanguageRepo:
-    def __init__(self, api: GithubApi, config_repo: ConfigRepo):
+    def __init__(self,
+                 api: GithubApi,
+                 config_repo: ConfigRepo,
+                 catalog: Optional[CatalogSnapshot] = None,
+                 executor: Optional[Executor] = None):
+        """
+        :param catalog: Refreshed with the languages found, for shell completion
+        :param executor: Used to query all template sources concurrently
+        """
         self._api = api
         self._config_repo = config_repo
+        self._catalog = catalog
+        self._executor = executor
 
     def get_all(self) -> List[KataLanguage]:
-        contents_of_root_dir = self._api.contents(self._config_repo.get_kata_grepo_username(),
-                                                  self._config_repo.get_kata_grepo_reponame(),
-                                                  '')
-
-        return list(self._all_sub_directories_mapped_to_languages(contents_of_root_dir))
+        """
+        :return: Languages available in at least one source
+        """
+        def languages_in_source(source: KataGRepoSource) -> List[KataLanguage]:
+            try:
+                contents_of_root_dir = self._api.contents(source.user, source.repo, '')
+            except ApiNotFound:
+                # A misconfigured or deleted source must not hide the languages of the others
+                return []
+            return list(self._all_sub_directories_mapped_to_languages(contents_of_root_dir))
+
+        languages_of_all_sources = _query_all_sources(self._config_repo.get_kata_grepo_sources(),
+                                                      languages_in_source,
+                                                      self._executor)
+        all_languages = list(dict.fromkeys(languages_of_all_sources))
+        if self._catalog:
+            self._catalog.record_languages([language.name for language in all_languages])
+        return all_languages
 
     @staticmethod
     def _all_sub_directories_mapped_to_languages(contents_of_dir):
@@ -5,3 +5,8 @@ DEFAULT_CONFIG = {
     'HasTemplateAtRoot': {'java': False},
     'Auth': {'SkipNotLoggedInWarning': False}
 }
+
+GITHUB_API_BASE_URL = 'https://api.github.com'
+GITHUB_RAW_BASE_URL = 'https://raw.githubusercontent.com'
+
+CACHE_DIR = '~/.cache/kata'
@@ -0,0 +1,170 @@
+"""
+Peak memory per phase, and the allocation sites holding the most memory at the peak
+
+Python allocations are traced with tracemalloc, and the RSS is sampled alongside them from a background thread.
+Phases are the 'kata' spans of a `Tracer`: memory stats are only reported per phase while tracing.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import NamedTuple, List, Optional
+
+from kata.diagnostics.tracing import Tracer
+
+
+class MemorySample(NamedTuple):
+    time: float
+    rss: int
+    # Peak of Python allocations since the previous sample
+    traced_peak: int
+
+
+class PhaseMemory(NamedTuple):
+    name: str
+    duration: float
+    traced_peak: int
+    rss_peak: int
+
+
+class AllocationSite(NamedTuple):
+    location: str
+    size: int
+    count: int
+
+
+def current_rss() -> int:
+    """
+    :return: In bytes. Outside of Linux, only the highest RSS so far is available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class MemStats:
+    """
+    Allocation sites are taken from a snapshot of the traced memory, refreshed each time it grows past
+    `SNAPSHOT_GROWTH` times the size of the previous snapshot: it stays close to the peak for a handful of snapshots.
+    """
+
+    SNAPSHOT_GROWTH = 1.2
+    COMMAND_PHASE = 'command'
+
+    def __init__(self, sampling_interval: float = 0.01):
+        self._sampling_interval = sampling_interval
+        self._lock = threading.Lock()
+        self._samples: List[MemorySample] = []
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_size = 0
+        self._highest_traced_peak = 0
+        self._start = 0.0
+        self._sampling = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self._start = time.perf_counter()
+        self._sampling.set()
+        self._sampler = threading.Thread(target=self._sample_memory, name='memstats-sampler', daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._sampling.clear()
+        self._sampler.join()
+        self._take_sample()
+        tracemalloc.stop()
+
+    def phases(self, tracer: Optional[Tracer] = None) -> List[PhaseMemory]:
+        """
+        :param tracer: Phases are its 'kata' spans, in the order they started
+        :return: The whole command first, then all phases
+        """
+        spans = [event for event in (tracer.events() if tracer else [])
+                 if event['ph'] == 'X' and event['cat'] == 'kata']
+        with self._lock:
+            samples = list(self._samples)
+        end = samples[-1].time if samples else self._start
+        phases = [self._phase_memory(self.COMMAND_PHASE, self._start, end, samples)]
+        for event in sorted(spans, key=lambda span: span['ts']):
+            phase_start = tracer.origin + event['ts'] / 1e6
+            phases.append(self._phase_memory(event['name'], phase_start, phase_start + event['dur'] / 1e6, samples))
+        return phases
+
+    def top_allocation_sites(self, limit: int = 10) -> List[AllocationSite]:
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        return [AllocationSite(location=f'{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}',
+                               size=statistic.size,
+                               count=statistic.count)
+                for statistic in snapshot.statistics('lineno')[:limit]]
+
+    def report(self, tracer: Optional[Tracer] = None) -> str:
+        lines = ['Memory:',
+                 f"  {'phase':<20} {'time (s)':>9} {'peak python':>12} {'peak rss':>10}"]
+        for phase in self.phases(tracer):
+            lines.append(f'  {phase.name:<20} {phase.duration:>9.3f} {_human_size(phase.traced_peak):>12} '
+                         f'{_human_size(phase.rss_peak):>10}')
+        lines.append('Top allocation sites, at the highest sampled memory:')
+        for site in self.top_allocation_sites():
+            lines.append(f'  {_human_size(site.size):>10} {site.count:>8} blocks  {site.location}')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _phase_memory(name: str, start: float, end: float, samples: List[MemorySample]) -> PhaseMemory:
+        """
+        A sample covers the time since the previous one: a phase is covered by all samples overlapping it
+        """
+        traced_peak = rss_peak = 0
+        previous_sample_time = float('-inf')
+        for sample in samples:
+            if sample.time >= start and previous_sample_time <= end:
+                traced_peak = max(traced_peak, sample.traced_peak)
+                rss_peak = max(rss_peak, sample.rss)
+            previous_sample_time = sample.time
+        return PhaseMemory(name=name, duration=end - start, traced_peak=traced_peak, rss_peak=rss_peak)
+
+    def _sample_memory(self):
+        while self._sampling.is_set():
+            self._take_sample()
+            time.sleep(self._sampling_interval)
+
+    def _take_sample(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            peak = self._peak_since_previous_sample(current, peak)
+        sample = MemorySample(time=time.perf_counter(), rss=current_rss(), traced_peak=peak)
+        take_snapshot = current > self._snapshot_size * self.SNAPSHOT_GROWTH
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]) if take_snapshot else None
+        with self._lock:
+            self._samples.append(sample)
+            if snapshot is not None:
+                self._snapshot = snapshot
+                self._snapshot_size = current
+
+    def _peak_since_previous_sample(self, current: int, peak: int) -> int:
+        """
+        Before Python 3.9 the traced peak can't be reset: it is the highest since tracing started. It only tells about
+        the time since the previous sample when it is a new high, otherwise the current size is the closest known
+        """
+        new_high = peak > self._highest_traced_peak
+        self._highest_traced_peak = max(self._highest_traced_peak, peak)
+        return peak if new_high else current
+
+
+def _human_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
@@ -0,0 +1,123 @@
+"""
+Metrics exposed as a Prometheus textfile, for node-exporter's textfile collector
+
+Like tracing, metrics are only collected between `start_collecting` and `stop_collecting`.
+Values cover a single command: each run overwrites the textfile.
+"""
+import threading
+from typing import Optional, Dict, Tuple, List
+
+HISTOGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_HELP = {
+    'kata_http_requests_total': ('counter', 'Requests sent, per host, endpoint and status'),
+    'kata_http_request_duration_seconds': ('histogram', 'Request latency, per host and endpoint'),
+    'kata_downloaded_bytes_total': ('counter', 'Bytes downloaded, per host'),
+    'kata_cache_hits_total': ('counter', 'Cache hits, per cache'),
+    'kata_cache_misses_total': ('counter', 'Cache misses, per cache'),
+    'kata_files_written_total': ('counter', 'Kata files written'),
+    'kata_rate_limit_remaining': ('gauge', 'Remaining Github Api calls last reported, per (hashed) token'),
+    'kata_command_duration_seconds': ('gauge', 'Duration of the command, per command'),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+    def inc(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        with self._lock:
+            self._values[(name, self._labels(labels))] = value
+
+    def observe(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        """
+        Histogram is stored as: counts per bucket (cumulative), then sum, then count
+        """
+        key = (name, self._labels(labels))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [0] * len(HISTOGRAM_BUCKETS) + [0.0, 0])
+            for index, upper_bound in enumerate(HISTOGRAM_BUCKETS):
+                if value <= upper_bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: list(histogram) for key, histogram in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS_HELP.items():
+            samples = sorted((labels, value) for (metric_name, labels), value in values.items() if metric_name == name)
+            histogram_samples = sorted((labels, histogram) for (metric_name, labels), histogram in histograms.items()
+                                       if metric_name == name)
+            if not samples and not histogram_samples:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in samples:
+                lines.append(f'{name}{self._format_labels(labels)} {value:g}')
+            for labels, histogram in histogram_samples:
+                for upper_bound, count in zip(HISTOGRAM_BUCKETS, histogram):
+                    lines.append(f'{name}_bucket{self._format_labels(labels + (("le", f"{upper_bound:g}"),))} {count}')
+                lines.append(f'{name}_bucket{self._format_labels(labels + (("le", "+Inf"),))} {histogram[-1]}')
+                lines.append(f'{name}_sum{self._format_labels(labels)} {histogram[-2]:g}')
+                lines.append(f'{name}_count{self._format_labels(labels)} {histogram[-1]}')
+        return ''.join(f'{line}\n' for line in lines)
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    @staticmethod
+    def _format_labels(labels: Labels) -> str:
+        def escaped(value: str):
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{label}="{escaped(value)}"' for label, value in labels) + '}'
+
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def enabled() -> bool:
+    return _registry is not None
+
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    if _registry is not None:
+        _registry.inc(name, value, labels)
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    if _registry is not None:
+        _registry.set(name, value, labels)
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    if _registry is not None:
+        _registry.observe(name, value, labels)
+
+
+def start_collecting() -> MetricsRegistry:
+    global _registry
+    _registry = MetricsRegistry()
+    return _registry
+
+
+def stop_collecting() -> Optional[MetricsRegistry]:
+    global _registry
+    registry, _registry = _registry, None
+    return registry
@@ -0,0 +1,119 @@
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+
+class Profiler:
+    """
+    Deterministic profile (cProfile) of every thread started while profiling, plus the main thread,
+    and a sampled wall-clock profile written as collapsed stacks, ready for flamegraph tools.
+
+    Only covers threads started after `start`: executors are created lazily, so all workers are.
+    From Python 3.12, a single profile covers all threads: a second one can't be enabled.
+    """
+
+    ONE_PROFILE_FOR_ALL_THREADS = sys.version_info >= (3, 12)
+
+    def __init__(self, sampling_interval: float = 0.005):
+        self._sampling_interval = sampling_interval
+        self._lock = threading.Lock()
+        self._profiles: List[cProfile.Profile] = []
+        self._profile_of_starting_thread: Optional[cProfile.Profile] = None
+        self._stacks = Counter()
+        self._sampling = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not self.ONE_PROFILE_FOR_ALL_THREADS:
+            threading.setprofile(self._profile_new_thread)
+        self._profile_of_starting_thread = self._profile_current_thread()
+        self._sampling.set()
+        self._sampler = threading.Thread(target=self._sample_stacks, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        """
+        Must be called from the thread which started profiling: a profile can't be disabled from another thread.
+        Other threads are profiled until they end, or until `write`.
+        """
+        self._sampling.clear()
+        self._sampler.join()
+        threading.setprofile(None)
+        self._profile_of_starting_thread.disable()
+
+    def write(self, stats_file: Path) -> Path:
+        """
+        Write pstats to `stats_file`, and collapsed stacks next to it
+
+        :return: Collapsed stacks file
+        """
+        with self._lock:
+            stats = pstats.Stats(*[_Snapshot(profile) for profile in self._profiles])
+            collapsed_stacks = [f'{stack} {count}\n' for stack, count in sorted(self._stacks.items())]
+        stats.dump_stats(str(stats_file))
+        collapsed_stacks_file = stats_file.with_suffix('.collapsed')
+        collapsed_stacks_file.write_text(''.join(collapsed_stacks))
+        return collapsed_stacks_file
+
+    def _profile_new_thread(self, _frame, _event, _arg):
+        # Called on the first event of each new thread. Enabling cProfile replaces this hook for the thread
+        if threading.current_thread() is self._sampler:
+            sys.setprofile(None)
+            return
+        self._profile_current_thread()
+
+    def _profile_current_thread(self) -> cProfile.Profile:
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+        return profile
+
+    def _sample_stacks(self):
+        sampler_id = threading.get_ident()
+        while self._sampling.is_set():
+            thread_names = {thread.ident: self._normalized_thread_name(thread.name)
+                            for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                stack = self._collapsed_stack(frame)
+                with self._lock:
+                    self._stacks[f"{thread_names.get(thread_id, 'unknown')};{stack}"] += 1
+            time.sleep(self._sampling_interval)
+
+    @staticmethod
+    def _collapsed_stack(frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+    @staticmethod
+    def _normalized_thread_name(thread_name: str) -> str:
+        """
+        Merge all workers of the same executor: 'grepo-_12' -> 'grepo-'
+        """
+        return re.sub(r'_\d+$', '', thread_name)
+
+
+class _Snapshot:
+    """
+    Stats of a profile, taken without disabling it: `pstats.Stats` would disable it from the calling thread
+    """
+
+    def __init__(self, profile: cProfile.Profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
@@ -0,0 +1,115 @@
+"""
+Lightweight spans, exported in the Chrome trace format (chrome://tracing, ui.perfetto.dev)
+
+Spans are only recorded between `start_tracing` and `stop_tracing`. Otherwise `span` returns a shared no-op:
+instrumented code then pays a single global lookup per span.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, List, Dict
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        return False
+
+    def set(self, **_args) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    def __init__(self, tracer: 'Tracer', name: str, category: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, _exc_value, _traceback):
+        if exc_type is not None:
+            self._args['error'] = exc_type.__name__
+        self._tracer.record(self._name, self._category, self._start, time.perf_counter(), self._args)
+        return False
+
+    def set(self, **args) -> None:
+        """
+        Add args only known once the span is running. Eg: the status of a response
+        """
+        self._args.update(args)
+
+
+class Tracer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: List[dict] = []
+        self._thread_names: Dict[int, str] = {}
+        # `time.perf_counter()` at ts 0
+        self.origin = time.perf_counter()
+
+    def span(self, name: str, category: str, args: dict) -> _Span:
+        return _Span(self, name, category, args)
+
+    def record(self, name: str, category: str, start: float, end: float, args: dict) -> None:
+        thread = threading.current_thread()
+        event = {'name': name,
+                 'cat': category,
+                 'ph': 'X',
+                 'ts': (start - self.origin) * 1e6,
+                 'dur': (end - start) * 1e6,
+                 'pid': os.getpid(),
+                 'tid': thread.ident,
+                 'args': args}
+        with self._lock:
+            self._events.append(event)
+            self._thread_names[thread.ident] = thread.name
+
+    def events(self) -> List[dict]:
+        with self._lock:
+            thread_names = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id,
+                             'args': {'name': thread_name}}
+                            for thread_id, thread_name in self._thread_names.items()]
+            return thread_names + list(self._events)
+
+    def write(self, trace_file: Path) -> None:
+        trace_file.write_text(json.dumps({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}))
+
+
+_tracer: Optional[Tracer] = None
+
+
+def span(name: str, category: str = 'kata', **args):
+    """
+    Usage: `with span('download', url=url) as current_span: ...; current_span.set(status=200)`
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    return _tracer.span(name, category, args)
+
+
+def start_tracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing() -> Optional[Tracer]:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def current_tracer() -> Optional[Tracer]:
+    return _tracer
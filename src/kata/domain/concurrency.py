@@ -0,0 +1,187 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent import futures
+from typing import Callable, List, Tuple, Any, Optional
+
+from kata.domain.exceptions import ApiLimitReached, ApiThrottled
+
+
+class AimdLimiter:
+    """
+    Additive-Increase / Multiplicative-Decrease limit on the number of in-flight requests
+
+    - Grows by one every time a full window of requests succeeds while latency stays flat
+    - Halves when the Api throttles (403/429) or when latency spikes compared to the best observed one
+    """
+
+    def __init__(self,
+                 initial_limit: int = 4,
+                 min_limit: int = 1,
+                 max_limit: int = 64,
+                 latency_spike_ratio: float = 2.0,
+                 latency_spike_min_increase: float = 0.05,
+                 backoff_ratio: float = 0.5):
+        """
+        :param latency_spike_min_increase: In seconds. Avoids treating jitter on sub-millisecond latencies as spikes
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._limit = initial_limit
+        self._latency_spike_ratio = latency_spike_ratio
+        self._latency_spike_min_increase = latency_spike_min_increase
+        self._backoff_ratio = backoff_ratio
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._successes_in_window = 0
+        self._completions_until_next_backoff_allowed = 0
+        self._best_latency = None
+        self._smoothed_latency = None
+        self._highest_limit = initial_limit
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def highest_limit(self) -> int:
+        return self._highest_limit
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self._limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def on_success(self, latency: float) -> None:
+        def update_latencies():
+            self._best_latency = latency if self._best_latency is None else min(self._best_latency, latency)
+            self._smoothed_latency = latency if self._smoothed_latency is None \
+                else 0.8 * self._smoothed_latency + 0.2 * latency
+
+        def latency_spiked():
+            return self._smoothed_latency > self._best_latency * self._latency_spike_ratio \
+                   and self._smoothed_latency > self._best_latency + self._latency_spike_min_increase
+
+        with self._lock:
+            update_latencies()
+            if latency_spiked():
+                self._back_off()
+                return
+
+            self._completions_until_next_backoff_allowed -= 1
+            self._successes_in_window += 1
+            if self._successes_in_window >= self._limit:
+                self._successes_in_window = 0
+                self._limit = min(self.max_limit, self._limit + 1)
+                self._highest_limit = max(self._highest_limit, self._limit)
+
+    def on_throttled(self) -> None:
+        with self._lock:
+            self._back_off()
+
+    def _back_off(self):
+        """
+        Only back off once per window: all requests in flight when the issue started
+        would otherwise each halve the limit again.
+        """
+        if self._completions_until_next_backoff_allowed > 0:
+            self._completions_until_next_backoff_allowed -= 1
+            return
+        self._limit = max(self.min_limit, int(self._limit * self._backoff_ratio))
+        self._successes_in_window = 0
+        self._smoothed_latency = self._best_latency
+        self._completions_until_next_backoff_allowed = self._in_flight
+
+
+class LimitedScheduler:
+    """
+    Queue tasks and only hand them to the executor while the limiter allows more in-flight work
+
+    Queued tasks are dispatched by priority (lowest first), then in submission order.
+    A throttled task is queued again at its priority, once the Api allows it, up to `MAX_THROTTLED_ATTEMPTS` times.
+    """
+
+    THROTTLING_ERRORS = (ApiThrottled, ApiLimitReached)
+    MAX_THROTTLED_ATTEMPTS = 3
+    # When the Api doesn't tell how long to wait. Doubled on each attempt
+    THROTTLED_BACKOFF_IN_SECONDS = 1.0
+
+    def __init__(self, executor: futures.Executor, limiter: AimdLimiter,
+                 run_later: Optional[Callable[[float, Callable], None]] = None):
+        """
+        :param run_later: Calls a function after a delay in seconds, without blocking. Defaults to a timer thread
+        """
+        self._executor = executor
+        self._limiter = limiter
+        self._run_later = run_later or _run_later_on_timer
+        self._lock = threading.Lock()
+        self._queue: List[Tuple[Any, int, futures.Future, Callable, tuple, Optional[Callable], int]] = []
+        self._submission_order = itertools.count()
+
+    def submit(self, fn: Callable, *args, priority: Any = 0, then: Optional[Callable] = None) -> futures.Future:
+        """
+        :param priority: Any comparable value. Tasks with a lower priority are dispatched first
+        :param then: Applied to the result of `fn`, on the same worker. Not part of the latency seen by the limiter
+        """
+        future = futures.Future()
+        self._enqueue(priority, future, fn, args, then, attempt=1)
+        return future
+
+    def _enqueue(self, priority: Any, future: futures.Future, fn: Callable, args: tuple, then: Optional[Callable],
+                 attempt: int):
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._submission_order), future, fn, args, then, attempt))
+        self._dispatch()
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if not self._queue or not self._limiter.try_acquire():
+                    return
+                priority, _order, future, fn, args, then, attempt = heapq.heappop(self._queue)
+            self._executor.submit(self._run, priority, future, fn, args, then, attempt)
+
+    def _run(self, priority: Any, future: futures.Future, fn: Callable, args: tuple, then: Optional[Callable],
+             attempt: int):
+        try:
+            # Already running when retried
+            if attempt == 1 and not future.set_running_or_notify_cancel():
+                return
+            start = time.monotonic()
+            try:
+                result = fn(*args)
+            except self.THROTTLING_ERRORS as error:
+                self._limiter.on_throttled()
+                if isinstance(error, ApiThrottled) and attempt < self.MAX_THROTTLED_ATTEMPTS:
+                    delay = error.retry_after
+                    if delay is None:
+                        delay = self.THROTTLED_BACKOFF_IN_SECONDS * 2 ** (attempt - 1)
+                    self._run_later(delay, lambda: self._enqueue(priority, future, fn, args, then, attempt + 1))
+                else:
+                    future.set_exception(error)
+            except Exception as error:
+                future.set_exception(error)
+            else:
+                self._limiter.on_success(time.monotonic() - start)
+                try:
+                    future.set_result(then(result) if then else result)
+                except Exception as error:
+                    future.set_exception(error)
+        finally:
+            self._limiter.release()
+            self._dispatch()
+
+
+def _run_later_on_timer(delay: float, fn: Callable) -> None:
+    timer = threading.Timer(delay, fn)
+    # Never keeps the process alive: whoever waits on the task does
+    timer.daemon = True
+    timer.start()
@@ -1,4 +1,5 @@
-from typing import List
+from pathlib import Path
+from typing import List, Optional
 
 from kata.domain.models import KataLanguage, KataTemplate
 
@@ -24,6 +25,13 @@ class KataTemplateNotFound(KataError):
         self.available_templates = available_templates
 
 
+class KataManifestInTheWay(KataError):
+    def __init__(self, file_path: Path):
+        super().__init__(f"The template has its own '{file_path.as_posix()}', where the manifest of the kata goes. "
+                         f"Not overwriting it")
+        self.file_path = file_path
+
+
 class InvalidConfig(KataError):
     pass
 
@@ -40,3 +48,56 @@ class ApiLimitReached(ApiError):
 class InvalidAuthToken(ApiError):
     def __init__(self, token):
         super().__init__(f"The token used for authentication is invalid | Token: '{token}'")
+
+
+class ApiThrottled(ApiError):
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        """
+        :param retry_after: In seconds, as asked by the Api. None if it didn't tell
+        """
+        super().__init__(f"Api is throttling requests | Status: {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ApiNotFound(ApiError):
+    def __init__(self, url: str):
+        super().__init__(f"Not found | Url: '{url}'")
+        self.url = url
+
+
+class RangeNotSatisfiable(ApiError):
+    def __init__(self, url: str):
+        super().__init__(f"Requested range starts past the end of the file | Url: '{url}'")
+        self.url = url
+
+
+class IncompleteDownload(ApiError):
+    def __init__(self, url: str, downloaded_size: int, size: int):
+        super().__init__(f"Download still incomplete after retrying, run again to resume it "
+                         f"| Downloaded: {downloaded_size}/{size} bytes | Url: '{url}'")
+        self.url = url
+        self.downloaded_size = downloaded_size
+        self.size = size
+
+
+class IntegrityError(ApiError):
+    def __init__(self, url: str, expected_sha: str, actual_sha: str):
+        super().__init__(f"Downloaded file doesn't match its listed git blob sha, even after retrying "
+                         f"| Expected: {expected_sha} | Actual: {actual_sha} | Url: '{url}'")
+        self.url = url
+        self.expected_sha = expected_sha
+        self.actual_sha = actual_sha
+
+
+class GitError(KataError):
+    def __init__(self, command: List[str], stderr: str):
+        super().__init__(f"Git command failed | Command: '{' '.join(command)}' | Error: {stderr.strip()}")
+        self.command = command
+        self.stderr = stderr
+
+
+class CassetteMiss(KataError):
+    def __init__(self, url: str):
+        super().__init__(f"No recorded response in the cassette | Url: '{url}'")
+        self.url = url
@@ -0,0 +1,117 @@
+"""
+Compact representation of the files of a whole repo, in place of a flat list of `DownloadableFile`
+
+Files are stored in a trie of nested dicts, one per directory, keyed by interned path segments: a directory name
+is stored once however many files it contains. A file is only an int when its download url is the url prefix of
+the tree followed by its path in the repo, which is the case of raw Github urls and git blob urls: the index of its
+size and raw sha in a single bytearray packing those of all such files of the directory.
+"""
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, Union, Tuple, Optional
+
+from kata.domain.models import DownloadableFile
+
+# A file: the index of its packed size and sha, or its size, full download url when it doesn't follow the url prefix
+# of the tree, and sha
+_File = Union[int, Tuple[int, Optional[str], Optional[bytes]]]
+_Dir = Dict[str, Union['_Dir', _File, bytearray]]
+
+# Key of the packed sizes and shas of the files of a directory: never a file name
+_PACKED_FILES = '/'
+_SHA_SIZE = 20
+_PACKED_FILE = struct.Struct(f'<Q{_SHA_SIZE}s')
+# Packed in place of the sha when it isn't known
+_NO_SHA = bytes(_SHA_SIZE)
+
+
+class FileTree:
+    """
+    Iteration is lazy: `DownloadableFile`s are only created while iterating, with paths relative to the root.
+    Re-rooting on a sub path (`subtree`) shares the nodes instead of copying them.
+    """
+
+    def __init__(self, url_prefix: Optional[str] = None, _root: Optional[_Dir] = None, _root_path: str = ''):
+        """
+        :param url_prefix: Guessed from the first file added when not given
+        """
+        self._url_prefix = url_prefix
+        self._root: _Dir = {} if _root is None else _root
+        # Path of the root in the repo, with a trailing '/', or '' at the root of the repo
+        self._root_path = _root_path
+
+    def add(self, path: str, download_url: str, size: int = 0, sha: Optional[str] = None) -> None:
+        """
+        :param path: Path in the repo, with '/' separators. Relative to the root of the tree
+        :param sha: Git blob sha, in hex
+        """
+        *dir_names, file_name = path.split('/')
+        node = self._root
+        for dir_name in dir_names:
+            node = node.setdefault(sys.intern(dir_name), {})
+
+        path_in_repo = self._root_path + path
+        if self._url_prefix is None and download_url.endswith(path_in_repo):
+            self._url_prefix = download_url[:len(download_url) - len(path_in_repo)]
+        follows_prefix = self._url_prefix is not None and download_url == self._url_prefix + path_in_repo
+        if follows_prefix and (not sha or len(sha) == 2 * _SHA_SIZE):
+            packed_files = node.setdefault(_PACKED_FILES, bytearray())
+            node[sys.intern(file_name)] = len(packed_files) // _PACKED_FILE.size
+            packed_files += _PACKED_FILE.pack(size, bytes.fromhex(sha) if sha else _NO_SHA)
+        else:
+            node[sys.intern(file_name)] = (size, None if follows_prefix else download_url,
+                                           bytes.fromhex(sha) if sha else None)
+
+    def subtree(self, path: str) -> 'FileTree':
+        """
+        :param path: Path of a directory, with '/' separators. The tree is empty if it doesn't exist
+        """
+        sub_path = path.strip('/')
+        if not sub_path:
+            return self
+        node = self._root
+        for dir_name in sub_path.split('/'):
+            node = node.get(dir_name)
+            if not isinstance(node, dict):
+                return FileTree(self._url_prefix)
+        return FileTree(self._url_prefix, _root=node, _root_path=f'{self._root_path}{sub_path}/')
+
+    def __iter__(self) -> Iterator[DownloadableFile]:
+        """
+        Depth first, in the order files were added
+        """
+        url_prefix = self._url_prefix or ''
+        stack = [('', self._root)]
+        while stack:
+            dir_path, node = stack.pop()
+            sub_dirs = []
+            for name, entry in node.items():
+                if name == _PACKED_FILES:
+                    continue
+                if isinstance(entry, dict):
+                    sub_dirs.append((f'{dir_path}{name}/', entry))
+                    continue
+                prefixed_url = f'{url_prefix}{self._root_path}{dir_path}{name}'
+                if isinstance(entry, int):
+                    size, sha = _PACKED_FILE.unpack_from(node[_PACKED_FILES], entry * _PACKED_FILE.size)
+                    yield DownloadableFile(file_path=Path(dir_path + name), download_url=prefixed_url, size=size,
+                                           sha=sha.hex() if sha != _NO_SHA else None)
+                else:
+                    size, download_url, sha = entry
+                    yield DownloadableFile(file_path=Path(dir_path + name),
+                                           download_url=download_url or prefixed_url,
+                                           size=size,
+                                           sha=sha.hex() if sha else None)
+            stack.extend(reversed(sub_dirs))
+
+    def __len__(self) -> int:
+        count = 0
+        stack = [self._root]
+        while stack:
+            for name, entry in stack.pop().items():
+                if isinstance(entry, dict):
+                    stack.append(entry)
+                elif name != _PACKED_FILES:
+                    count += 1
+        return count
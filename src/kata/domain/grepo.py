@@ -1,99 +1,284 @@
+import itertools
 from concurrent import futures
 from pathlib import Path
-from typing import NamedTuple, List
+from typing import NamedTuple, Optional, Dict, Iterable, Union
 
-from kata.data.io.file import FileWriter
+from kata.data.io.file import FileWriter, GitBlobHash
+from kata.data.io.git import PartialClone, GitCli
 from kata.data.io.network import GithubApi
+from kata.domain.concurrency import AimdLimiter, LimitedScheduler
+from kata.domain.file_tree import FileTree
 from kata.domain.models import DownloadableFile
-
-
-class _DownloadedFile(NamedTuple):
-    file_path: Path
-    file_text_contents: str
+from kata.domain.path_filter import PathFilter
 
 
 class GRepo:
+    """
+    Listings are scheduled first: they are on the critical path as they unlock more work.
+    Then small files, then large files biggest first, so the longest downloads don't end up last.
+    """
 
-    def __init__(self, api: GithubApi, file_writer: FileWriter(), executor: futures.Executor):
+    LISTING_PRIORITY = (0, 0)
+    SMALL_FILE_PRIORITY = (1, 0)
+    SMALL_FILE_MAX_SIZE = 64 * 1024
+    # Larger files are streamed to disk, and resumed when interrupted
+    RESUMABLE_MIN_SIZE = 1024 * 1024
+    # Files are only taken from the listing as downloads complete: priorities apply within this many files
+    MAX_QUEUED_DOWNLOADS = 1024
+
+    def __init__(self,
+                 api: GithubApi,
+                 file_writer: FileWriter(),
+                 executor: futures.Executor,
+                 limiter: Optional[AimdLimiter] = None):
+        """
+        :param limiter: Limits the number of concurrent requests. Should not exceed the number of executor workers
+        """
         self._api = api
-        self._executor = executor
         self._file_writer = file_writer
+        self._limiter = limiter or AimdLimiter()
+        self._scheduler = LimitedScheduler(executor, self._limiter)
+        self._listing_requests = 0
+        self._download_requests = 0
+        self._skipped_listing_requests = 0
+        self._skipped_download_requests = 0
+        self._skipped_download_bytes = 0
+        self._already_complete_files = 0
 
-    def get_files_to_download(self, user, repo, path):
+    def get_files_to_download(self, user, repo, path, path_filter: PathFilter = PathFilter()):
         """
         Explore recursively a repo and extract the file list
 
         :param user: Github Username
         :param repo: Github Repo
         :param path: Path in the Repo
+        :param path_filter: Relative to `path`. Excluded directories are never listed
         :return: Flat list of all downloadable_files recursively found along with their download URLs
         """
-        files = self._get_files_in_dir(user, repo, path)
-        downloadable_files = self._map_to_model(files)
-        downloadable_files = self._remove_nesting_if_in_sub_path(downloadable_files, path)
-        return downloadable_files
+        return list(self.get_file_tree(user, repo, path, path_filter))
+
+    def get_file_tree(self, user, repo, path, path_filter: PathFilter = PathFilter()) -> FileTree:
+        """
+        Same as `get_files_to_download`, in a compact form for whole repos
 
-    def download_files_at_location(self, root_dir: Path, files_to_download: List[DownloadableFile]) -> None:
-        if not root_dir.exists():
-            root_dir.mkdir()
+        :return: Files recursively found, relative to `path`
+        """
+        return self._get_files_in_dir(user, repo, path, path_filter).subtree(path)
+
+    def download_files_at_location(self, root_dir: Path, files_to_download: Iterable[DownloadableFile]) -> None:
+        """
+        Each file is written by the worker downloading it, and `files_to_download` is consumed as downloads complete:
+        only `MAX_QUEUED_DOWNLOADS` files are ever held in memory, however large the listing.
+        Files already at the location with their listed sha, or size when no sha is listed, are left as is: running
+        again after an interruption only downloads what is missing.
+        """
+        _create_root_dir_if_does_not_exist(root_dir)
 
-        if not root_dir.is_dir():
-            raise FileExistsError(f"Root dir '{root_dir}' is not a directory")
+        def write_to(file: DownloadableFile):
+            return lambda file_contents: self._file_writer.write_bytes_to_file_in_sub_path(root_dir, file.file_path,
+                                                                                             file_contents)
 
-        download_file_futures = []
-        for file_to_download in files_to_download:
-            download_file_futures.append(
-                self._executor.submit(self._download_file, file_to_download))
+        def download(file: DownloadableFile):
+            if file.size >= self.RESUMABLE_MIN_SIZE:
+                partial_file = self._file_writer.partial_file_in_sub_path(root_dir, file.file_path)
+                return self._scheduler.submit(self._api.download_raw_file_to, file.download_url, partial_file,
+                                              file.size, file.sha,
+                                              priority=self._download_priority(file),
+                                              then=lambda _result: partial_file.complete())
+            return self._scheduler.submit(self._api.download_raw_file, file.download_url, file.sha,
+                                          priority=self._download_priority(file),
+                                          then=write_to(file))
 
-        for download_file_future in futures.as_completed(download_file_futures):
-            downloaded_file = download_file_future.result()
-            self._file_writer.write_to_file_in_sub_path(root_dir,
-                                                        downloaded_file.file_path,
-                                                        downloaded_file.file_text_contents)
+        remaining_files = iter(files_to_download)
+        queued_downloads = set()
+        while True:
+            room = self.MAX_QUEUED_DOWNLOADS - len(queued_downloads)
+            next_files = list(itertools.islice(remaining_files, room))
+            missing_files = [file for file in next_files if not _is_already_complete(root_dir, file)]
+            self._already_complete_files += len(next_files) - len(missing_files)
+            self._download_requests += len(missing_files)
+            queued_downloads.update(download(missing_file) for missing_file in missing_files)
+            if len(next_files) < room:
+                break
+            done_downloads, queued_downloads = futures.wait(queued_downloads, return_when=futures.FIRST_COMPLETED)
+            for done_download in done_downloads:
+                done_download.result()
+
+        for download_file_future in futures.as_completed(queued_downloads):
+            download_file_future.result()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Skipped requests are those saved by the path filter. A skipped directory counts as a single listing
+        """
+        return {'listing_requests': self._listing_requests,
+                'download_requests': self._download_requests,
+                'skipped_listing_requests': self._skipped_listing_requests,
+                'skipped_download_requests': self._skipped_download_requests,
+                'skipped_download_bytes': self._skipped_download_bytes,
+                'already_complete_files': self._already_complete_files,
+                'concurrency_limit': self._limiter.limit,
+                'highest_concurrency_limit': self._limiter.highest_limit}
+
+    def _get_files_in_dir(self, user, repo, dir_path, path_filter: PathFilter):
+        """
+        Walk the tree from the calling thread: workers only perform listings and never wait on each other,
+        which lets the scheduler hold back listings without risking a deadlock.
+        """
 
-    def _get_files_in_dir(self, user, repo, dir_path):
         def filter_by_type(contents, content_type):
             return [entry for entry in contents if entry['type'] == content_type]
 
-        def get_files_in_all_sub_dirs_async():
-            sub_dir_files_futures = []
-            for sub_dir in sub_dirs:
-                sub_dir_path = f"{dir_path}/{sub_dir['name']}".lstrip('/')
-                sub_dir_files_future = self._executor.submit(self._get_files_in_dir, user, repo, sub_dir_path)
-                sub_dir_files_futures += [sub_dir_files_future]
-
-            all_sub_dir_files = []
-            for sub_dir_files_future in futures.as_completed(sub_dir_files_futures):
-                sub_dir_files = sub_dir_files_future.result()
-                all_sub_dir_files += sub_dir_files
-
-            return all_sub_dir_files
-
-        dir_contents = self._api.contents(user, repo, dir_path)
-        files = filter_by_type(dir_contents, 'file')
-        sub_dirs = filter_by_type(dir_contents, 'dir')
-        return files + get_files_in_all_sub_dirs_async()
-
-    @staticmethod
-    def _remove_nesting_if_in_sub_path(files: List[DownloadableFile], sub_path: str):
-        if not sub_path:
-            return files
-
-        def files_with_sub_path_at_root():
-            for file in files:
-                yield DownloadableFile(file_path=file.file_path.relative_to(sub_path),
-                                       download_url=file.download_url)
-
-        return list(files_with_sub_path_at_root())
-
-    @staticmethod
-    def _map_to_model(contents):
-        return [
-            DownloadableFile(
-                file_path=Path(file['path']),
-                download_url=file['download_url']
-            ) for file in contents]
-
-    def _download_file(self, file: DownloadableFile):
-        file_contents = self._api.download_raw_text_file(file.download_url)
-        return _DownloadedFile(file_path=file.file_path, file_text_contents=file_contents)
+        def relative_to_dir_path(entry):
+            return entry['path'][len(dir_path):].lstrip('/')
+
+        def accepted(file):
+            if path_filter.accepts_file(relative_to_dir_path(file)):
+                return True
+            self._skipped_download_requests += 1
+            self._skipped_download_bytes += file.get('size', 0)
+            return False
+
+        def excluded(sub_dir):
+            if path_filter.excludes_dir(relative_to_dir_path(sub_dir)):
+                self._skipped_listing_requests += 1
+                return True
+            return False
+
+        def list_dir_async(path):
+            self._listing_requests += 1
+            listing = self._scheduler.submit(self._api.contents, user, repo, path, priority=self.LISTING_PRIORITY)
+            pending_listings[listing] = path
+
+        all_files = FileTree()
+        pending_listings: Dict[futures.Future, str] = {}
+        list_dir_async(dir_path)
+        while pending_listings:
+            done_listings, _ = futures.wait(pending_listings, return_when=futures.FIRST_COMPLETED)
+            for done_listing in done_listings:
+                listed_dir_path = pending_listings.pop(done_listing)
+                dir_contents = done_listing.result()
+                for file in filter(accepted, filter_by_type(dir_contents, 'file')):
+                    all_files.add(file['path'], file['download_url'], file.get('size', 0), file.get('sha'))
+                for sub_dir in filter_by_type(dir_contents, 'dir'):
+                    if not excluded(sub_dir):
+                        list_dir_async(f"{listed_dir_path}/{sub_dir['name']}".lstrip('/'))
+
+        return all_files
+
+    @classmethod
+    def _download_priority(cls, file: DownloadableFile):
+        if file.size <= cls.SMALL_FILE_MAX_SIZE:
+            return cls.SMALL_FILE_PRIORITY
+        return 2, -file.size
+
+
+class _GitBlobUrl(NamedTuple):
+    """
+    'download_url' of the files found by the `GitGRepo`: 'git://<user>/<repo>/<commit>/<path in repo>'
+    """
+    user: str
+    repo: str
+    commit: str
+    path: str
+
+    PREFIX = 'git://'
+
+    def __str__(self):
+        return f'{self.PREFIX}{self.user}/{self.repo}/{self.commit}/{self.path}'
+
+    @classmethod
+    def parse(cls, url: str) -> '_GitBlobUrl':
+        return cls(*url[len(cls.PREFIX):].split('/', 3))
+
+
+class GitGRepo:
+    """
+    Same as `GRepo`, backed by local partial clones instead of the Github Api
+
+    Listing a template is a local `git ls-tree`, and only the files of the template are ever downloaded.
+    """
+
+    def __init__(self, partial_clone: PartialClone, git: GitCli, file_writer: FileWriter):
+        self._partial_clone = partial_clone
+        self._git = git
+        self._file_writer = file_writer
+        self._skipped_files = 0
+        self._already_complete_files = 0
+
+    def get_files_to_download(self, user, repo, path, path_filter: PathFilter = PathFilter()):
+        """
+        :return: Flat list of all files recursively found in `path` of the latest commit of the repo
+        """
+        return list(self.get_file_tree(user, repo, path, path_filter))
+
+    def get_file_tree(self, user, repo, path, path_filter: PathFilter = PathFilter()) -> FileTree:
+        """
+        :param path_filter: Relative to `path`. Listing is local: only the downloads of excluded files are saved
+        """
+        commit = self._partial_clone.latest_commit(user, repo)
+        files = FileTree(url_prefix=str(_GitBlobUrl(user, repo, commit, '')))
+        for git_file in self._partial_clone.list_files(user, repo, commit, path):
+            if not path_filter.accepts_file(git_file.path[len(path):].lstrip('/')):
+                self._skipped_files += 1
+                continue
+            files.add(git_file.path, str(_GitBlobUrl(user, repo, commit, git_file.path)), sha=git_file.sha)
+        return files.subtree(path)
+
+    def download_files_at_location(self, root_dir: Path, files_to_download: Iterable[DownloadableFile]) -> None:
+        """
+        Files already at the location with their sha are left as is
+        """
+        _create_root_dir_if_does_not_exist(root_dir)
+
+        def missing(file: DownloadableFile):
+            if _is_already_complete(root_dir, file):
+                self._already_complete_files += 1
+                return False
+            return True
+
+        def checkout(file: DownloadableFile):
+            blob_url = _GitBlobUrl.parse(file.download_url)
+            return blob_url.user, blob_url.repo, blob_url.commit
+
+        missing_files = sorted(filter(missing, files_to_download), key=checkout)
+        for (user, repo, commit), files in itertools.groupby(missing_files, key=checkout):
+            files = list(files)
+            paths_in_repo = [_GitBlobUrl.parse(file.download_url).path for file in files]
+            with self._partial_clone.checked_out(user, repo, commit, paths_in_repo) as checkout_dir:
+                for file, path_in_repo in zip(files, paths_in_repo):
+                    self._file_writer.copy_file_to_sub_path(root_dir, file.file_path, checkout_dir / path_in_repo)
+
+    def stats(self) -> Dict[str, int]:
+        return {'git_commands': self._git.commands_run,
+                'skipped_files': self._skipped_files,
+                'already_complete_files': self._already_complete_files}
+
+
+# Interchangeable: both list and download templates through the same interface
+AnyGRepo = Union[GRepo, GitGRepo]
+
+
+def _create_root_dir_if_does_not_exist(root_dir: Path):
+    if not root_dir.exists():
+        root_dir.mkdir()
+
+    if not root_dir.is_dir():
+        raise FileExistsError(f"Root dir '{root_dir}' is not a directory")
+
+
+def _is_already_complete(root_dir: Path, file: DownloadableFile) -> bool:
+    """
+    A local file can be trusted when its git blob sha matches. Without a sha, only files of known size can be told
+    complete, by their size alone. Missing as well when one of its parents is now a file
+    """
+    local_file = root_dir / file.file_path
+    try:
+        local_size = local_file.stat().st_size
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+    if file.size and local_size != file.size:
+        return False
+    if file.sha:
+        return GitBlobHash.of_file(local_file) == file.sha
+    return bool(file.size)
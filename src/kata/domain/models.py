@@ -1,5 +1,7 @@
 from pathlib import Path
-from typing import NamedTuple, Optional
+from typing import NamedTuple, Optional, List
+
+from kata.domain.path_filter import PathFilter
 
 
 # All domain models are expected to be VALID
@@ -9,14 +11,53 @@ from typing import NamedTuple, Optional
 
 
 class DownloadableFile(NamedTuple):
+    """
+    `sha` is the git blob sha of the file's contents, when listed
+    """
     file_path: Path
     download_url: str
+    size: int = 0
+    sha: Optional[str] = None
 
 
 class KataLanguage(NamedTuple):
     name: str
 
 
+class KataGRepoSource(NamedTuple):
+    """
+    Github repo the templates are taken from. Higher priority sources win when they share a template
+    """
+    name: str
+    user: str
+    repo: str
+    priority: int = 0
+
+
 class KataTemplate(NamedTuple):
     language: KataLanguage
     template_name: Optional[str]
+    source: Optional[KataGRepoSource] = None
+
+
+class KataManifest(NamedTuple):
+    """
+    Where the files of a kata come from, recorded in the kata by `init`
+    """
+    user: str
+    repo: str
+    path: str
+    path_filter: PathFilter
+    files: List[DownloadableFile]
+
+
+class KataStatus(NamedTuple):
+    """
+    Files of the template, compared with those in the kata. Files added to the kata aren't part of it
+    """
+    kata_dir: Path
+    modified: List[Path]
+    missing: List[Path]
+    unchanged: List[Path]
+    # Not initialized by 'kata init': its template, and so how it differs from it, can't be told
+    unknown: bool = False
@@ -0,0 +1,51 @@
+"""
+Include / exclude glob rules on the files of a template
+
+Patterns are relative to the root of the template. A pattern without '/' matches a file or directory name at any
+depth, eg. '.idea' or '*.png'. Otherwise it matches the whole path, with '**' spanning directories, eg. 'docs/**'.
+A pattern matching a directory matches everything in it, and 'docs/**' matches the 'docs' directory itself.
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple, Tuple, Pattern
+
+
+class PathFilter(NamedTuple):
+    include: Tuple[str, ...] = ()
+    exclude: Tuple[str, ...] = ()
+
+    def excludes_dir(self, dir_path: str) -> bool:
+        """
+        Excluded directories don't need to be explored at all
+
+        :param dir_path: Relative to the root of the template, with '/' separators
+        """
+        return _matches_any(self.exclude, dir_path)
+
+    def accepts_file(self, file_path: str) -> bool:
+        """
+        :param file_path: Relative to the root of the template, with '/' separators
+        """
+        if _matches_any(self.exclude, file_path):
+            return False
+        return not self.include or _matches_any(self.include, file_path)
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+
+def _matches_any(patterns: Tuple[str, ...], path: str) -> bool:
+    return any(_compiled(pattern).match(path) for pattern in patterns)
+
+
+@lru_cache(maxsize=None)
+def _compiled(pattern: str) -> Pattern:
+    pattern = pattern.strip('/')
+    regex = '' if '/' in pattern else '(?:.*/)?'
+    if pattern.endswith('/**'):
+        # Matches everything in the directory, which matching the directory already does
+        pattern = pattern[:-len('/**')]
+    for token in re.split(r'(\*\*/|\*\*|\*|\?)', pattern):
+        regex += {'**/': '(?:.*/)?', '**': '.*', '*': '[^/]*', '?': '[^/]'}.get(token, re.escape(token))
+    # Also matches everything in a matching directory
+    return re.compile(regex + '(?:/.*)?$')
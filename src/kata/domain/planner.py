@@ -0,0 +1,313 @@
+"""
+Cost-based choice of how to fetch a template
+
+Each strategy gets an estimate of the Api calls, bytes and wall time it needs, from the shape of the template
+seen on previous runs. The cheapest one within the remaining rate limit wins: its cost is its wall time, plus
+the rate limit it spends.
+Wall time estimates are calibrated by how long each strategy actually took on previous runs. A strategy never
+timed before is tried once it is close enough to the best one, so that it gets calibrated too.
+"""
+import math
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, List, Optional, Dict, Callable, Iterable
+
+from kata.data.io.file import FileReader, FileWriter
+from kata.domain.file_tree import FileTree
+from kata.domain.grepo import AnyGRepo
+from kata.domain.models import DownloadableFile
+from kata.domain.path_filter import PathFilter
+
+CONTENTS = 'contents'
+PARTIAL_CLONE = 'partial_clone'
+CACHED_CLONE = 'cached_clone'
+
+
+class TemplateShape(NamedTuple):
+    files: int
+    dirs: int
+    depth: int
+    total_size: int
+
+    @classmethod
+    def of(cls, files: Iterable[DownloadableFile]) -> 'TemplateShape':
+        """
+        :param files: Paths relative to the root of the template. Iterated once
+        """
+        file_count = total_size = 0
+        dirs = set()
+        for file in files:
+            file_count += 1
+            total_size += file.size
+            dirs.update(parent for parent in file.file_path.parents if parent != Path('.'))
+        return cls(files=file_count,
+                   dirs=len(dirs),
+                   depth=max((len(directory.parts) for directory in dirs), default=0),
+                   total_size=total_size)
+
+
+# Used for templates never fetched before
+TYPICAL_TEMPLATE = TemplateShape(files=20, dirs=4, depth=2, total_size=64 * 1024)
+
+
+class StrategyEstimate(NamedTuple):
+    strategy: str
+    api_calls: int
+    requests: int
+    bytes: int
+    wall_time: float
+    # Ratio between the actual and estimated wall time on previous runs. Already applied to `wall_time`
+    calibration: float
+    within_rate_limit: bool
+    # In seconds: `wall_time`, plus the Api calls spent
+    cost: float = 0.0
+
+
+class Plan(NamedTuple):
+    shape: TemplateShape
+    shape_is_guessed: bool
+    # Chosen first, then best first
+    estimates: List[StrategyEstimate]
+    # The chosen strategy is not the best one, but was never timed before
+    exploring: bool = False
+
+    @property
+    def chosen(self) -> StrategyEstimate:
+        return self.estimates[0]
+
+
+class PlannerStats:
+    """
+    Shapes of the templates fetched, and calibration of each strategy, persisted between runs
+    """
+
+    MAX_CALIBRATION_SAMPLES = 20
+
+    def __init__(self, stats_file: Optional[Path], file_reader: FileReader, file_writer: FileWriter):
+        self._stats_file = stats_file
+        self._file_writer = file_writer
+        self._lock = threading.Lock()
+        self._stats = {'shapes': {}, 'calibrations': {}}
+        if stats_file and stats_file.exists():
+            self._stats = file_reader.read_json(stats_file)
+
+    def shape_of(self, template_key: str) -> Optional[TemplateShape]:
+        with self._lock:
+            shape = self._stats['shapes'].get(template_key)
+        return TemplateShape(*shape) if shape else None
+
+    def record_shape(self, template_key: str, shape: TemplateShape) -> None:
+        """
+        Sizes are unknown to some strategies: a size of 0 doesn't override a known one
+        """
+        known_shape = self.shape_of(template_key)
+        if known_shape and not shape.total_size:
+            shape = shape._replace(total_size=known_shape.total_size)
+        with self._lock:
+            self._stats['shapes'][template_key] = list(shape)
+
+    def is_calibrated(self, strategy: str) -> bool:
+        with self._lock:
+            return bool(self._stats['calibrations'].get(strategy))
+
+    def calibration(self, strategy: str) -> float:
+        with self._lock:
+            ratios = sorted(self._stats['calibrations'].get(strategy, []))
+        return ratios[len(ratios) // 2] if ratios else 1.0
+
+    def record_run(self, strategy: str, estimated_wall_time: float, actual_wall_time: float) -> None:
+        """
+        :param estimated_wall_time: Before calibration
+        """
+        if estimated_wall_time <= 0:
+            return
+        with self._lock:
+            ratios = self._stats['calibrations'].setdefault(strategy, [])
+            ratios.append(actual_wall_time / estimated_wall_time)
+            del ratios[:-self.MAX_CALIBRATION_SAMPLES]
+
+    def save(self) -> None:
+        if not self._stats_file:
+            return
+        with self._lock:
+            stats = {'shapes': dict(self._stats['shapes']),
+                     'calibrations': {strategy: list(ratios)
+                                      for strategy, ratios in self._stats['calibrations'].items()}}
+        self._file_writer.write_json_to_file(self._stats_file, stats)
+
+
+class StrategyPlanner:
+    """
+    The cost model is deliberately simple: round trips and transfer time. Calibration absorbs the rest.
+    """
+
+    # Used until latencies were measured
+    ROUND_TRIP_TIME = 0.15
+    # Github allows 5000 calls per hour: each call is worth the time it takes to be allowed another one
+    API_CALL_COST = 3600 / 5000
+    # An uncalibrated strategy costing up to this much more than the best one is tried instead
+    EXPLORATION_MAX_COST_RATIO = 2.0
+    BANDWIDTH = 2 * 1024 * 1024
+    # Size of each entry of a listing returned by the contents Api
+    LISTING_ENTRY_SIZE = 1024
+    GIT_CLONE_ROUND_TRIPS = 6
+    GIT_FETCH_ROUND_TRIPS = 3
+    GIT_COMMANDS = 5
+    GIT_COMMAND_OVERHEAD = 0.01
+
+    def __init__(self,
+                 stats: PlannerStats,
+                 concurrency: int,
+                 is_cloned: Optional[Callable[[str, str], bool]] = None,
+                 remaining_rate_limit: Callable[[], Optional[int]] = lambda: None,
+                 round_trip_time: Callable[[], Optional[float]] = lambda: None):
+        """
+        :param is_cloned: Only given when templates can be fetched from partial clones
+        :param round_trip_time: Measured on previous runs, in seconds. None if never measured
+        """
+        self._stats = stats
+        self._concurrency = concurrency
+        self._is_cloned = is_cloned
+        self._remaining_rate_limit = remaining_rate_limit
+        self._round_trip_time = round_trip_time
+
+    def plan(self, user: str, repo: str, path: str, path_filter: PathFilter = PathFilter()) -> Plan:
+        """
+        :param path_filter: Templates are only as large as the files kept
+        """
+        known_shape = self._stats.shape_of(template_key(user, repo, path, path_filter))
+        shape = known_shape or TYPICAL_TEMPLATE
+        round_trip_time = self._round_trip_time() or self.ROUND_TRIP_TIME
+        estimates = [self._contents(shape, round_trip_time)]
+        if self._is_cloned:
+            estimates.append(self._cached_clone(shape, round_trip_time) if self._is_cloned(user, repo)
+                             else self._partial_clone(shape, round_trip_time))
+
+        remaining_rate_limit = self._remaining_rate_limit()
+        calibrated = sorted([self._calibrated(estimate, remaining_rate_limit) for estimate in estimates],
+                            key=lambda estimate: (not estimate.within_rate_limit, estimate.cost))
+        # Calibration is only recorded for a known shape: only then is trying another strategy worth it
+        to_explore = None if known_shape is None else self._to_explore(calibrated)
+        if to_explore:
+            calibrated.remove(to_explore)
+            calibrated.insert(0, to_explore)
+        return Plan(shape=shape,
+                    shape_is_guessed=known_shape is None,
+                    estimates=calibrated,
+                    exploring=to_explore is not None)
+
+    def _to_explore(self, estimates: List[StrategyEstimate]) -> Optional[StrategyEstimate]:
+        """
+        :param estimates: Best first
+        """
+        best = estimates[0]
+        if not self._stats.is_calibrated(best.strategy):
+            # Running the best one calibrates it already
+            return None
+        for estimate in estimates[1:]:
+            if estimate.within_rate_limit and not self._stats.is_calibrated(estimate.strategy) \
+                    and estimate.cost <= best.cost * self.EXPLORATION_MAX_COST_RATIO:
+                return estimate
+        return None
+
+    def _calibrated(self, estimate: StrategyEstimate, remaining_rate_limit: Optional[int]) -> StrategyEstimate:
+        calibration = self._stats.calibration(estimate.strategy)
+        wall_time = estimate.wall_time * calibration
+        return estimate._replace(wall_time=wall_time,
+                                 calibration=calibration,
+                                 within_rate_limit=remaining_rate_limit is None
+                                                   or estimate.api_calls <= remaining_rate_limit,
+                                 cost=wall_time + estimate.api_calls * self.API_CALL_COST)
+
+    def _contents(self, shape: TemplateShape, round_trip_time: float) -> StrategyEstimate:
+        """
+        One listing per directory, sequential along the deepest path, then one raw download per file
+        """
+        listings = shape.dirs + 1
+        download_rounds = math.ceil(shape.files / self._concurrency)
+        return StrategyEstimate(strategy=CONTENTS,
+                                api_calls=listings,
+                                requests=listings + shape.files,
+                                bytes=shape.total_size + (shape.files + shape.dirs) * self.LISTING_ENTRY_SIZE,
+                                wall_time=((shape.depth + 1 + download_rounds) * round_trip_time
+                                           + shape.total_size / self.BANDWIDTH),
+                                calibration=1.0,
+                                within_rate_limit=True)
+
+    def _partial_clone(self, shape: TemplateShape, round_trip_time: float) -> StrategyEstimate:
+        return self._git(PARTIAL_CLONE, self.GIT_CLONE_ROUND_TRIPS, shape, round_trip_time)
+
+    def _cached_clone(self, shape: TemplateShape, round_trip_time: float) -> StrategyEstimate:
+        return self._git(CACHED_CLONE, self.GIT_FETCH_ROUND_TRIPS, shape, round_trip_time)
+
+    def _git(self, strategy: str, round_trips: int, shape: TemplateShape, round_trip_time: float) -> StrategyEstimate:
+        """
+        Clone (or fetch), then a single batch for all blobs of the template. The Api is never called
+        """
+        return StrategyEstimate(strategy=strategy,
+                                api_calls=0,
+                                requests=2,
+                                bytes=shape.total_size,
+                                wall_time=((round_trips + 1) * round_trip_time
+                                           + self.GIT_COMMANDS * self.GIT_COMMAND_OVERHEAD
+                                           + shape.total_size / self.BANDWIDTH),
+                                calibration=1.0,
+                                within_rate_limit=True)
+
+
+def template_key(user: str, repo: str, path: str, path_filter: PathFilter = PathFilter()) -> str:
+    """
+    Filtered templates have a shape of their own
+    """
+    key = f'{user}/{repo}/{path}'
+    if path_filter:
+        key += f"|include={','.join(path_filter.include)}|exclude={','.join(path_filter.exclude)}"
+    return key
+
+
+class PlannedGRepo:
+    """
+    Same interface as `GRepo`: each template is fetched with the strategy planned for it
+
+    Listing and downloading a template must use the same strategy: downloads follow the last listing.
+    """
+
+    def __init__(self, planner: StrategyPlanner, stats: PlannerStats, grepos: Dict[str, AnyGRepo]):
+        """
+        :param grepos: Implementation of each strategy. Only strategies present here are planned
+        """
+        self._planner = planner
+        self._stats = stats
+        self._grepos = grepos
+        self._strategy = CONTENTS
+        self._estimate: Optional[StrategyEstimate] = None
+        self._started_at = 0.0
+
+    def get_files_to_download(self, user, repo, path, path_filter: PathFilter = PathFilter()):
+        return self._list_with_planned_grepo(user, repo, path, path_filter,
+                                             lambda grepo: grepo.get_files_to_download(user, repo, path, path_filter))
+
+    def get_file_tree(self, user, repo, path, path_filter: PathFilter = PathFilter()) -> FileTree:
+        return self._list_with_planned_grepo(user, repo, path, path_filter,
+                                             lambda grepo: grepo.get_file_tree(user, repo, path, path_filter))
+
+    def download_files_at_location(self, root_dir: Path, files_to_download: Iterable[DownloadableFile]) -> None:
+        self._grepos[self._strategy].download_files_at_location(root_dir, files_to_download)
+        if self._estimate:
+            self._stats.record_run(self._strategy,
+                                   self._estimate.wall_time / self._estimate.calibration,
+                                   time.perf_counter() - self._started_at)
+
+    def stats(self) -> Dict[str, object]:
+        return {'strategy': self._strategy, **self._grepos[self._strategy].stats()}
+
+    def _list_with_planned_grepo(self, user, repo, path, path_filter: PathFilter, list_files):
+        plan = self._planner.plan(user, repo, path, path_filter)
+        self._strategy = plan.chosen.strategy
+        # Estimated from a guessed shape, the error would say nothing about the strategy itself
+        self._estimate = None if plan.shape_is_guessed else plan.chosen
+        self._started_at = time.perf_counter()
+        files = list_files(self._grepos[self._strategy])
+        self._stats.record_shape(template_key(user, repo, path, path_filter), TemplateShape.of(files))
+        return files
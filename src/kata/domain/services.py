@@ -1,32 +1,87 @@
+import itertools
 import re
+from concurrent import futures
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Tuple, Dict, Union
 
+from kata.data.io.file import git_blob_shas
+from kata.data.manifest import KataManifestRepo
 from kata.data.repos import KataTemplateRepo, KataLanguageRepo, ConfigRepo
-from kata.domain.exceptions import InvalidKataName, KataLanguageNotFound, KataTemplateNotFound
-from kata.domain.grepo import GRepo
-from kata.domain.models import KataLanguage, KataTemplate
+from kata.diagnostics import tracing
+from kata.domain.exceptions import InvalidKataName, KataLanguageNotFound, KataTemplateNotFound, KataManifestInTheWay
+from kata.domain.grepo import AnyGRepo
+from kata.domain.models import KataLanguage, KataTemplate, KataManifest, KataStatus, DownloadableFile
+from kata.domain.path_filter import PathFilter
+from kata.domain.planner import StrategyPlanner, Plan, PlannedGRepo
 
 
 class InitKataService:
-    def __init__(self, kata_language_repo: KataLanguageRepo, kata_template_repo: KataTemplateRepo, grepo: GRepo,
-                 config_repo: ConfigRepo):
+    def __init__(self, kata_language_repo: KataLanguageRepo, kata_template_repo: KataTemplateRepo,
+                 grepo: Union[AnyGRepo, PlannedGRepo], config_repo: ConfigRepo,
+                 planner: Optional[StrategyPlanner] = None,
+                 kata_manifest_repo: Optional[KataManifestRepo] = None):
+        """
+        :param planner: Only needed to plan a kata without initializing it
+        :param kata_manifest_repo: Records where the files of new katas come from, for `KataStatusService`
+        """
         self._kata_language_repo = kata_language_repo
         self._kata_template_repo = kata_template_repo
         self._config_repo = config_repo
         self._grepo = grepo
+        self._planner = planner
+        self._kata_manifest_repo = kata_manifest_repo
 
-    def init_kata(self, parent_dir: Path, kata_name: str, template_language: str, template_name: Optional[str]) -> None:
+    def init_kata(self,
+                  parent_dir: Path,
+                  kata_name: str,
+                  template_language: str,
+                  template_name: Optional[str],
+                  include: Optional[Tuple[str, ...]] = None,
+                  exclude: Optional[Tuple[str, ...]] = None) -> None:
+        """
+        Also records a manifest of the kata, in the kata: see `KataManifestRepo`. Templates with a file where the
+        manifest goes are refused, before anything is downloaded
+
+        :param include: Globs of the template files to keep. None for the default of the language in the config
+        :param exclude: Globs of the template files to skip. None for the default of the language in the config
+        """
+        with tracing.span('init_kata', kata_name=kata_name, language=template_language, template=template_name):
+            with tracing.span('validate'):
+                self._validate_parent_dir(parent_dir)
+                self._validate_kata_name(kata_name)
+
+            kata_template = self._get_kata_template(template_language, template_name)
+            path = self._build_path(kata_template)
+            user, repo = self._user_and_repo_of(kata_template)
+            path_filter = self._path_filter_of(kata_template, include, exclude)
+            with tracing.span('list', user=user, repo=repo, path=path) as list_span:
+                files_to_download = self._grepo.get_files_to_download(user=user, repo=repo, path=path,
+                                                                      path_filter=path_filter)
+                list_span.set(files=len(files_to_download))
+            if self._kata_manifest_repo:
+                self._validate_manifest_not_in_the_way(files_to_download)
+            kata_dir = parent_dir / kata_name
+            with tracing.span('download_and_write', files=len(files_to_download)):
+                self._grepo.download_files_at_location(kata_dir, files_to_download)
+            if self._kata_manifest_repo:
+                self._kata_manifest_repo.save(kata_dir, KataManifest(user, repo, path, path_filter, files_to_download))
+
+    def plan_kata(self,
+                  parent_dir: Path,
+                  kata_name: str,
+                  template_language: str,
+                  template_name: Optional[str],
+                  include: Optional[Tuple[str, ...]] = None,
+                  exclude: Optional[Tuple[str, ...]] = None) -> Plan:
+        """
+        :return: How `init_kata` would fetch the template. Nothing is downloaded or written
+        """
         self._validate_parent_dir(parent_dir)
         self._validate_kata_name(kata_name)
-
         kata_template = self._get_kata_template(template_language, template_name)
-        path = self._build_path(kata_template)
-        files_to_download = self._grepo.get_files_to_download(user=self._config_repo.get_kata_grepo_username(),
-                                                              repo=self._config_repo.get_kata_grepo_reponame(),
-                                                              path=path)
-        kata_dir = parent_dir / kata_name
-        self._grepo.download_files_at_location(kata_dir, files_to_download)
+        user, repo = self._user_and_repo_of(kata_template)
+        return self._planner.plan(user, repo, self._build_path(kata_template),
+                                  self._path_filter_of(kata_template, include, exclude))
 
     def list_available_languages(self) -> List[KataLanguage]:
         return self._kata_language_repo.get_all()
@@ -40,6 +95,11 @@ class InitKataService:
         if not parent_dir.exists():
             raise FileNotFoundError(f"Invalid Directory: '{parent_dir.absolute()}'")
 
+    def _validate_manifest_not_in_the_way(self, files_to_download: List[DownloadableFile]):
+        file_in_the_way = self._kata_manifest_repo.in_the_way(files_to_download)
+        if file_in_the_way:
+            raise KataManifestInTheWay(file_in_the_way.file_path)
+
     @staticmethod
     def _validate_kata_name(kata_name):
         def has_spaces():
@@ -54,26 +114,55 @@ class InitKataService:
             raise InvalidKataName(kata_name)
 
     def _get_kata_template(self, template_language: str, template_name: str):
+        """
+        :param template_name: Either 'template' or 'source:template' to only consider one source.
+                              Without a source, the highest-priority source having the template wins.
+        """
+
+        def split_source_name():
+            if template_name and ':' in template_name:
+                return template_name.split(':', 1)
+            return None, template_name
+
+        def from_requested_source(template: KataTemplate):
+            return source_name is None or (template.source is not None and template.source.name == source_name)
 
         def only_one_available_for_language():
-            return len(templates_for_language) == 1
+            # Same template in multiple sources still counts as one: the highest-priority one is used
+            return len({template.template_name for template in templates_for_language}) == 1
 
         def first():
             return templates_for_language[0]
 
         def first_found_or_raise_template_not_found():
             for template in templates_for_language:
-                if template.template_name == template_name:
+                if template.template_name == name:
                     return template
 
             raise KataTemplateNotFound(templates_for_language)
 
-        kata_language = self._get_kata_language_or_raise(template_language)
-        templates_for_language = self._kata_template_repo.get_for_language(kata_language)
+        source_name, name = split_source_name()
+        with tracing.span('resolve_language'):
+            kata_language = self._get_kata_language_or_raise(template_language)
+        with tracing.span('resolve_template'):
+            templates_for_language = [template
+                                      for template in self._kata_template_repo.get_for_language(kata_language)
+                                      if from_requested_source(template)]
+
+            if not name and only_one_available_for_language():
+                return first()
+            return first_found_or_raise_template_not_found()
+
+    def _user_and_repo_of(self, kata_template: KataTemplate):
+        if kata_template.source is None:
+            return self._config_repo.get_kata_grepo_username(), self._config_repo.get_kata_grepo_reponame()
+        return kata_template.source.user, kata_template.source.repo
 
-        if not template_name and only_one_available_for_language():
-            return first()
-        return first_found_or_raise_template_not_found()
+    def _path_filter_of(self, kata_template: KataTemplate, include: Optional[Tuple[str, ...]],
+                        exclude: Optional[Tuple[str, ...]]) -> PathFilter:
+        default_filter = self._config_repo.get_path_filter(kata_template.language)
+        return PathFilter(include=default_filter.include if include is None else include,
+                          exclude=default_filter.exclude if exclude is None else exclude)
 
     def _get_kata_language_or_raise(self, language_name):
         res = self._kata_language_repo.get(language_name)
@@ -90,12 +179,105 @@ class InitKataService:
         return path
 
 
+class KataStatusService:
+    """
+    Compare katas with their template, without downloading anything
+
+    Local files are compared with the git blob sha listed for them. Files listed without a sha are compared by
+    size only. Hashing is CPU and IO bound: for large katas, or many at once, chunks of files are hashed in parallel
+    by the executor, meant to be a process pool.
+    """
+
+    HASHING_CHUNK_SIZE = 32
+    # Below this, hashing in process is faster than handing files over to the executor
+    PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, kata_manifest_repo: KataManifestRepo, executor: Optional[futures.Executor] = None,
+                 grepo: Optional[Union[AnyGRepo, PlannedGRepo]] = None):
+        """
+        :param grepo: To compare with a fresh listing of each template. Otherwise with the one recorded by `init`
+        """
+        self._kata_manifest_repo = kata_manifest_repo
+        self._executor = executor
+        self._grepo = grepo
+
+    def status(self, kata_dirs: List[Path]) -> List[KataStatus]:
+        """
+        Katas not initialized by `InitKataService` are reported as unknown, along with the others
+        """
+        all_template_files = {kata_dir: self._template_files(kata_dir) for kata_dir in kata_dirs}
+        template_files = {kata_dir: files for kata_dir, files in all_template_files.items() if files is not None}
+        local_sizes = {kata_dir / file.file_path: _size_of(kata_dir / file.file_path)
+                       for kata_dir, files in template_files.items() for file in files}
+
+        def same_size(kata_dir: Path, file: DownloadableFile):
+            local_size = local_sizes[kata_dir / file.file_path]
+            return local_size is not None and (not file.size or local_size == file.size)
+
+        to_hash = [kata_dir / file.file_path
+                   for kata_dir, files in template_files.items() for file in files
+                   if file.sha and same_size(kata_dir, file)]
+        local_shas = self._git_blob_shas(to_hash, sum(local_sizes[file_path] for file_path in to_hash))
+
+        def unchanged(kata_dir: Path, file: DownloadableFile):
+            if not file.sha:
+                return same_size(kata_dir, file)
+            return local_shas.get(kata_dir / file.file_path) == file.sha
+
+        statuses = []
+        for kata_dir, files in all_template_files.items():
+            if files is None:
+                statuses.append(KataStatus(kata_dir, modified=[], missing=[], unchanged=[], unknown=True))
+                continue
+            status = KataStatus(kata_dir, modified=[], missing=[], unchanged=[])
+            for file in files:
+                if local_sizes[kata_dir / file.file_path] is None:
+                    status.missing.append(file.file_path)
+                elif unchanged(kata_dir, file):
+                    status.unchanged.append(file.file_path)
+                else:
+                    status.modified.append(file.file_path)
+            statuses.append(status)
+        return statuses
+
+    def _template_files(self, kata_dir: Path) -> Optional[List[DownloadableFile]]:
+        """
+        :return: None if the kata has no manifest
+        """
+        manifest = self._kata_manifest_repo.get(kata_dir)
+        if manifest is None:
+            return None
+        if not self._grepo:
+            return manifest.files
+        return self._grepo.get_files_to_download(user=manifest.user, repo=manifest.repo, path=manifest.path,
+                                                 path_filter=manifest.path_filter)
+
+    def _git_blob_shas(self, file_paths: List[Path], total_size: int) -> Dict[Path, Optional[str]]:
+        chunks = [file_paths[start:start + self.HASHING_CHUNK_SIZE]
+                  for start in range(0, len(file_paths), self.HASHING_CHUNK_SIZE)]
+        if self._executor and total_size >= self.PARALLEL_MIN_BYTES:
+            hashed_chunks = self._executor.map(git_blob_shas, chunks)
+        else:
+            hashed_chunks = map(git_blob_shas, chunks)
+        return dict(zip(file_paths, itertools.chain.from_iterable(hashed_chunks)))
+
+
+def _size_of(file_path: Path) -> Optional[int]:
+    """
+    :return: None if missing, including when one of its parents is now a file
+    """
+    try:
+        return file_path.stat().st_size
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
 class LoginService:
     def __init__(self, config_repo: ConfigRepo):
         self._config_repo = config_repo
 
     def is_logged_in(self) -> bool:
-        return self._config_repo.get_auth_token() is not None
+        return len(self._config_repo.get_auth_tokens()) > 0
 
     def should_skip_not_logged_in_warning(self):
         return self._config_repo.should_skip_not_logged_in_warning()
@@ -1,48 +1,190 @@
+import functools
+import os
+import time
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pprint import pprint
 from textwrap import dedent
-from typing import List
+from typing import Optional, TYPE_CHECKING
 
 import click
 
-from kata.data.io.file import FileWriter, FileReader
+from kata import defaults
+from kata.bench.shapes import SHAPES, DEFAULT_SHAPES
+from kata.data.catalog import CatalogSnapshot
+from kata.data.manifest import KataManifestRepo
+from kata.data.io.coordination import SharedRateLimitBudget, SingleFlight
+from kata.data.io.file import FileWriter, FileReader, ConfigCache
+from kata.data.io.git import GitCli, PartialClone
+from kata.data.io.hedging import LatencyStats, HedgedRequests
 from kata.data.io.network import GithubApi
+from kata.data.io.transport import RecordingTransport, ReplayTransport
+from kata.data.io.watchdog import RequestWatchdog, read_in_flight_requests
 from kata.data.repos import KataTemplateRepo, KataLanguageRepo, ConfigRepo
+from kata.diagnostics import tracing, metrics
+from kata.domain.concurrency import AimdLimiter
 from kata.domain.exceptions import KataError, KataLanguageNotFound, KataTemplateNotFound
-from kata.domain.grepo import GRepo
-from kata.domain.models import DownloadableFile
-from kata.domain.services import InitKataService, LoginService
+from kata.domain.grepo import GRepo, GitGRepo
+from kata.domain.models import KataTemplate
+from kata.domain.planner import Plan, PlannedGRepo, PlannerStats, StrategyPlanner, CONTENTS, PARTIAL_CLONE, \
+    CACHED_CLONE
+from kata.domain.services import InitKataService, LoginService, KataStatusService
+from kata.presentation.completion import complete_languages, complete_templates
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
 
 SANDBOX = Path('./sandbox')
+CONFIG_FILE = Path('~/.katacli')
+CACHE_DIR = Path(defaults.CACHE_DIR)
 
 
 @click.group()
+@click.option('--stats', is_flag=True, help='Print network statistics once the command is done')
+@click.option('--record', 'record_cassette', type=click.Path(dir_okay=False, path_type=Path),
+              help='Record all Github responses to this cassette file')
+@click.option('--replay', 'replay_cassette', type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help='Serve Github responses from this cassette file, without any network')
+@click.option('--replay-timing', is_flag=True, help='When replaying, respond as slowly as when recorded')
+@click.option('--profile', 'profile_file', type=click.Path(dir_okay=False, path_type=Path),
+              help='Profile the command, in all threads. Writes pstats to this file, and collapsed stacks next to it')
+@click.option('--trace', 'trace_file', type=click.Path(dir_okay=False, path_type=Path),
+              help='Trace the command, and write the spans to this file in the Chrome trace format')
+@click.option('--metrics-textfile', type=click.Path(dir_okay=False, path_type=Path), envvar='KATA_METRICS_TEXTFILE',
+              help='Write metrics of the command to this Prometheus textfile. Env: KATA_METRICS_TEXTFILE')
+@click.option('--memstats', is_flag=True,
+              help='Print the peak memory of each phase, and the top allocation sites, once the command is done')
+@click.option('--slow-request-threshold', type=float, default=30.0, show_default=True,
+              envvar='KATA_SLOW_REQUEST_THRESHOLD',
+              help='Report requests in flight for longer than this, in seconds. Env: KATA_SLOW_REQUEST_THRESHOLD')
+@click.option('--dump-stacks', is_flag=True,
+              help='Also print the stacks of all threads, the first time a request is slow')
 @click.pass_context
-def cli(ctx: click.Context):
-    config_file_path_as_string = '~/.katacli'
-    config_file = Path(config_file_path_as_string).expanduser()
-    if not config_file.exists():
-        print_warning('Config file was not found!')
-        print_warning('')
-        print_warning('A new config file will be created and loaded with default settings.')
-        print_warning(f"Config file location: '{config_file_path_as_string}'")
-        print_warning('')
-    try:
-        main = KataMainContext(config_file)
-        ctx.obj = main
-        print_warning_if_not_auth(main)
-    except KataError as error:
-        print_error(str(error))
-        exit(1)
+def cli(ctx: click.Context, stats: bool, record_cassette: Path, replay_cassette: Path, replay_timing: bool,
+        profile_file: Path, trace_file: Path, metrics_textfile: Path, memstats: bool,
+        slow_request_threshold: float, dump_stacks: bool):
+    if record_cassette and replay_cassette:
+        raise click.UsageError("'--record' and '--replay' are mutually exclusive")
+    if profile_file:
+        start_profiling(ctx, profile_file)
+    if trace_file:
+        start_tracing(ctx, trace_file)
+    if metrics_textfile:
+        start_collecting_metrics(ctx, metrics_textfile)
+    if memstats:
+        start_memstats(ctx)
+    # Nothing is built here: dependencies are constructed on first use by the commands needing them
+    main = KataMainContext(CONFIG_FILE.expanduser(), CACHE_DIR.expanduser(),
+                           record_cassette=record_cassette,
+                           replay_cassette=replay_cassette,
+                           replay_timing=replay_timing,
+                           slow_request_threshold=slow_request_threshold,
+                           dump_stacks=dump_stacks)
+    ctx.obj = main
+    ctx.call_on_close(main.close)
+    if stats:
+        ctx.call_on_close(lambda: print_stats(main))
+
+
+def start_profiling(ctx: click.Context, profile_file: Path):
+    from kata.diagnostics.profiling import Profiler
+    profiler = Profiler()
+
+    def stop_and_write_profile():
+        profiler.stop()
+        collapsed_stacks_file = profiler.write(profile_file)
+        click.echo(f"Profile written to '{profile_file}' (pstats) and '{collapsed_stacks_file}' (collapsed stacks)",
+                   err=True)
+
+    # Registered first, so it runs last: closing the main context is profiled as well
+    ctx.call_on_close(stop_and_write_profile)
+    profiler.start()
+
+
+def start_tracing(ctx: click.Context, trace_file: Path):
+    def stop_and_write_trace():
+        tracing.stop_tracing().write(trace_file)
+        click.echo(f"Trace written to '{trace_file}'", err=True)
+
+    ctx.call_on_close(stop_and_write_trace)
+    tracing.start_tracing()
+
+
+def start_collecting_metrics(ctx: click.Context, metrics_textfile: Path):
+    start = time.perf_counter()
+
+    def stop_and_write_metrics():
+        metrics.set_gauge('kata_command_duration_seconds', time.perf_counter() - start,
+                          command=ctx.invoked_subcommand or '')
+        # Atomic: node-exporter never reads a partially written file
+        FileWriter.write_bytes_to_file(metrics_textfile, metrics.stop_collecting().render().encode())
+
+    ctx.call_on_close(stop_and_write_metrics)
+    metrics.start_collecting()
+
+
+def start_memstats(ctx: click.Context):
+    from kata.diagnostics.memstats import MemStats
+    memstats = MemStats()
+    # Phases are taken from the spans: trace the command, unless '--trace' already does
+    tracer = tracing.current_tracer()
+    owns_tracer = tracer is None
+    if owns_tracer:
+        tracer = tracing.start_tracing()
+
+    def stop_and_print_memstats():
+        memstats.stop()
+        if owns_tracer:
+            tracing.stop_tracing()
+        click.echo(memstats.report(tracer), err=True)
+
+    ctx.call_on_close(stop_and_print_memstats)
+    memstats.start()
+
+
+def requires_config(command):
+    """
+    Load and validate the config before running the command
+
+    Commands without it never parse the config, which keeps them fast to start.
+    """
+
+    @functools.wraps(command)
+    def wrapper(ctx: click.Context, *args, **kwargs):
+        main_ctx: KataMainContext = ctx.obj
+        if not main_ctx.config_file.exists():
+            print_warning('Config file was not found!')
+            print_warning('')
+            print_warning('A new config file will be created and loaded with default settings.')
+            print_warning(f"Config file location: '{CONFIG_FILE}'")
+            print_warning('')
+        try:
+            print_warning_if_not_auth(main_ctx)
+        except KataError as error:
+            print_error(str(error))
+            exit(1)
+        return command(ctx, *args, **kwargs)
+
+    return wrapper
 
 
 @cli.command()
 @click.pass_context
 @click.argument('kata_name')
-@click.argument('template_language')
-@click.argument('template_name', required=False)
-def init(ctx: click.Context, kata_name, template_language, template_name):
+@click.argument('template_language', shell_complete=complete_languages)
+@click.argument('template_name', required=False, shell_complete=complete_templates)
+@click.option('--dry-run', is_flag=True, help='Only print how the template would be fetched')
+@click.option('--include', 'include', multiple=True, metavar='GLOB',
+              help="Only keep template files matching. Repeat for multiple. Default: from 'Filters' in the config")
+@click.option('--exclude', 'exclude', multiple=True, metavar='GLOB',
+              help="Skip template files matching. Repeat for multiple. Default: from 'Filters' in the config")
+@requires_config
+def init(ctx: click.Context, kata_name, template_language, template_name, dry_run, include, exclude):
+    """
+    Initialize a kata from a template
+
+    Also writes a '.kata/manifest.json' manifest in the kata, recording its template for 'kata status'.
+    Templates with their own '.kata/manifest.json' are refused.
+    """
     main_ctx: KataMainContext = ctx.obj
 
     current_dir = Path('.')
@@ -51,7 +193,14 @@ def init(ctx: click.Context, kata_name, template_language, template_name):
     print_normal(f"  - Kata Template: '{template_name}'")
     print_normal("")
     try:
-        main_ctx.init_kata_service.init_kata(current_dir, kata_name, template_language, template_name)
+        if dry_run:
+            print_plan(main_ctx.init_kata_service.plan_kata(current_dir, kata_name, template_language, template_name,
+                                                            include=include or None,
+                                                            exclude=exclude or None))
+            return
+        main_ctx.init_kata_service.init_kata(current_dir, kata_name, template_language, template_name,
+                                             include=include or None,
+                                             exclude=exclude or None)
         print_success('Done!')
 
     except KataLanguageNotFound as lang_not_found:
@@ -78,12 +227,42 @@ def init(ctx: click.Context, kata_name, template_language, template_name):
         else:
             print_error(f"Available templates for '{template_language}':")
             for template in template_not_found.available_templates:
-                print_error(f"  - {template.template_name}")
+                print_error(f"  - {describe_template(template, main_ctx)}")
 
     except KataError as error:
         print_error(str(error))
 
 
+@cli.command()
+@click.pass_context
+@click.argument('kata_dirs', nargs=-1, required=True,
+                type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option('--refresh', is_flag=True,
+              help='Compare with a fresh listing of the template, instead of the one recorded by init')
+def status(ctx: click.Context, kata_dirs, refresh):
+    """
+    Which files of the katas differ from their template. Nothing is downloaded
+    """
+    main_ctx: KataMainContext = ctx.obj
+    status_service = main_ctx.refreshing_kata_status_service if refresh else main_ctx.kata_status_service
+    try:
+        kata_statuses = status_service.status([*kata_dirs])
+    except KataError as error:
+        print_error(str(error))
+        exit(1)
+
+    for kata_status in kata_statuses:
+        if kata_status.unknown:
+            print_error(f"{kata_status.kata_dir}: unknown, not initialized by 'kata init': its template can't be told")
+            continue
+        print_normal(f"{kata_status.kata_dir}: {len(kata_status.modified)} modified, "
+                     f"{len(kata_status.missing)} missing, {len(kata_status.unchanged)} unchanged")
+        for file_path in kata_status.modified:
+            print_warning(f"  modified: {file_path}")
+        for file_path in kata_status.missing:
+            print_error(f"  missing:  {file_path}")
+
+
 @cli.group()
 @click.pass_context
 def list(_ctx: click.Context):
@@ -92,6 +271,7 @@ def list(_ctx: click.Context):
 
 @list.command()
 @click.pass_context
+@requires_config
 def languages(ctx: click.Context):
     main_ctx: KataMainContext = ctx.obj
     try:
@@ -106,14 +286,15 @@ def languages(ctx: click.Context):
 
 @list.command()
 @click.pass_context
-@click.argument('language')
+@click.argument('language', shell_complete=complete_languages)
+@requires_config
 def templates(ctx: click.Context, language):
     main_ctx: KataMainContext = ctx.obj
     try:
         available_kata_templates = main_ctx.init_kata_service.list_available_templates(language)
         print_normal(f"Available templates for '{language}':")
         for template in available_kata_templates:
-            print_normal(f"  - '{template.template_name}'")
+            print_normal(f"  - '{describe_template(template, main_ctx)}'")
 
     except KataLanguageNotFound as lang_not_found:
         print_error(f"Language '{language}' could not be found!")
@@ -137,6 +318,7 @@ def debug(_ctx: click.Context):
 @click.argument('repo')
 @click.argument('sub_path_in_repo', default='')
 @click.pass_context
+@requires_config
 def explore(ctx: click.Context, github_user, repo, sub_path_in_repo):
     main_ctx: KataMainContext = ctx.obj
     click.echo('Debug - Print all files in repo')
@@ -146,10 +328,13 @@ def explore(ctx: click.Context, github_user, repo, sub_path_in_repo):
     click.echo(f" - Repo: '{repo}'")
     click.echo(f" - SubPath in Repo: '{sub_path_in_repo}'")
     click.echo('')
-    result = main_ctx.grepo.get_files_to_download(github_user, repo, sub_path_in_repo)
-    pprint(result)
+    file_tree = main_ctx.grepo.get_file_tree(github_user, repo, sub_path_in_repo)
+    file_count = 0
+    for file in file_tree:
+        click.echo(repr(file))
+        file_count += 1
     click.echo('')
-    click.echo('Done')
+    click.echo(f'Done - {file_count} files')
 
 
 @debug.command()
@@ -157,6 +342,7 @@ def explore(ctx: click.Context, github_user, repo, sub_path_in_repo):
 @click.argument('repo')
 @click.argument('sub_path_in_repo', default='')
 @click.pass_context
+@requires_config
 def download(ctx: click.Context, github_user, repo, sub_path_in_repo):
     if not SANDBOX.exists():
         raise KataError("Please create an empty './sandbox' directory before proceeding")
@@ -166,64 +352,299 @@ def download(ctx: click.Context, github_user, repo, sub_path_in_repo):
     main_ctx: KataMainContext = ctx.obj
     click.echo(f'Sandbox: {SANDBOX.absolute()}')
 
-    repo_files: List[DownloadableFile] = main_ctx.grepo.get_files_to_download(github_user, repo, sub_path_in_repo)
+    file_tree = main_ctx.grepo.get_file_tree(github_user, repo, sub_path_in_repo)
     click.echo('Finished fetching the list. Writing to drive now')
-    main_ctx.grepo.download_files_at_location(SANDBOX, repo_files)
+    main_ctx.grepo.download_files_at_location(SANDBOX, file_tree)
     click.echo('Done! (probably ^_^)')
 
 
-@debug.command()
-def debug():
-    p = Path('~/.katacli').expanduser()
-    print_normal(p.absolute())
-
+@cli.command()
+@click.option('--shape', 'shapes', multiple=True, type=click.Choice([*SHAPES]),
+              help='Tree shape to benchmark. Repeat for multiple. Default: all but "large_template"')
+@click.option('--strategy', 'strategies', multiple=True, type=click.Choice(['adaptive', 'fixed']),
+              help='Concurrency strategy. Repeat for multiple. Default: all')
+@click.option('--concurrency', 'concurrency_levels', multiple=True, type=int,
+              help='(Initial) concurrency level. Repeat for multiple. Default: 1, 8 and 32')
+@click.option('--latency', default=20.0, show_default=True, help='Latency added to each request, in ms')
+@click.option('--bandwidth', type=int, help='Bandwidth of each request, in KiB/s. Default: unlimited')
+def bench(shapes, strategies, concurrency_levels, latency, bandwidth):
+    """
+    Benchmark exploring and downloading templates against a local fake Github
+    """
+    # Not imported upfront: it pulls in an http server
+    from kata.bench.runner import run_bench, STRATEGIES
+
+    print_normal(f"{'shape':<16} {'strategy':<9} {'conc.':>5} {'wall (s)':>9} {'listings':>9} {'downloads':>9} "
+                 f"{'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for shape_name in shapes or DEFAULT_SHAPES:
+        shape = SHAPES[shape_name]()
+        for strategy in strategies or STRATEGIES:
+            for concurrency in concurrency_levels or (1, 8, 32):
+                result = run_bench(shape, strategy, concurrency,
+                                   latency=latency / 1000,
+                                   bandwidth=bandwidth * 1024 if bandwidth else None)
+                print_normal(f"{result.shape:<16} {result.strategy:<9} {result.concurrency:>5} "
+                             f"{result.wall_time:>9.2f} {result.listing_requests:>9} {result.download_requests:>9} "
+                             f"{result.p50 * 1000:>9.1f} {result.p95 * 1000:>9.1f} {result.p99 * 1000:>9.1f}")
 
-class KataMainContext:
-    file_reader: FileReader
-    file_writer: FileWriter
-    api: GithubApi
-    executor: ThreadPoolExecutor
 
-    config_repo: ConfigRepo
-    kata_template_repo: KataTemplateRepo
-    kata_language_repo: KataLanguageRepo
+@debug.command()
+@click.pass_context
+def inflight(ctx: click.Context):
+    """
+    List the requests in flight in all running 'kata' processes
+    """
+    main_ctx: KataMainContext = ctx.obj
+    in_flight_per_process = read_in_flight_requests(main_ctx.in_flight_dir, main_ctx.file_reader)
+    if not in_flight_per_process:
+        print_normal('No request in flight')
+        return
+    now = time.time()
+    for pid, in_flight_requests in sorted(in_flight_per_process.items()):
+        print_normal(f'Process {pid}:')
+        for request in in_flight_requests:
+            print_normal(f'  {now - request.started_at:>7.1f}s  {request.thread_name:<20} {request.url}')
 
-    grepo: GRepo
-    init_kata_service: InitKataService
-    login_service: LoginService
 
-    def __init__(self, config_file):
-        self.config_file = config_file
+@debug.command()
+def debug():
+    p = CONFIG_FILE.expanduser()
+    print_normal(p.absolute())
 
-        def init_base_deps():
-            self.executor = ThreadPoolExecutor(100)
-            self.file_writer = FileWriter()
-            self.file_reader = FileReader()
 
-        def init_config():
-            self.config_repo = ConfigRepo(self.config_file, self.file_reader, self.file_writer)
+class _lazy:
+    """
+    Build the dependency on first access only, then keep it on the instance
+    """
 
-        def init_network():
-            auth_token = self.config_repo.get_auth_token()
-            self.api = GithubApi(auth_token)
+    def __init__(self, build):
+        self._build = build
+        self._name = build.__name__
 
-        def init_repos():
-            self.kata_template_repo = KataTemplateRepo(self.api, self.config_repo)
-            self.kata_language_repo = KataLanguageRepo(self.api, self.config_repo)
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        dependency = self._build(instance)
+        instance.__dict__[self._name] = dependency
+        return dependency
 
-        def init_domain():
-            self.grepo = GRepo(self.api, self.file_writer, self.executor)
-            self.init_kata_service = InitKataService(self.kata_language_repo,
-                                                     self.kata_template_repo,
-                                                     self.grepo,
-                                                     self.config_repo)
-            self.login_service = LoginService(self.config_repo)
 
-        init_base_deps()
-        init_config()
-        init_network()
-        init_repos()
-        init_domain()
+class KataMainContext:
+    """
+    Dependencies are built on first use: a command only pays for what it needs.
+    Eg. the executor is only created by commands actually downloading something.
+    """
+
+    def __init__(self,
+                 config_file: Path,
+                 cache_dir: Path,
+                 record_cassette: Optional[Path] = None,
+                 replay_cassette: Optional[Path] = None,
+                 replay_timing: bool = False,
+                 slow_request_threshold: float = 30.0,
+                 dump_stacks: bool = False):
+        self.config_file = config_file
+        self.cache_dir = cache_dir
+        self.in_flight_dir = cache_dir / 'inflight'
+        self.record_cassette = record_cassette
+        self.replay_cassette = replay_cassette
+        self.replay_timing = replay_timing
+        self.slow_request_threshold = slow_request_threshold
+        self.dump_stacks = dump_stacks
+
+    @_lazy
+    def file_reader(self) -> FileReader:
+        return FileReader()
+
+    @_lazy
+    def file_writer(self) -> FileWriter:
+        return FileWriter()
+
+    @_lazy
+    def limiter(self) -> AimdLimiter:
+        return AimdLimiter()
+
+    @_lazy
+    def executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(self.limiter.max_limit, thread_name_prefix='grepo-')
+
+    @_lazy
+    def hedging_executor(self) -> ThreadPoolExecutor:
+        """
+        Every GRepo worker can have a request in flight on each endpoint: hedges never queue behind stuck requests
+        """
+        endpoints = 1 + len(self.config_repo.get_mirrors())
+        return ThreadPoolExecutor(self.limiter.max_limit * endpoints, thread_name_prefix='hedged-request-')
+
+    @_lazy
+    def sources_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(thread_name_prefix='kata-source-')
+
+    @_lazy
+    def hashing_executor(self) -> 'ProcessPoolExecutor':
+        """
+        Worker processes are only started once there is enough to hash
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor()
+
+    @_lazy
+    def config_repo(self) -> ConfigRepo:
+        return ConfigRepo(self.config_file,
+                          self.file_reader,
+                          self.file_writer,
+                          ConfigCache(self.cache_dir / 'config.cache', self.file_writer))
+
+    @_lazy
+    def hedged_requests(self) -> Optional[HedgedRequests]:
+        """
+        :return: None without any mirror configured: there is nothing to hedge with
+        """
+        if not self.config_repo.get_mirrors():
+            return None
+        return HedgedRequests(self.latency_stats, self.hedging_executor)
+
+    @_lazy
+    def latency_stats(self) -> LatencyStats:
+        return LatencyStats(self.cache_dir / 'endpoint_latencies.json', self.file_reader, self.file_writer)
+
+    @_lazy
+    def shared_budget(self) -> SharedRateLimitBudget:
+        return SharedRateLimitBudget(self.cache_dir / 'rate_limit_budget.json', self.file_reader, self.file_writer)
+
+    @_lazy
+    def single_flight(self) -> SingleFlight:
+        return SingleFlight(self.cache_dir / 'single_flight', self.file_reader, self.file_writer)
+
+    @_lazy
+    def transport(self):
+        """
+        :return: None to send requests for real
+        """
+        if self.record_cassette:
+            return RecordingTransport(self.record_cassette, self.file_writer)
+        if self.replay_cassette:
+            return ReplayTransport(self.replay_cassette, self.file_reader, original_timing=self.replay_timing)
+        return None
+
+    @_lazy
+    def watchdog(self) -> RequestWatchdog:
+        return RequestWatchdog(self.slow_request_threshold,
+                               lambda message: click.secho(message, fg='yellow', err=True),
+                               dump_stacks=self.dump_stacks,
+                               state_file=self.in_flight_dir / f'{os.getpid()}.json',
+                               file_writer=self.file_writer)
+
+    @_lazy
+    def api(self) -> GithubApi:
+        if self.replay_cassette or self.record_cassette:
+            # Recorded and replayed responses must neither be shared with other processes nor affect their
+            # rate-limit budget: a recording must hold every response, and a replay must not change other runs
+            return GithubApi(self.config_repo.get_auth_tokens(),
+                             api_base_url=self.config_repo.get_api_base_url(),
+                             raw_base_url=self.config_repo.get_raw_base_url(),
+                             url_rewrites=self.config_repo.get_url_rewrites(),
+                             transport=self.transport,
+                             watchdog=self.watchdog)
+        return GithubApi(self.config_repo.get_auth_tokens(),
+                         api_base_url=self.config_repo.get_api_base_url(),
+                         raw_base_url=self.config_repo.get_raw_base_url(),
+                         url_rewrites=self.config_repo.get_url_rewrites(),
+                         mirrors=self.config_repo.get_mirrors(),
+                         hedged_requests=self.hedged_requests,
+                         shared_budget=self.shared_budget,
+                         single_flight=self.single_flight,
+                         transport=self.transport,
+                         watchdog=self.watchdog)
+
+    @_lazy
+    def catalog(self) -> CatalogSnapshot:
+        return CatalogSnapshot(self.cache_dir / 'catalog.json', self.file_writer)
+
+    @_lazy
+    def kata_template_repo(self) -> KataTemplateRepo:
+        return KataTemplateRepo(self.api, self.config_repo, self.catalog, self.sources_executor)
+
+    @_lazy
+    def kata_language_repo(self) -> KataLanguageRepo:
+        return KataLanguageRepo(self.api, self.config_repo, self.catalog, self.sources_executor)
+
+    @_lazy
+    def partial_clone(self) -> Optional[PartialClone]:
+        """
+        :return: None unless the git backend is enabled
+        """
+        if not self.config_repo.use_git_backend():
+            return None
+        return PartialClone(self.cache_dir / 'clones', self.git, self.config_repo.get_git_url_template())
+
+    @_lazy
+    def git(self) -> GitCli:
+        return GitCli()
+
+    @_lazy
+    def planner_stats(self) -> PlannerStats:
+        return PlannerStats(self.cache_dir / 'planner_stats.json', self.file_reader, self.file_writer)
+
+    @_lazy
+    def planner(self) -> StrategyPlanner:
+        return StrategyPlanner(self.planner_stats,
+                               self.limiter.max_limit,
+                               is_cloned=self.partial_clone.is_cloned if self.partial_clone else None,
+                               remaining_rate_limit=self.api.remaining_rate_limit,
+                               round_trip_time=lambda: self.latency_stats.percentile(self.api.api_base_url, 50))
+
+    @_lazy
+    def grepo(self) -> PlannedGRepo:
+        grepos = {CONTENTS: GRepo(self.api, self.file_writer, self.executor, self.limiter)}
+        if self.partial_clone:
+            git_grepo = GitGRepo(self.partial_clone, self.git, self.file_writer)
+            grepos.update({PARTIAL_CLONE: git_grepo, CACHED_CLONE: git_grepo})
+        return PlannedGRepo(self.planner, self.planner_stats, grepos)
+
+    @_lazy
+    def kata_manifest_repo(self) -> KataManifestRepo:
+        return KataManifestRepo(self.file_writer)
+
+    @_lazy
+    def init_kata_service(self) -> InitKataService:
+        return InitKataService(self.kata_language_repo, self.kata_template_repo, self.grepo, self.config_repo,
+                               self.planner, self.kata_manifest_repo)
+
+    @_lazy
+    def kata_status_service(self) -> KataStatusService:
+        """
+        Only compares with the listings recorded in the katas: neither the config nor the Github Api are needed
+        """
+        return KataStatusService(self.kata_manifest_repo, self.hashing_executor)
+
+    @_lazy
+    def refreshing_kata_status_service(self) -> KataStatusService:
+        return KataStatusService(self.kata_manifest_repo, self.hashing_executor, self.grepo)
+
+    @_lazy
+    def login_service(self) -> LoginService:
+        return LoginService(self.config_repo)
+
+    def is_built(self, dependency_name: str) -> bool:
+        return dependency_name in self.__dict__
+
+    def close(self):
+        if self.is_built('transport') and isinstance(self.transport, RecordingTransport):
+            self.transport.save()
+        if self.is_built('latency_stats'):
+            self.latency_stats.save()
+        if self.is_built('planner_stats'):
+            self.planner_stats.save()
+        if self.is_built('shared_budget'):
+            self.shared_budget.flush()
+        if self.is_built('single_flight'):
+            self.single_flight.prune()
+        if self.is_built('watchdog'):
+            self.watchdog.stop()
+        for executor_name in ['hedging_executor', 'sources_executor', 'hashing_executor']:
+            if self.is_built(executor_name):
+                getattr(self, executor_name).shutdown(wait=False)
 
 
 def print_error(msg):
@@ -242,6 +663,40 @@ def print_normal(msg):
     click.echo(msg)
 
 
+def print_plan(plan: Plan):
+    shape = plan.shape
+    print_normal(f"Template: {shape.files} files, {shape.dirs} directories, {shape.depth} deep, "
+                 f"{shape.total_size} bytes" + (' (guessed: never fetched before)' if plan.shape_is_guessed else ''))
+    print_normal('')
+    print_normal(f"  {'strategy':<14} {'api calls':>9} {'requests':>8} {'bytes':>10} {'time (s)':>8} {'calib.':>6} "
+                 f"{'cost (s)':>8}")
+    for estimate in plan.estimates:
+        print_normal(f"  {estimate.strategy:<14} {estimate.api_calls:>9} {estimate.requests:>8} {estimate.bytes:>10} "
+                     f"{estimate.wall_time:>8.2f} {estimate.calibration:>6.2f} {estimate.cost:>8.2f}"
+                     + ('' if estimate.within_rate_limit else '  (over the remaining rate limit)'))
+    print_normal('')
+    print_success(f"Plan: '{plan.chosen.strategy}'" + (' (never timed before: tried to calibrate it)'
+                                                         if plan.exploring else ''))
+
+
+def print_stats(main_context: KataMainContext):
+    if not main_context.is_built('grepo'):
+        return
+    print_normal('')
+    print_normal('Stats:')
+    for stat_name, stat_value in main_context.grepo.stats().items():
+        print_normal(f"  - {stat_name}: {stat_value}")
+
+
+def describe_template(template: KataTemplate, main_context: KataMainContext) -> str:
+    """
+    Templates are namespaced by source only when multiple sources are configured
+    """
+    if template.source is None or len(main_context.config_repo.get_kata_grepo_sources()) == 1:
+        return f"{template.template_name}"
+    return f"{template.source.name}:{template.template_name}"
+
+
 def print_warning_if_not_auth(main_context: KataMainContext):
     if main_context.login_service.is_logged_in():
         return
@@ -0,0 +1,93 @@
+"""
+Shell completion of languages and templates, served from the local catalog snapshot
+
+The fast path is handled before the CLI itself is even imported: no click, no config, no network.
+Anything it doesn't handle falls back to click's own completion.
+"""
+import shlex
+from pathlib import Path
+from typing import List, Optional, Mapping
+
+from kata import defaults
+from kata.data.catalog import CatalogSnapshot
+from kata.data.io.file import FileWriter
+
+COMPLETE_VAR = '_KATA_COMPLETE'
+
+
+def catalog_snapshot() -> CatalogSnapshot:
+    return CatalogSnapshot(Path(defaults.CACHE_DIR).expanduser() / 'catalog.json', FileWriter())
+
+
+def suggest(args: List[str], incomplete: str, catalog: CatalogSnapshot) -> Optional[List[str]]:
+    """
+    :param args: Words already typed, excluding the program name and the word being completed
+    :return: Suggestions, or None if the position isn't one of a language or a template
+    """
+
+    def starting_with_incomplete(candidates):
+        return [candidate for candidate in candidates if candidate.startswith(incomplete)]
+
+    positional_args = [arg for arg in args if not arg.startswith('-')]
+    if positional_args[:1] == ['init']:
+        if len(positional_args) == 2:
+            return starting_with_incomplete(catalog.languages())
+        if len(positional_args) == 3:
+            return starting_with_incomplete(catalog.templates(positional_args[2]))
+    if positional_args == ['list', 'templates']:
+        return starting_with_incomplete(catalog.languages())
+    return None
+
+
+def complete_languages(_ctx, _param, incomplete: str) -> List[str]:
+    return [language for language in catalog_snapshot().languages() if language.startswith(incomplete)]
+
+
+def complete_templates(ctx, _param, incomplete: str) -> List[str]:
+    language = ctx.params.get('template_language') or ''
+    return [template for template in catalog_snapshot().templates(language) if template.startswith(incomplete)]
+
+
+def try_fast_completion(environ: Mapping[str, str]) -> bool:
+    """
+    Mirrors the protocol of click's 'bash', 'zsh' and 'fish' completion
+
+    :return: True if completion was handled and printed
+    """
+    shell, _, instruction = environ.get(COMPLETE_VAR, '').partition('_')
+    if instruction != 'complete' or shell not in _FORMATTERS:
+        return False
+
+    try:
+        words = shlex.split(environ['COMP_WORDS'])
+        if shell == 'fish':
+            incomplete = environ['COMP_CWORD']
+            args = words[1:]
+            if incomplete and args and args[-1] == incomplete:
+                args.pop()
+        else:
+            current_word_index = int(environ['COMP_CWORD'])
+            args = words[1:current_word_index]
+            incomplete = words[current_word_index] if current_word_index < len(words) else ''
+    except (KeyError, ValueError):
+        return False
+
+    suggestions = suggest(args, incomplete, catalog_snapshot())
+    if suggestions is None:
+        return False
+
+    print(_FORMATTERS[shell](suggestions))
+    return True
+
+
+def _bash_or_fish_format(suggestions: List[str]) -> str:
+    return '\n'.join(f'plain,{suggestion}' for suggestion in suggestions)
+
+
+def _zsh_format(suggestions: List[str]) -> str:
+    return '\n'.join(f"plain\n{suggestion.replace(':', chr(92) + ':')}\n_" for suggestion in suggestions)
+
+
+_FORMATTERS = {'bash': _bash_or_fish_format,
+               'zsh': _zsh_format,
+               'fish': _bash_or_fish_format}
@@ -0,0 +1,119 @@
+import threading
+import time
+from concurrent import futures
+from typing import Optional
+
+from kata.bench.shapes import TreeShape
+from kata.data.io.file import PartialFile
+from kata.domain.exceptions import ApiNotFound
+
+
+class VirtualClock:
+    """
+    Time as seen by the requests to a `FakeGithubApi`: each request takes exactly its injected delay
+
+    Time flows along with the work. A task starts at the time of the thread which submitted it, when submitted to
+    an executor wrapped with `propagated_to`. Threads outside of tasks, like the one walking the tree, are at the
+    time the latest request ended. Unlike wall time, it doesn't depend on the load of the machine.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest_end = 0.0
+        self._thread = threading.local()
+
+    def __call__(self) -> float:
+        time_of_task = self._time_of_task()
+        if time_of_task is not None:
+            return time_of_task
+        with self._lock:
+            return self._latest_end
+
+    def sleep(self, duration: float) -> None:
+        end = self() + duration
+        # Still waited for real: work depending on this request isn't submitted before it completes
+        time.sleep(duration)
+        if self._time_of_task() is not None:
+            self._thread.now = end
+        with self._lock:
+            self._latest_end = max(self._latest_end, end)
+
+    def propagated_to(self, executor: futures.Executor) -> futures.Executor:
+        return _TimePropagatingExecutor(executor, self)
+
+    def _time_of_task(self) -> Optional[float]:
+        return getattr(self._thread, 'now', None)
+
+    def _run_at(self, now: float, fn, args, kwargs):
+        self._thread.now = now
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._thread.now = None
+
+
+class _TimePropagatingExecutor(futures.Executor):
+    def __init__(self, executor: futures.Executor, clock: VirtualClock):
+        self._executor = executor
+        self._clock = clock
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(self._clock._run_at, self._clock(), fn, args, kwargs)
+
+    def shutdown(self, wait=True, **kwargs):
+        self._executor.shutdown(wait, **kwargs)
+
+
+class FakeGithubApi:
+    """
+    In-memory stand-in for `GithubApi` serving a synthetic tree, with injected latency and bandwidth
+
+    Unlike `FakeGithub`, no socket is involved: timings only depend on the injected delays and on `GRepo`.
+    """
+
+    RAW_URL_PREFIX = 'https://fake.raw/'
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, shape: TreeShape, latency: float = 0.0, bandwidth: Optional[int] = None,
+                 clock: Optional[VirtualClock] = None):
+        """
+        :param latency: In seconds, added to every request
+        :param bandwidth: In bytes per second, per request. Unlimited if None
+        :param clock: Advanced by the delay of each request. Otherwise, delays are only waited for
+        """
+        self._shape = shape
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._sleep = clock.sleep if clock else time.sleep
+        self._lock = threading.Lock()
+        self.contents_calls = 0
+        self.download_calls = 0
+
+    def contents(self, _user, _repo, path=''):
+        with self._lock:
+            self.contents_calls += 1
+        self._sleep(self._latency)
+        listing = self._shape.listing(path, self.RAW_URL_PREFIX)
+        if listing is None:
+            raise ApiNotFound(path)
+        return listing
+
+    def download_raw_file(self, raw_file_url: str, _sha: Optional[str] = None) -> bytes:
+        with self._lock:
+            self.download_calls += 1
+        size = self._shape.file_sizes[raw_file_url[len(self.RAW_URL_PREFIX):]]
+        self._sleep(self._latency + (size / self._bandwidth if self._bandwidth else 0))
+        return b'x' * size
+
+    def download_raw_file_to(self, raw_file_url: str, partial_file: PartialFile, _size: int,
+                             _sha: Optional[str] = None) -> None:
+        """
+        Resumes from what `partial_file` already holds, as if the server supported `Range`
+        """
+        with self._lock:
+            self.download_calls += 1
+        size = self._shape.file_sizes[raw_file_url[len(self.RAW_URL_PREFIX):]]
+        remaining = size - partial_file.downloaded_size
+        self._sleep(self._latency + (remaining / self._bandwidth if self._bandwidth else 0))
+        partial_file.append(b'x' * min(self.CHUNK_SIZE, remaining - start)
+                            for start in range(0, remaining, self.CHUNK_SIZE))
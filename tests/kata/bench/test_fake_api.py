@@ -0,0 +1,36 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tests.kata.bench.fake_api import VirtualClock
+
+
+class TestVirtualClock:
+    def test_concurrent_requests_overlap(self):
+        # Given: 4 requests sent at once
+        clock = VirtualClock()
+        with ThreadPoolExecutor(4) as executor:
+            for _ in range(4):
+                executor.submit(clock.sleep, 0.01)
+
+        # Then: They only took as long as one of them
+        assert clock() == 0.01
+
+    def test_time_flows_along_with_submitted_work(self):
+        # Given: Each request submits the next one when it completes
+        clock = VirtualClock()
+        all_done = threading.Event()
+
+        def request_then_submit_next(remaining):
+            clock.sleep(0.01)
+            if remaining:
+                executor.submit(request_then_submit_next, remaining - 1)
+            else:
+                all_done.set()
+
+        with ThreadPoolExecutor(4) as thread_pool:
+            executor = clock.propagated_to(thread_pool)
+            executor.submit(request_then_submit_next, 2)
+            assert all_done.wait(timeout=5)
+
+        # Then: They took as long as all of them, one after the other
+        assert round(clock(), 4) == 0.03
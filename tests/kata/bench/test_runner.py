@@ -0,0 +1,54 @@
+import pytest
+import requests
+
+from kata.bench.runner import run_bench, percentile
+from kata.bench.server import FakeGithub
+from kata.bench.shapes import TreeShape, deep, wide
+
+
+@pytest.fixture
+def small_tree():
+    return TreeShape('small', {'README.md': 10,
+                               'src/main.py': 100,
+                               'src/lib/util.py': 1000})
+
+
+class TestFakeGithub:
+    def test_serve_listings_and_files(self, small_tree):
+        with FakeGithub(small_tree) as fake_github:
+            root_listing = requests.get(f'{fake_github.api_base_url}/repos/bench/template/contents').json()
+            readme = requests.get(root_listing[0]['download_url'])
+
+        assert [(entry['path'], entry['type']) for entry in root_listing] == [('README.md', 'file'), ('src', 'dir')]
+        assert len(readme.text) == 10
+
+    def test_unknown_path(self, small_tree):
+        with FakeGithub(small_tree) as fake_github:
+            response = requests.get(f'{fake_github.api_base_url}/repos/bench/template/contents/doesnotexist')
+        assert response.status_code == 404
+
+
+class TestRunBench:
+    @pytest.mark.parametrize('strategy', ['adaptive', 'fixed'])
+    def test_count_requests(self, small_tree, strategy):
+        result = run_bench(small_tree, strategy, concurrency=4)
+
+        assert result.listing_requests == 3
+        assert result.download_requests == 3
+        assert 0 < result.p50 <= result.p95 <= result.p99 <= result.wall_time
+
+    def test_injected_latency(self, small_tree):
+        result = run_bench(small_tree, 'fixed', concurrency=4, latency=0.05)
+        assert result.p50 >= 0.05
+
+
+def test_shapes():
+    assert len(wide(dirs=3, files_per_dir=2).file_sizes) == 6
+    assert max(path.count('/') for path in deep(depth=4).file_sizes) == 4
+
+
+def test_percentile():
+    samples = [float(sample) for sample in range(1, 101)]
+    assert percentile(samples, 50) == 51
+    assert percentile(samples, 99) == 100
+    assert percentile([], 50) == 0
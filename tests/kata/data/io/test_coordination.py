@@ -0,0 +1,156 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from kata.data.io.coordination import file_lock, SharedRateLimitBudget, SingleFlight
+from kata.data.io.file import FileReader, FileWriter
+
+
+def test_file_lock_is_exclusive(tmp_path: Path):
+    lock_file = tmp_path / 'some.lock'
+    inside = 0
+    max_inside = 0
+
+    def hold_lock():
+        nonlocal inside, max_inside
+        with file_lock(lock_file):
+            inside += 1
+            max_inside = max(max_inside, inside)
+            time.sleep(0.01)
+            inside -= 1
+
+    with ThreadPoolExecutor(5) as executor:
+        for future in [executor.submit(hold_lock) for _ in range(10)]:
+            future.result()
+
+    assert max_inside == 1
+
+
+class TestSharedRateLimitBudget:
+    @pytest.fixture
+    def budget_file(self, tmp_path: Path):
+        return tmp_path / 'budget.json'
+
+    def create_budget(self, budget_file, now=1000):
+        # Each instance stands for a separate process sharing the same file
+        return SharedRateLimitBudget(budget_file, FileReader(), FileWriter(), clock=lambda: now)
+
+    def test_unknown_budget_then_allow(self, budget_file):
+        assert self.create_budget(budget_file).take('TOKEN')
+
+    def test_budget_observed_by_a_process_is_consumed_by_another(self, budget_file):
+        # Given: A process saw 2 remaining calls
+        self.create_budget(budget_file).observe('TOKEN', {'X-RateLimit-Remaining': '2',
+                                                          'X-RateLimit-Reset': '2000'})
+
+        # When: Another process makes 3 calls
+        other_process = self.create_budget(budget_file)
+        results = [other_process.take('TOKEN') for _ in range(3)]
+
+        # Then: Only the first 2 are allowed
+        assert results == [True, True, False]
+        assert other_process.reset_time('TOKEN') == 2000
+
+    def test_remaining(self, budget_file):
+        self.create_budget(budget_file, now=1000).observe('TOKEN', {'X-RateLimit-Remaining': '42',
+                                                                    'X-RateLimit-Reset': '2000'})
+
+        assert self.create_budget(budget_file, now=1000).remaining('TOKEN') == 42
+        assert self.create_budget(budget_file, now=1000).remaining('OTHER') is None
+        assert self.create_budget(budget_file, now=2000).remaining('TOKEN') is None
+
+    def test_budgets_are_per_token(self, budget_file):
+        budget = self.create_budget(budget_file)
+        budget.observe('EXHAUSTED', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '2000'})
+        assert not budget.take('EXHAUSTED')
+        assert budget.take('OTHER')
+        assert budget.take(None)
+
+    def test_allow_again_after_reset(self, budget_file):
+        self.create_budget(budget_file, now=1000).observe('TOKEN', {'X-RateLimit-Remaining': '0',
+                                                                    'X-RateLimit-Reset': '2000'})
+        assert self.create_budget(budget_file, now=2000).take('TOKEN')
+
+    def test_out_of_order_responses_keep_lowest_remaining(self, budget_file):
+        budget = self.create_budget(budget_file)
+        budget.observe('TOKEN', {'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': '2000'})
+        budget.observe('TOKEN', {'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '2000'})
+        assert budget.take('TOKEN')
+        assert not budget.take('TOKEN')
+
+    def test_consumed_in_memory_and_shared_once_synced(self, budget_file):
+        # Given: A process saw 10 remaining calls
+        now = 1000
+        budget = SharedRateLimitBudget(budget_file, FileReader(), FileWriter(), clock=lambda: now,
+                                       sync_interval_in_seconds=1)
+        budget.observe('TOKEN', {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '2000'})
+
+        # When: It makes 3 calls, while another process makes 2
+        other_process = self.create_budget(budget_file)
+        for _ in range(3):
+            budget.take('TOKEN')
+        other_process.take('TOKEN')
+        other_process.take('TOKEN')
+        other_process.flush()
+
+        # Then: Its calls are only shared once the sync interval elapsed, counting those of the other process
+        assert self.create_budget(budget_file).remaining('TOKEN') == 8
+        now = 1001
+        assert budget.remaining('TOKEN') == 5
+        assert self.create_budget(budget_file).remaining('TOKEN') == 5
+
+    def test_exhausted_budget_is_shared_right_away(self, budget_file):
+        budget = self.create_budget(budget_file)
+        budget.observe('TOKEN', {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '2000'})
+        budget.observe('TOKEN', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '2000'})
+        assert not self.create_budget(budget_file).take('TOKEN')
+
+    def test_tokens_are_not_stored(self, budget_file):
+        self.create_budget(budget_file).observe('SECRET_TOKEN', {'X-RateLimit-Remaining': '1',
+                                                                 'X-RateLimit-Reset': '2000'})
+        assert 'SECRET_TOKEN' not in budget_file.read_text()
+
+
+class TestSingleFlight:
+    @pytest.fixture
+    def results_dir(self, tmp_path: Path):
+        return tmp_path / 'single_flight'
+
+    def create_single_flight(self, results_dir, ttl_in_seconds=60):
+        # Each instance stands for a separate process sharing the same directory
+        return SingleFlight(results_dir, FileReader(), FileWriter(), ttl_in_seconds=ttl_in_seconds)
+
+    def test_concurrent_fetches_of_same_key_only_fetch_once(self, results_dir):
+        fetch_count = 0
+        fetch_count_lock = threading.Lock()
+
+        def slow_fetch():
+            nonlocal fetch_count
+            with fetch_count_lock:
+                fetch_count += 1
+            time.sleep(0.05)
+            return {'listing': ['a_file.txt']}
+
+        with ThreadPoolExecutor(5) as executor:
+            all_futures = [executor.submit(self.create_single_flight(results_dir).run, 'http://url', slow_fetch)
+                           for _ in range(5)]
+            results = [future.result() for future in all_futures]
+
+        assert fetch_count == 1
+        assert all(result == {'listing': ['a_file.txt']} for result in results)
+
+    def test_different_keys_are_fetched_separately(self, results_dir):
+        single_flight = self.create_single_flight(results_dir)
+        assert single_flight.run('http://url/1', lambda: 'ONE') == 'ONE'
+        assert single_flight.run('http://url/2', lambda: 'TWO') == 'TWO'
+
+    def test_expired_result_is_fetched_again_and_pruned(self, results_dir):
+        single_flight = self.create_single_flight(results_dir, ttl_in_seconds=0)
+        assert single_flight.run('http://url', lambda: 'FIRST') == 'FIRST'
+        assert single_flight.run('http://url', lambda: 'SECOND') == 'SECOND'
+
+        single_flight.prune()
+        assert not list(results_dir.glob('*.json'))
@@ -1,9 +1,10 @@
+import os
 from pathlib import Path
 
 import pytest
 import yaml
 
-from kata.data.io.file import FileWriter
+from kata.data.io.file import FileWriter, ConfigCache, GitBlobHash, git_blob_shas
 
 
 class TestFileWriter:
@@ -29,3 +30,104 @@ class TestFileWriter:
             # Then: File has been correctly written
             with file_path.open('r') as f:
                 assert yaml.load(f.read()) == valid_yaml_data
+
+
+class TestPartialFile:
+    def test_only_gets_its_name_once_complete(self, tmp_path: Path):
+        partial_file = FileWriter.partial_file_in_sub_path(tmp_path, Path('dir/big.bin'))
+
+        partial_file.append([b'first', b'second'])
+        assert not (tmp_path / 'dir/big.bin').exists()
+        assert partial_file.downloaded_size == len(b'firstsecond')
+
+        partial_file.complete()
+        assert (tmp_path / 'dir/big.bin').read_bytes() == b'firstsecond'
+        assert [path.name for path in (tmp_path / 'dir').iterdir()] == ['big.bin']
+
+    def test_chunks_are_persisted_as_they_arrive(self, tmp_path: Path):
+        partial_file = FileWriter.partial_file_in_sub_path(tmp_path, Path('big.bin'))
+
+        def interrupted_stream():
+            yield b'received'
+            raise ConnectionError('Connection reset')
+
+        with pytest.raises(ConnectionError):
+            partial_file.append(interrupted_stream())
+
+        assert partial_file.downloaded_size == len(b'received')
+        assert FileWriter.partial_file_in_sub_path(tmp_path, Path('big.bin')).downloaded_size == len(b'received')
+
+    def test_restart(self, tmp_path: Path):
+        partial_file = FileWriter.partial_file_in_sub_path(tmp_path, Path('big.bin'))
+        partial_file.append([b'stale'])
+
+        partial_file.restart()
+
+        assert partial_file.downloaded_size == 0
+
+
+class TestGitBlobHash:
+    # `git hash-object` of 'hello\n', and of an empty file
+    HELLO_SHA = 'ce013625030ba8dba906f756967f9e9ca394464a'
+    EMPTY_SHA = 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+
+    def test_same_as_git(self, tmp_path: Path):
+        (tmp_path / 'hello.txt').write_bytes(b'hello\n')
+        (tmp_path / 'empty.txt').write_bytes(b'')
+
+        assert GitBlobHash.of_bytes(b'hello\n') == self.HELLO_SHA
+        assert GitBlobHash.of_file(tmp_path / 'hello.txt') == self.HELLO_SHA
+        assert GitBlobHash.of_file(tmp_path / 'empty.txt') == self.EMPTY_SHA
+
+    def test_chunks_are_hashed_as_they_are_consumed(self):
+        blob_hash = GitBlobHash(len(b'hello\n'))
+
+        assert [*blob_hash.hashed([b'hel', b'lo\n'])] == [b'hel', b'lo\n']
+        assert blob_hash.hexdigest() == self.HELLO_SHA
+
+    def test_chunk_of_files(self, tmp_path: Path):
+        (tmp_path / 'hello.txt').write_bytes(b'hello\n')
+        (tmp_path / 'now_a_dir').mkdir()
+
+        assert git_blob_shas([tmp_path / 'hello.txt', tmp_path / 'missing.txt', tmp_path / 'now_a_dir']) == [
+            self.HELLO_SHA, None, None]
+
+
+class TestConfigCache:
+    @pytest.fixture
+    def config_file(self, tmp_path: Path):
+        config_file = tmp_path / 'config.yaml'
+        config_file.write_text('SomeKey: 1\n')
+        return config_file
+
+    @pytest.fixture
+    def config_cache(self, tmp_path: Path):
+        return ConfigCache(tmp_path / 'cache' / 'config.cache', FileWriter())
+
+    def test_empty_cache(self, config_file: Path, config_cache: ConfigCache):
+        assert config_cache.get(config_file) is None
+
+    def test_cached_config_is_returned_while_file_is_unchanged(self, config_file: Path, config_cache: ConfigCache):
+        config_cache.put(config_file, {'SomeKey': 1})
+        assert config_cache.get(config_file) == {'SomeKey': 1}
+
+    def test_file_changed_then_invalidate(self, config_file: Path, config_cache: ConfigCache):
+        config_cache.put(config_file, {'SomeKey': 1})
+        config_file.write_text('SomeKey: 22\n')
+        assert config_cache.get(config_file) is None
+
+    def test_file_touched_but_same_content_then_still_valid(self, config_file: Path, config_cache: ConfigCache):
+        config_cache.put(config_file, {'SomeKey': 1})
+        stat = config_file.stat()
+        os.utime(str(config_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert config_cache.get(config_file) == {'SomeKey': 1}
+
+    def test_cached_under_another_schema_then_invalidate(self, config_file: Path, config_cache: ConfigCache):
+        config_cache.put(config_file, {'SomeKey': 1}, schema_version='OLD_SCHEMA')
+        assert config_cache.get(config_file, schema_version='NEW_SCHEMA') is None
+        assert config_cache.get(config_file, schema_version='OLD_SCHEMA') == {'SomeKey': 1}
+
+    def test_corrupted_cache_is_ignored(self, tmp_path: Path, config_file: Path):
+        cache_file = tmp_path / 'config.cache'
+        cache_file.write_bytes(b'not marshal data')
+        assert ConfigCache(cache_file, FileWriter()).get(config_file) is None
@@ -0,0 +1,114 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from kata.data.io.git import GitCli, PartialClone, GitFile
+from kata.domain.exceptions import GitError
+
+
+def missing_objects(clone_dir: Path):
+    output = subprocess.run(['git', 'rev-list', '--objects', '--missing=print', '--all'],
+                            cwd=clone_dir, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    return [line for line in output.splitlines() if line.startswith('?')]
+
+
+@pytest.fixture
+def git():
+    return GitCli()
+
+
+@pytest.fixture
+def partial_clone(tmp_path: Path, git, bare_git_repo):
+    bare_git_repo.commit({'java/junit5/pom.xml': 'junit5',
+                          'java/junit5/src/Kata.java': 'class Kata {}',
+                          'java/hamcrest/pom.xml': 'hamcrest',
+                          'rust/Cargo.toml': 'rust'})
+    return PartialClone(tmp_path / 'clones', git, bare_git_repo.url_template)
+
+
+@pytest.fixture
+def clone_dir(tmp_path: Path, bare_git_repo):
+    return tmp_path / 'clones' / bare_git_repo.USER / bare_git_repo.REPO
+
+
+class TestPartialClone:
+    def test_clone_without_any_file_content(self, partial_clone: PartialClone, bare_git_repo, clone_dir):
+        partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+        assert len(missing_objects(clone_dir)) == 4
+
+    def test_is_cloned(self, partial_clone: PartialClone, bare_git_repo):
+        assert not partial_clone.is_cloned(bare_git_repo.USER, bare_git_repo.REPO)
+        partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+        assert partial_clone.is_cloned(bare_git_repo.USER, bare_git_repo.REPO)
+
+    def test_list_files_recursively(self, partial_clone: PartialClone, bare_git_repo):
+        commit = partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+
+        files = partial_clone.list_files(bare_git_repo.USER, bare_git_repo.REPO, commit, 'java/junit5')
+
+        assert [file.path for file in files] == ['java/junit5/pom.xml', 'java/junit5/src/Kata.java']
+        assert all(isinstance(file, GitFile) and len(file.sha) == 40 for file in files)
+
+    def test_listing_does_not_fetch_file_contents(self, partial_clone: PartialClone, bare_git_repo, clone_dir):
+        commit = partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+        partial_clone.list_files(bare_git_repo.USER, bare_git_repo.REPO, commit, '')
+        assert len(missing_objects(clone_dir)) == 4
+
+    def test_sparse_checkout_only_fetches_requested_files(self, partial_clone: PartialClone, bare_git_repo, clone_dir):
+        # Given: An up-to-date clone
+        commit = partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+
+        # When: Checking out the 'junit5' template
+        with partial_clone.checked_out(bare_git_repo.USER, bare_git_repo.REPO, commit,
+                                       ['java/junit5/pom.xml', 'java/junit5/src/Kata.java']) as checkout_dir:
+            checked_out_files = sorted(str(path.relative_to(checkout_dir))
+                                       for path in checkout_dir.rglob('*')
+                                       if path.is_file() and '.git' not in path.parts)
+
+        # Then: Only its files were checked out, and other contents are still missing
+        assert checked_out_files == ['java/junit5/pom.xml', 'java/junit5/src/Kata.java']
+        assert len(missing_objects(clone_dir)) == 2
+
+    def test_paths_with_glob_characters_are_checked_out_literally(self, git, tmp_path: Path, bare_git_repo):
+        # Given: File names which would be patterns in a sparse-checkout, next to files they would match
+        bare_git_repo.commit({'docs/[draft].md': 'draft', 'docs/d.md': 'd',
+                              'docs/*.txt': 'star', 'docs/notes.txt': 'notes',
+                              'docs/#1': 'hash', 'docs/trailing ': 'space'})
+        partial_clone = PartialClone(tmp_path / 'clones', git, bare_git_repo.url_template)
+        commit = partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+
+        # When: Checking out only these files
+        with partial_clone.checked_out(bare_git_repo.USER, bare_git_repo.REPO, commit,
+                                       ['docs/[draft].md', 'docs/*.txt', 'docs/#1', 'docs/trailing ']) as checkout_dir:
+            checked_out_files = sorted(str(path.relative_to(checkout_dir))
+                                       for path in checkout_dir.rglob('*')
+                                       if path.is_file() and '.git' not in path.parts)
+
+        # Then: Exactly them were checked out
+        assert checked_out_files == ['docs/#1', 'docs/*.txt', 'docs/[draft].md', 'docs/trailing ']
+
+    def test_subsequent_runs_fetch_new_commits(self, tmp_path: Path, git, partial_clone: PartialClone, bare_git_repo):
+        # Given: A clone made by a previous run, then a new commit on the remote
+        first_commit = partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+        bare_git_repo.commit({'rust/Cargo.toml': 'rust updated'})
+
+        # When: Using the clone in a new run
+        new_run = PartialClone(tmp_path / 'clones', git, bare_git_repo.url_template)
+        latest_commit = new_run.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+
+        # Then: New commit was fetched
+        assert latest_commit != first_commit
+        assert latest_commit == git.run('rev-parse', 'main', cwd=bare_git_repo.bare_dir).strip()
+
+    def test_repo_is_fetched_only_once_per_run(self, git: GitCli, partial_clone: PartialClone, bare_git_repo):
+        partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+        commands_after_first_call = git.commands_run
+
+        partial_clone.latest_commit(bare_git_repo.USER, bare_git_repo.REPO)
+
+        assert git.commands_run == commands_after_first_call + 1  # 'rev-parse' only
+
+    def test_unknown_repo(self, partial_clone: PartialClone):
+        with pytest.raises(GitError):
+            partial_clone.latest_commit('frank', 'does-not-exist')
@@ -0,0 +1,143 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from kata.data.io.file import FileReader, FileWriter
+from kata.data.io.hedging import LatencyStats, HedgedRequests
+
+
+@pytest.fixture
+def latency_stats(tmp_path: Path):
+    return LatencyStats(tmp_path / 'latencies.json', FileReader(), FileWriter())
+
+
+@pytest.fixture
+def hedged_requests(latency_stats):
+    return HedgedRequests(latency_stats, ThreadPoolExecutor(10), default_hedge_delay=0.05)
+
+
+def answer_after(seconds, answer):
+    def attempt():
+        time.sleep(seconds)
+        return answer
+
+    return attempt
+
+
+def fail_with(error):
+    def attempt():
+        raise error
+
+    return attempt
+
+
+class TestLatencyStats:
+    def test_percentiles(self, latency_stats: LatencyStats):
+        for latency_ms in range(1, 101):
+            latency_stats.record('http://endpoint', latency_ms / 1000)
+
+        assert latency_stats.percentile('http://endpoint', 50) == pytest.approx(0.051)
+        assert latency_stats.percentile('http://endpoint', 95) == pytest.approx(0.096)
+        assert latency_stats.percentile('http://unknown', 95) is None
+
+    def test_only_keep_most_recent_samples(self, tmp_path: Path):
+        latency_stats = LatencyStats(None, FileReader(), FileWriter(), max_samples_per_endpoint=3)
+        for latency in [10, 10, 1, 1, 1]:
+            latency_stats.record('http://endpoint', latency)
+
+        assert latency_stats.sample_count('http://endpoint') == 3
+        assert latency_stats.percentile('http://endpoint', 95) == 1
+
+    def test_fastest_first_and_unknown_endpoints_before_all(self, latency_stats: LatencyStats):
+        latency_stats.record('http://slow', 2)
+        latency_stats.record('http://fast', 1)
+
+        assert latency_stats.fastest_first(['http://slow', 'http://fast', 'http://unknown']) == \
+               ['http://unknown', 'http://fast', 'http://slow']
+
+    def test_persisted_between_runs(self, tmp_path: Path):
+        # Given: Stats recorded and saved during a previous run
+        stats_file = tmp_path / 'sub_dir' / 'latencies.json'
+        previous_run = LatencyStats(stats_file, FileReader(), FileWriter())
+        previous_run.record('http://endpoint', 0.5)
+        previous_run.save()
+
+        # When: Loading the stats in a new run
+        new_run = LatencyStats(stats_file, FileReader(), FileWriter())
+
+        # Then: Stats from the previous run are available
+        assert new_run.percentile('http://endpoint', 50) == 0.5
+
+    def test_corrupt_stats_file_then_start_over(self, tmp_path: Path):
+        stats_file = tmp_path / 'latencies.json'
+        stats_file.write_text('{"http://endpoint": [0.')
+
+        latency_stats = LatencyStats(stats_file, FileReader(), FileWriter())
+
+        assert latency_stats.sample_count('http://endpoint') == 0
+
+    def test_nothing_recorded_then_nothing_written(self, tmp_path: Path):
+        stats_file = tmp_path / 'latencies.json'
+
+        LatencyStats(stats_file, FileReader(), FileWriter()).save()
+
+        assert not stats_file.exists()
+
+
+class TestHedgedRequests:
+    def test_fastest_endpoint_answers_before_hedge_delay_then_no_hedge(self,
+                                                                       latency_stats: LatencyStats,
+                                                                       hedged_requests: HedgedRequests):
+        # Given: 'http://fast' is historically the fastest
+        latency_stats.record('http://fast', 0.001)
+        latency_stats.record('http://slow', 1)
+        hedge_sent = []
+
+        def slow_attempt():
+            hedge_sent.append(True)
+            return 'SLOW'
+
+        # When: Racing both endpoints
+        result = hedged_requests.first_successful([('http://slow', slow_attempt),
+                                                   ('http://fast', answer_after(0, 'FAST'))])
+
+        # Then: Only the fastest was queried
+        assert result == 'FAST'
+        assert not hedge_sent
+
+    def test_no_response_within_hedge_delay_then_hedge_wins(self,
+                                                            latency_stats: LatencyStats,
+                                                            hedged_requests: HedgedRequests):
+        # Given: 'http://usually-fast' is historically the fastest, but is stuck this time
+        latency_stats.record('http://usually-fast', 0.001)
+        latency_stats.record('http://mirror', 1)
+
+        # When: Racing both endpoints
+        start = time.monotonic()
+        result = hedged_requests.first_successful([('http://usually-fast', answer_after(2, 'STUCK')),
+                                                   ('http://mirror', answer_after(0, 'MIRROR'))])
+
+        # Then: Hedge to the mirror answered first
+        assert result == 'MIRROR'
+        assert time.monotonic() - start < 1
+
+    def test_failure_then_immediately_try_next(self, hedged_requests: HedgedRequests):
+        result = hedged_requests.first_successful([('http://broken', fail_with(ConnectionError())),
+                                                   ('http://mirror', answer_after(0, 'MIRROR'))])
+        assert result == 'MIRROR'
+
+    def test_all_fail_then_raise_error_from_fastest_endpoint(self,
+                                                            latency_stats: LatencyStats,
+                                                            hedged_requests: HedgedRequests):
+        latency_stats.record('http://fast', 0.001)
+        latency_stats.record('http://slow', 1)
+
+        with pytest.raises(ConnectionError, match='fast'):
+            hedged_requests.first_successful([('http://slow', fail_with(ConnectionError('slow'))),
+                                              ('http://fast', fail_with(ConnectionError('fast')))])
+
+    def test_latencies_are_recorded(self, latency_stats: LatencyStats, hedged_requests: HedgedRequests):
+        hedged_requests.first_successful([('http://endpoint', answer_after(0, 'OK'))])
+        assert latency_stats.sample_count('http://endpoint') == 1
@@ -0,0 +1,675 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from kata.data.io.coordination import SingleFlight, SharedRateLimitBudget
+from kata.data.io.file import FileReader, FileWriter, GitBlobHash
+from kata.data.io.network import GithubApi, UrlRewrite, Endpoint, TokenPool
+from kata.data.io.watchdog import RequestWatchdog
+from kata.diagnostics import metrics
+from kata.domain.exceptions import ApiLimitReached, ApiNotFound, ApiThrottled, IncompleteDownload, IntegrityError
+
+
+@pytest.fixture
+def mock_requests():
+    mocked_requests = MagicMock()
+    mocked_requests.get.return_value.status_code = 200
+    mocked_requests.get.return_value.headers = {}
+    return mocked_requests
+
+
+def mock_response(status_code=200, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+def requested_url(mock_requests: MagicMock):
+    args, _kwargs = mock_requests.get.call_args
+    return args[0]
+
+
+class TestGithubApi:
+    class TestEndpoints:
+        def test_public_github_by_default(self, mock_requests):
+            # Given: An api w/o any endpoint configuration
+            api = GithubApi(['TOKEN'])
+            api._requests = mock_requests
+
+            # When: Fetching contents
+            api.contents('frank', 'awesome-repo', 'java')
+
+            # Then: Public Github Api is queried
+            assert requested_url(mock_requests) == 'https://api.github.com/repos/frank/awesome-repo/contents/java'
+
+        def test_configured_api_base_url(self, mock_requests):
+            # Given: An api pointing at a mirror
+            api = GithubApi(['TOKEN'], api_base_url='http://mirror.local/api/')
+            api._requests = mock_requests
+
+            # When: Fetching contents
+            api.contents('frank', 'awesome-repo', 'java')
+
+            # Then: Mirror is queried
+            assert requested_url(mock_requests) == 'http://mirror.local/api/repos/frank/awesome-repo/contents/java'
+
+        def test_download_url_is_rebased_on_configured_raw_base_url(self, mock_requests):
+            # Given: An api pointing at a raw mirror
+            api = GithubApi(['TOKEN'], raw_base_url='http://mirror.local/raw')
+            api._requests = mock_requests
+
+            # When: Downloading a file whose 'download_url' points at the public raw host
+            api.download_raw_file('https://raw.githubusercontent.com/frank/awesome-repo/master/README.md')
+
+            # Then: Raw mirror is queried
+            assert requested_url(mock_requests) == 'http://mirror.local/raw/frank/awesome-repo/master/README.md'
+
+        def test_url_rewrites_apply_to_all_urls(self, mock_requests):
+            # Given: An api with a rewrite rule
+            api = GithubApi(['TOKEN'], url_rewrites=[UrlRewrite(from_prefix='https://raw.githubusercontent.com/frank/',
+                                                              to_prefix='http://localhost:8000/')])
+            api._requests = mock_requests
+
+            # When: Downloading a file matching the rule
+            api.download_raw_file('https://raw.githubusercontent.com/frank/awesome-repo/master/README.md')
+
+            # Then: Url is rewritten
+            assert requested_url(mock_requests) == 'http://localhost:8000/awesome-repo/master/README.md'
+
+        def test_url_not_matching_any_rewrite_is_left_untouched(self, mock_requests):
+            # Given: An api with a rewrite rule not matching the download url
+            api = GithubApi(['TOKEN'], url_rewrites=[UrlRewrite(from_prefix='https://somewhere.else/',
+                                                              to_prefix='http://localhost:8000/')])
+            api._requests = mock_requests
+
+            # When: Downloading a file
+            api.download_raw_file('https://raw.githubusercontent.com/frank/awesome-repo/master/README.md')
+
+            # Then: Url is left untouched
+            assert requested_url(mock_requests) == \
+                   'https://raw.githubusercontent.com/frank/awesome-repo/master/README.md'
+
+    class TestMirrors:
+        def test_request_is_sent_to_mirror_with_same_path(self, mock_requests):
+            # Given: An api w/ a mirror, and a hedging strategy only ever using the mirror
+            class OnlyUseLastEndpoint:
+                @staticmethod
+                def first_successful(attempts):
+                    _endpoint, attempt = attempts[-1]
+                    return attempt()
+
+            api = GithubApi(['TOKEN'],
+                            mirrors=[Endpoint(api_base_url='http://mirror.local/api',
+                                              raw_base_url='http://mirror.local/raw')],
+                            hedged_requests=OnlyUseLastEndpoint())
+            api._requests = mock_requests
+
+            # When: Fetching contents and downloading a file
+            api.contents('frank', 'awesome-repo', 'java')
+            contents_url = requested_url(mock_requests)
+            api.download_raw_file('https://raw.githubusercontent.com/frank/awesome-repo/master/README.md')
+            raw_url = requested_url(mock_requests)
+
+            # Then: Mirror was queried for both
+            assert contents_url == 'http://mirror.local/api/repos/frank/awesome-repo/contents/java'
+            assert raw_url == 'http://mirror.local/raw/frank/awesome-repo/master/README.md'
+
+        def test_listings_and_raw_downloads_are_timed_separately(self, mock_requests):
+            # Given: A hedging strategy recording the endpoints it is given
+            class RecordEndpoints:
+                def __init__(self):
+                    self.endpoints = []
+
+                def first_successful(self, attempts):
+                    self.endpoints.append([endpoint for endpoint, _attempt in attempts])
+                    return attempts[0][1]()
+
+            hedged_requests = RecordEndpoints()
+            api = GithubApi(['TOKEN'],
+                            api_base_url='http://main.local/api',
+                            raw_base_url='http://main.local/raw',
+                            mirrors=[Endpoint(api_base_url='http://mirror.local/api',
+                                              raw_base_url='http://mirror.local/raw')],
+                            hedged_requests=hedged_requests)
+            api._requests = mock_requests
+
+            # When: Fetching contents and downloading a file
+            api.contents('frank', 'awesome-repo', 'java')
+            api.download_raw_file('http://main.local/raw/frank/awesome-repo/master/README.md')
+
+            # Then: Each is timed against the base url actually serving it
+            assert hedged_requests.endpoints == [['http://main.local/api', 'http://mirror.local/api'],
+                                                 ['http://main.local/raw', 'http://mirror.local/raw']]
+
+
+    class TestTokenRotation:
+        def test_retire_exhausted_token_and_retry_with_next_one(self, mock_requests):
+            # Given: 'EXHAUSTED' has the most remaining calls last time it was used, but is exhausted now
+            api = GithubApi(['EXHAUSTED', 'FRESH'])
+            api._requests = mock_requests
+            api._token_pool.update('EXHAUSTED', {'X-RateLimit-Remaining': '4000'})
+            api._token_pool.update('FRESH', {'X-RateLimit-Remaining': '3000'})
+
+            def respond_depending_on_token(_url, headers, **_kwargs):
+                if headers['Authorization'] == 'token EXHAUSTED':
+                    return mock_response(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '9999999999'})
+                return mock_response(200, {'X-RateLimit-Remaining': '2999'})
+
+            mock_requests.get.side_effect = respond_depending_on_token
+
+            # When: Fetching contents
+            api.contents('frank', 'awesome-repo')
+
+            # Then: Request was retried with the other token, and no error was raised
+            used_tokens = [kwargs['headers']['Authorization'] for _args, kwargs in mock_requests.get.call_args_list]
+            assert used_tokens == ['token EXHAUSTED', 'token FRESH']
+
+        def test_every_token_exhausted_then_raise_instead_of_retrying_forever(self, mock_requests):
+            # Given: Every token is exhausted, with a reset time already past according to the local clock
+            api = GithubApi(['TOKEN_1', 'TOKEN_2'])
+            api._requests = mock_requests
+            mock_requests.get.return_value = mock_response(403, {'X-RateLimit-Remaining': '0',
+                                                                 'X-RateLimit-Reset': '0'})
+
+            # When: Fetching contents
+            # Then: Each token is tried once, then the limit is reported
+            with pytest.raises(ApiLimitReached):
+                api.contents('frank', 'awesome-repo')
+            assert mock_requests.get.call_count == 2
+
+
+    def test_secondary_rate_limit_tells_how_long_to_wait(self, mock_requests):
+        api = GithubApi([])
+        api._requests = mock_requests
+        mock_requests.get.return_value = mock_response(403, {'Retry-After': '30'})
+
+        with pytest.raises(ApiThrottled) as throttled:
+            api.contents('frank', 'awesome-repo')
+
+        assert throttled.value.retry_after == 30
+
+    def test_missing_path_raises_not_found(self, mock_requests):
+        api = GithubApi([])
+        api._requests = mock_requests
+        mock_requests.get.return_value = mock_response(404)
+
+        with pytest.raises(ApiNotFound):
+            api.contents('frank', 'awesome-repo', 'cobol')
+
+    def test_record_metrics(self, mock_requests):
+        api = GithubApi(['TOKEN'])
+        api._requests = mock_requests
+        mock_requests.get.return_value = mock_response(200, {'X-RateLimit-Remaining': '4999'})
+        mock_requests.get.return_value.content = b'[]'
+
+        registry = metrics.start_collecting()
+        try:
+            api.contents('frank', 'awesome-repo')
+        finally:
+            metrics.stop_collecting()
+
+        rendered = registry.render()
+        assert 'kata_http_requests_total{endpoint="contents",host="api.github.com",status="200"} 1' in rendered
+        assert 'kata_downloaded_bytes_total{host="api.github.com"} 2' in rendered
+        assert 'kata_rate_limit_remaining{token=' in rendered
+        assert 'TOKEN' not in rendered
+
+    def test_raw_files_are_recorded_as_raw_whatever_their_path(self, mock_requests):
+        # Given: A raw file whose path contains '/contents'
+        api = GithubApi([])
+        api._requests = mock_requests
+        mock_requests.get.return_value = mock_response(200)
+        mock_requests.get.return_value.content = b'x'
+
+        registry = metrics.start_collecting()
+        try:
+            api.download_raw_file('https://raw.githubusercontent.com/frank/awesome-repo/master/contents/a.md')
+        finally:
+            metrics.stop_collecting()
+
+        # Then: It is classified by the endpoint serving it
+        assert 'endpoint="raw"' in registry.render()
+        assert 'endpoint="contents"' not in registry.render()
+
+    def test_remaining_rate_limit(self, tmp_path: Path, mock_requests):
+        budget = SharedRateLimitBudget(tmp_path / 'budget.json', FileReader(), FileWriter(), clock=lambda: 1000)
+        api = GithubApi(['TOKEN_1', 'TOKEN_2'], shared_budget=budget)
+        assert api.remaining_rate_limit() is None
+
+        budget.observe('TOKEN_1', {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '2000'})
+        assert api.remaining_rate_limit() is None
+
+        budget.observe('TOKEN_2', {'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '2000'})
+        assert api.remaining_rate_limit() == 15
+
+    def test_requests_are_tracked_by_watchdog(self, mock_requests):
+        watchdog = RequestWatchdog(10.0, lambda _message: None)
+        api = GithubApi([], watchdog=watchdog)
+        api._requests = mock_requests
+        in_flight_during_request = []
+
+        def get(url, **_kwargs):
+            in_flight_during_request.extend(watchdog.in_flight())
+            return mock_response(200)
+
+        mock_requests.get.side_effect = get
+        api.contents('frank', 'awesome-repo')
+        watchdog.stop()
+
+        assert [request.url for request in in_flight_during_request] == [
+            'https://api.github.com/repos/frank/awesome-repo/contents']
+        assert watchdog.in_flight() == []
+
+    class TestResumableDownloads:
+        URL = 'https://raw.githubusercontent.com/frank/awesome-repo/master/big.bin'
+        CONTENT = bytes(range(256)) * 4
+
+        @pytest.fixture
+        def partial_file(self, tmp_path: Path):
+            return FileWriter.partial_file_in_sub_path(tmp_path, Path('big.bin'))
+
+        def serve(self, mock_requests, supports_range=True, interrupted_after=None):
+            """
+            :param interrupted_after: Bytes sent before the connection drops, on the first request only
+            """
+            range_headers = []
+
+            def get(_url, headers, **_kwargs):
+                range_headers.append(headers.get('Range'))
+                offset = int(headers['Range'][len('bytes='):-1]) if supports_range and 'Range' in headers else 0
+                body = self.CONTENT[offset:]
+                response = mock_response(206 if offset else 200)
+
+                def iter_content(chunk_size):
+                    for start in range(0, len(body), chunk_size):
+                        if len(range_headers) == 1 and interrupted_after is not None \
+                                and offset + start >= interrupted_after:
+                            raise ConnectionError('Connection reset')
+                        yield body[start:start + chunk_size]
+
+                response.iter_content.side_effect = iter_content
+                return response
+
+            mock_requests.get.side_effect = get
+            return range_headers
+
+        def test_streamed_to_the_partial_file(self, mock_requests, partial_file):
+            api = GithubApi([])
+            api._requests = mock_requests
+            self.serve(mock_requests)
+
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            partial_file.complete()
+
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+        def test_interrupted_download_is_resumed(self, mock_requests, partial_file):
+            # Given: The connection drops after 256 bytes
+            api = GithubApi([])
+            api._requests = mock_requests
+            api.STREAM_CHUNK_SIZE = 128
+            range_headers = self.serve(mock_requests, interrupted_after=256)
+
+            # When: Downloading
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            partial_file.complete()
+
+            # Then: Retried from where it stopped
+            assert range_headers == [None, 'bytes=256-']
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+        def test_resumed_from_a_previous_run(self, mock_requests, partial_file):
+            partial_file.append([self.CONTENT[:100]])
+            api = GithubApi([])
+            api._requests = mock_requests
+            range_headers = self.serve(mock_requests)
+
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            partial_file.complete()
+
+            assert range_headers == ['bytes=100-']
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+        def test_range_not_supported_then_start_over(self, mock_requests, partial_file):
+            partial_file.append([self.CONTENT[:100]])
+            api = GithubApi([])
+            api._requests = mock_requests
+            self.serve(mock_requests, supports_range=False)
+
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            partial_file.complete()
+
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+        def test_still_incomplete_after_all_attempts(self, mock_requests, partial_file):
+            # Given: The file is smaller than listed
+            api = GithubApi([])
+            api._requests = mock_requests
+            self.serve(mock_requests)
+
+            with pytest.raises(IncompleteDownload):
+                api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT) + 1)
+
+            # Then: What was downloaded is kept, for the next run
+            assert partial_file.downloaded_size == len(self.CONTENT)
+
+        def test_partial_file_larger_than_listed_then_start_over(self, mock_requests, partial_file):
+            # Given: A previous run downloaded more than the file is now listed with
+            partial_file.append([self.CONTENT + b'REMOVED SINCE'])
+            api = GithubApi([])
+            api._requests = mock_requests
+            range_headers = self.serve(mock_requests)
+
+            # When: Downloading
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            partial_file.complete()
+
+            # Then: The whole file is downloaded again, without asking for a range past its end
+            assert range_headers == [None]
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+        def test_range_not_satisfiable_then_start_over(self, mock_requests, partial_file):
+            # Given: The server no longer has the range already downloaded
+            partial_file.append([self.CONTENT[:100]])
+            api = GithubApi([])
+            api._requests = mock_requests
+            range_headers = []
+
+            def get(_url, headers, **_kwargs):
+                range_headers.append(headers.get('Range'))
+                if 'Range' in headers:
+                    response = mock_response(416)
+                    # As 'requests.HTTPError'
+                    response.raise_for_status.side_effect = OSError('416 Client Error: Range Not Satisfiable')
+                    return response
+                response = mock_response(200)
+                response.iter_content.return_value = [self.CONTENT]
+                return response
+
+            mock_requests.get.side_effect = get
+
+            # When: Downloading
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            partial_file.complete()
+
+            # Then: Started over from the beginning
+            assert range_headers == ['bytes=100-', None]
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+        def test_tracked_by_watchdog_until_fully_received(self, mock_requests, partial_file):
+            # Given: A watchdog, and a file whose body is being received
+            watchdog = RequestWatchdog(10.0, lambda _message: None)
+            api = GithubApi([], watchdog=watchdog)
+            api._requests = mock_requests
+            in_flight_while_receiving = []
+            response = mock_response(200)
+
+            def iter_content(_chunk_size):
+                in_flight_while_receiving.extend(watchdog.in_flight())
+                yield self.CONTENT
+
+            response.iter_content.side_effect = iter_content
+            mock_requests.get.return_value = response
+
+            # When: Downloading
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            watchdog.stop()
+
+            # Then: The request is in flight while its body is received, and no longer once done
+            assert [request.url for request in in_flight_while_receiving] == [self.URL]
+            assert watchdog.in_flight() == []
+
+        def test_stalled_download_times_out(self, mock_requests, partial_file):
+            api = GithubApi([])
+            api._requests = mock_requests
+            self.serve(mock_requests)
+
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+
+            _args, kwargs = mock_requests.get.call_args
+            assert kwargs['timeout'] == (GithubApi.CONNECT_TIMEOUT_IN_SECONDS, GithubApi.READ_TIMEOUT_IN_SECONDS)
+
+        def test_never_compressed_so_ranges_are_those_of_the_file(self, mock_requests, partial_file):
+            partial_file.append([self.CONTENT[:100]])
+            api = GithubApi([])
+            api._requests = mock_requests
+            self.serve(mock_requests)
+
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+
+            _args, kwargs = mock_requests.get.call_args
+            assert kwargs['headers']['Accept-Encoding'] == 'identity'
+            assert kwargs['headers']['Range'] == 'bytes=100-'
+
+        def test_response_is_closed_when_invalid(self, mock_requests, partial_file):
+            # Given: A streamed file that isn't found
+            api = GithubApi([])
+            api._requests = mock_requests
+            response = mock_response(404)
+            mock_requests.get.return_value = response
+
+            # When: Downloading
+            with pytest.raises(ApiNotFound):
+                api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+
+            # Then: Its connection is released
+            response.close.assert_called_once()
+
+        def test_received_bytes_are_recorded(self, mock_requests, partial_file):
+            # Given: A 'Content-Length' that isn't the size of the file, as for a compressed body
+            api = GithubApi([])
+            api._requests = mock_requests
+            self.serve(mock_requests)
+            get = mock_requests.get.side_effect
+
+            def get_with_content_length(url, headers, **kwargs):
+                response = get(url, headers, **kwargs)
+                response.headers = {'Content-Length': '10'}
+                return response
+
+            mock_requests.get.side_effect = get_with_content_length
+
+            # When: Downloading
+            registry = metrics.start_collecting()
+            try:
+                api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT))
+            finally:
+                metrics.stop_collecting()
+
+            # Then: The bytes actually received are recorded
+            assert f'kata_downloaded_bytes_total{{host="raw.githubusercontent.com"}} {len(self.CONTENT)}' \
+                   in registry.render()
+
+    class TestIntegrity:
+        URL = 'https://raw.githubusercontent.com/frank/awesome-repo/master/hello.txt'
+        CONTENT = b'hello\n'
+        # `git hash-object` of CONTENT
+        SHA = 'ce013625030ba8dba906f756967f9e9ca394464a'
+
+        @pytest.fixture
+        def api(self, mock_requests):
+            api = GithubApi([])
+            api._requests = mock_requests
+            return api
+
+        @staticmethod
+        def serve_text(mock_requests, *bodies: bytes):
+            responses = []
+            for body in bodies:
+                response = mock_response()
+                response.content = body
+                response.text = body.decode(errors='replace')
+                responses.append(response)
+            mock_requests.get.side_effect = responses
+
+        @staticmethod
+        def serve_stream(mock_requests, body: bytes):
+            range_headers = []
+
+            def get(_url, headers, **_kwargs):
+                range_headers.append(headers.get('Range'))
+                offset = int(headers['Range'][len('bytes='):-1]) if 'Range' in headers else 0
+                response = mock_response(206 if offset else 200)
+                response.iter_content.return_value = [body[offset:]]
+                return response
+
+            mock_requests.get.side_effect = get
+            return range_headers
+
+        def test_file_matching_its_sha(self, api, mock_requests):
+            self.serve_text(mock_requests, self.CONTENT)
+
+            assert api.download_raw_file(self.URL, self.SHA) == self.CONTENT
+
+        def test_corrupted_file_is_downloaded_again(self, api, mock_requests):
+            # Given: The first response is corrupted
+            self.serve_text(mock_requests, b'hellO\n', self.CONTENT)
+
+            # When: Downloading
+            contents = api.download_raw_file(self.URL, self.SHA)
+
+            # Then: Retried until the contents match
+            assert contents == self.CONTENT
+            assert mock_requests.get.call_count == 2
+
+        def test_binary_file_is_returned_exactly_as_verified(self, api, mock_requests):
+            # Given: A file that isn't valid text
+            body = b'\x89PNG\r\n\x1a\n\xff'
+            self.serve_text(mock_requests, body)
+
+            # Then: What was verified is what is returned
+            assert api.download_raw_file(self.URL, GitBlobHash.of_bytes(body)) == body
+
+        def test_still_corrupted_after_all_attempts(self, api, mock_requests):
+            self.serve_text(mock_requests, *[b'hellO\n'] * GithubApi.DOWNLOAD_ATTEMPTS)
+
+            with pytest.raises(IntegrityError):
+                api.download_raw_file(self.URL, self.SHA)
+
+        def test_streamed_file_is_hashed_across_resumes(self, api, mock_requests, tmp_path: Path):
+            # Given: The start of the file was downloaded by a previous run
+            partial_file = FileWriter.partial_file_in_sub_path(tmp_path, Path('hello.txt'))
+            partial_file.append([self.CONTENT[:3]])
+            range_headers = self.serve_stream(mock_requests, self.CONTENT)
+
+            # When: Resuming the download
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT), self.SHA)
+            partial_file.complete()
+
+            # Then: The whole file matches, only the rest was downloaded
+            assert range_headers == ['bytes=3-']
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+        def test_corrupted_partial_file_starts_over(self, api, mock_requests, tmp_path: Path):
+            # Given: The start of the file downloaded by a previous run is corrupted
+            partial_file = FileWriter.partial_file_in_sub_path(tmp_path, Path('hello.txt'))
+            partial_file.append([b'HEL'])
+            range_headers = self.serve_stream(mock_requests, self.CONTENT)
+
+            # When: Resuming the download
+            api.download_raw_file_to(self.URL, partial_file, len(self.CONTENT), self.SHA)
+            partial_file.complete()
+
+            # Then: Once found not to match, the whole file is downloaded again
+            assert range_headers == ['bytes=3-', None]
+            assert partial_file.file_path.read_bytes() == self.CONTENT
+
+    class TestCoordinationAcrossProcesses:
+        def test_listing_fetched_by_another_process_is_reused(self, tmp_path: Path, mock_requests):
+            # Given: Another process just fetched the listing
+            single_flight = SingleFlight(tmp_path, FileReader(), FileWriter())
+            single_flight.run('https://api.github.com/repos/frank/awesome-repo/contents', lambda: ['LISTING'])
+
+            # When: Fetching the same listing
+            api = GithubApi([], single_flight=single_flight)
+            api._requests = mock_requests
+            listing = api.contents('frank', 'awesome-repo')
+
+            # Then: Result is reused without any request
+            assert listing == ['LISTING']
+            mock_requests.get.assert_not_called()
+
+        def test_raw_files_are_not_shared(self, tmp_path: Path, mock_requests):
+            # Given: Single-flight is enabled
+            single_flight = SingleFlight(tmp_path, FileReader(), FileWriter())
+            api = GithubApi([], single_flight=single_flight)
+            api._requests = mock_requests
+            mock_requests.get.return_value = mock_response(200)
+            mock_requests.get.return_value.content = b'CONTENTS'
+
+            # When: Downloading a raw file
+            contents = api.download_raw_file('https://raw.githubusercontent.com/frank/awesome-repo/master/a.txt')
+
+            # Then: Its contents are not persisted for other processes
+            assert contents == b'CONTENTS'
+            assert not list(tmp_path.glob('*.json'))
+
+        def test_token_exhausted_by_another_process_is_skipped(self, tmp_path: Path, mock_requests):
+            # Given: Another process exhausted 'EXHAUSTED'
+            shared_budget = SharedRateLimitBudget(tmp_path / 'budget.json', FileReader(), FileWriter())
+            shared_budget.observe('EXHAUSTED', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '9999999999'})
+
+            # When: Fetching contents
+            api = GithubApi(['EXHAUSTED', 'FRESH'], shared_budget=shared_budget)
+            api._requests = mock_requests
+            api.contents('frank', 'awesome-repo')
+
+            # Then: Only the other token was used
+            _args, kwargs = mock_requests.get.call_args
+            assert mock_requests.get.call_count == 1
+            assert kwargs['headers']['Authorization'] == 'token FRESH'
+
+
+class TestTokenPool:
+    def test_empty_pool(self):
+        pool = TokenPool([])
+        assert not pool
+        assert pool.pick() is None
+
+    def test_pick_token_with_most_remaining_calls(self):
+        pool = TokenPool(['A', 'B', 'C'])
+        pool.update('A', {'X-RateLimit-Remaining': '10'})
+        pool.update('B', {'X-RateLimit-Remaining': '4000'})
+        pool.update('C', {'X-RateLimit-Remaining': '300'})
+        assert pool.pick() == 'B'
+
+    def test_never_used_tokens_are_picked_first(self):
+        pool = TokenPool(['A', 'B'])
+        pool.update('A', {'X-RateLimit-Remaining': '4999'})
+        assert pool.pick() == 'B'
+
+    @pytest.mark.parametrize('reset_in', [120, 2 * TokenPool.DEFAULT_RETIREMENT_IN_SECONDS])
+    def test_exhausted_token_is_retired_until_reset(self, reset_in):
+        # Given: 'A' is exhausted, and resets in a few minutes, or after the default retirement
+        now = 50
+        reset = now + reset_in
+        pool = TokenPool(['A', 'B'], clock=lambda: now)
+        pool.update('A', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(reset)})
+        pool.update('B', {'X-RateLimit-Remaining': '1'})
+
+        # Then: 'A' isn't picked before its reset, even though 'B' has few calls remaining, and is right after it
+        assert pool.pick() == 'B'
+        now = reset - 1
+        assert pool.pick() == 'B'
+        now = reset + 1
+        assert pool.pick() == 'A'
+
+    def test_reset_already_past_then_retired_for_default_duration(self):
+        # Given: 'A' is exhausted, but its reset is already past according to the local clock
+        now = 50
+        pool = TokenPool(['A', 'B'], clock=lambda: now)
+        pool.update('A', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '10'})
+        pool.update('B', {'X-RateLimit-Remaining': '1'})
+
+        # Then: 'A' stays retired for the default duration instead of coming straight back
+        assert pool.pick() == 'B'
+        now = 50 + TokenPool.DEFAULT_RETIREMENT_IN_SECONDS
+        assert pool.pick() == 'A'
+
+    def test_all_tokens_retired_then_raise(self):
+        pool = TokenPool(['A'], clock=lambda: 50)
+        pool.update('A', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '100'})
+        with pytest.raises(ApiLimitReached):
+            pool.pick()
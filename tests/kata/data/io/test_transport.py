@@ -0,0 +1,141 @@
+import base64
+import json
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from kata.data.io.file import FileWriter, FileReader, GitBlobHash
+from kata.data.io.network import GithubApi
+from kata.data.io.transport import RecordingTransport, ReplayTransport, CASSETTE_VERSION
+from kata.domain.exceptions import CassetteMiss, ApiNotFound
+
+CONTENTS_URL = 'https://api.github.com/repos/frank/awesome-repo/contents'
+RAW_URL = 'https://raw.githubusercontent.com/frank/awesome-repo/master/logo.png'
+# Not valid utf-8
+BINARY_BODY = b'\x89PNG\r\n\x1a\n\xff\xfe'
+
+
+def real_response(body: str, status_code=200, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.content = body.encode()
+    response.text = body
+    return response
+
+
+def write_cassette(cassette_file: Path, *interactions: dict):
+    FileWriter.write_json_to_file(cassette_file, {'version': CASSETTE_VERSION, 'interactions': [*interactions]})
+
+
+def interaction(body: bytes, url=CONTENTS_URL, status_code=200, headers=None, elapsed=0.0):
+    return {'url': url, 'status_code': status_code, 'headers': headers or {},
+            'body': base64.b64encode(body).decode('ascii'), 'elapsed': elapsed}
+
+
+@pytest.fixture
+def cassette_file(tmp_path: Path):
+    return tmp_path / 'cassette.json'
+
+
+@pytest.fixture
+def record(cassette_file: Path):
+    def record_responses(responses_by_url: dict):
+        http_client = MagicMock()
+        http_client.get.side_effect = lambda url, headers=None, **_kwargs: responses_by_url[url].pop(0)
+        recording_transport = RecordingTransport(cassette_file, FileWriter(), http_client)
+        api = GithubApi(['SECRET_TOKEN'], transport=recording_transport)
+        for url in responses_by_url:
+            api.contents('frank', 'awesome-repo', url[len(CONTENTS_URL) + 1:])
+        recording_transport.save()
+
+    return record_responses
+
+
+class TestRecordingTransport:
+    def test_record_responses(self, cassette_file: Path, record):
+        record({CONTENTS_URL: [real_response('[]', headers={'X-RateLimit-Remaining': '4999'})]})
+
+        interactions = json.loads(cassette_file.read_text())['interactions']
+        assert len(interactions) == 1
+        assert interactions[0]['url'] == CONTENTS_URL
+        assert interactions[0]['status_code'] == 200
+        assert interactions[0]['headers'] == {'X-RateLimit-Remaining': '4999'}
+        assert base64.b64decode(interactions[0]['body']) == b'[]'
+        assert interactions[0]['elapsed'] >= 0
+
+    def test_auth_token_is_never_recorded(self, cassette_file: Path, record):
+        record({CONTENTS_URL: [real_response('[]')]})
+        assert 'SECRET_TOKEN' not in cassette_file.read_text()
+
+
+class TestReplayTransport:
+    def test_replay_through_api(self, cassette_file: Path, record):
+        # Given: A recorded listing
+        record({CONTENTS_URL: [real_response('[{"name": "java"}]')]})
+
+        # When: Fetching the same listing from the replayed cassette
+        api = GithubApi([], transport=ReplayTransport(cassette_file, FileReader()))
+
+        # Then: Recorded listing is returned
+        assert api.contents('frank', 'awesome-repo') == [{'name': 'java'}]
+
+    def test_binary_body_is_replayed_exactly(self, cassette_file: Path):
+        # Given: A recorded binary file
+        http_client = MagicMock()
+        http_client.get.return_value.status_code = 200
+        http_client.get.return_value.headers = {}
+        http_client.get.return_value.content = BINARY_BODY
+        recording_transport = RecordingTransport(cassette_file, FileWriter(), http_client)
+        GithubApi([], transport=recording_transport).download_raw_file(RAW_URL)
+        recording_transport.save()
+
+        # When: Downloading it from the replayed cassette, checking its sha
+        api = GithubApi([], transport=ReplayTransport(cassette_file, FileReader()))
+
+        # Then: The same bytes are replayed
+        assert api.download_raw_file(RAW_URL, GitBlobHash.of_bytes(BINARY_BODY)) == BINARY_BODY
+
+    def test_replay_cassettes_recorded_as_text(self, cassette_file: Path):
+        FileWriter.write_json_to_file(cassette_file, {'version': 1, 'interactions': [
+            {'url': CONTENTS_URL, 'status_code': 200, 'headers': {}, 'body': '[{"name": "java"}]', 'elapsed': 0}]})
+
+        api = GithubApi([], transport=ReplayTransport(cassette_file, FileReader()))
+
+        assert api.contents('frank', 'awesome-repo') == [{'name': 'java'}]
+
+    def test_replay_errors(self, cassette_file: Path):
+        write_cassette(cassette_file, interaction(b'', url=CONTENTS_URL + '/cobol', status_code=404))
+        api = GithubApi([], transport=ReplayTransport(cassette_file, FileReader()))
+
+        with pytest.raises(ApiNotFound):
+            api.contents('frank', 'awesome-repo', 'cobol')
+
+    def test_same_url_is_replayed_in_order_then_last_one_is_repeated(self, cassette_file: Path):
+        write_cassette(cassette_file, interaction(b'first'), interaction(b'second'))
+        transport = ReplayTransport(cassette_file, FileReader())
+
+        assert [transport.get(CONTENTS_URL).text for _ in range(3)] == ['first', 'second', 'second']
+
+    def test_header_names_are_case_insensitive(self, cassette_file: Path):
+        write_cassette(cassette_file, interaction(b'[]', headers={'x-ratelimit-remaining': '4999'}))
+
+        response = ReplayTransport(cassette_file, FileReader()).get(CONTENTS_URL)
+
+        assert response.headers['X-RateLimit-Remaining'] == '4999'
+        assert 'X-RateLimit-Remaining' in response.headers
+
+    def test_original_timing(self, cassette_file: Path):
+        write_cassette(cassette_file, interaction(b'[]', elapsed=0.1))
+
+        start = time.perf_counter()
+        ReplayTransport(cassette_file, FileReader(), original_timing=True).get(CONTENTS_URL)
+
+        assert time.perf_counter() - start >= 0.1
+
+    def test_request_not_in_cassette(self, cassette_file: Path):
+        write_cassette(cassette_file)
+        with pytest.raises(CassetteMiss):
+            ReplayTransport(cassette_file, FileReader()).get(CONTENTS_URL)
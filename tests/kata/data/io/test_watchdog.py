@@ -0,0 +1,112 @@
+import threading
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from kata.data.io.file import FileReader, FileWriter
+from kata.data.io.watchdog import RequestWatchdog, InFlightRequest, read_in_flight_requests
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRequestWatchdog:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def reports(self) -> List[str]:
+        return []
+
+    @pytest.fixture
+    def state_file(self, tmp_path: Path):
+        return tmp_path / 'inflight' / '1234.json'
+
+    @pytest.fixture
+    def watchdog(self, clock, reports, state_file):
+        # Checks are triggered by the tests only
+        watchdog = RequestWatchdog(10.0, reports.append, state_file=state_file, check_interval=3600, clock=clock)
+        yield watchdog
+        watchdog.stop()
+
+    def test_track_requests_in_flight(self, watchdog: RequestWatchdog, clock: FakeClock):
+        with watchdog.tracking('http://first.url'):
+            clock.now += 1
+            with watchdog.tracking('http://second.url'):
+                assert watchdog.in_flight() == [
+                    InFlightRequest('http://first.url', threading.current_thread().name, 1000.0),
+                    InFlightRequest('http://second.url', threading.current_thread().name, 1001.0)]
+            assert [request.url for request in watchdog.in_flight()] == ['http://first.url']
+        assert watchdog.in_flight() == []
+
+    def test_slow_request_is_reported_once(self, watchdog: RequestWatchdog, clock: FakeClock, reports: List[str]):
+        with watchdog.tracking('http://slow.url'):
+            # Given: Under the threshold
+            clock.now += 5
+            watchdog.check()
+            assert reports == []
+
+            # When: Over the threshold
+            clock.now += 10
+            watchdog.check()
+            watchdog.check()
+
+            # Then: Reported once, with the url and elapsed time
+            assert len(reports) == 1
+            assert "'http://slow.url'" in reports[0]
+            assert '15.0s' in reports[0]
+
+    def test_stacks_are_dumped_once(self, clock: FakeClock, reports: List[str]):
+        watchdog = RequestWatchdog(10.0, reports.append, dump_stacks=True, check_interval=3600, clock=clock)
+        with watchdog.tracking('http://slow.url'):
+            with watchdog.tracking('http://other-slow.url'):
+                clock.now += 20
+                watchdog.check()
+        with watchdog.tracking('http://yet-another-slow.url'):
+            clock.now += 20
+            watchdog.check()
+        watchdog.stop()
+
+        stack_dumps = [report for report in reports if report.startswith('Thread ')]
+        assert len(stack_dumps) == 1
+        assert 'test_stacks_are_dumped_once' in stack_dumps[0]
+        assert len(reports) == 4
+
+    def test_state_file_only_exists_while_requests_are_in_flight(self,
+                                                                   watchdog: RequestWatchdog,
+                                                                   state_file: Path):
+        with watchdog.tracking('http://some.url'):
+            watchdog.check()
+            assert state_file.exists()
+            [in_flight_requests] = read_in_flight_requests(state_file.parent, FileReader()).values()
+            assert [request.url for request in in_flight_requests] == ['http://some.url']
+
+        watchdog.check()
+        assert not state_file.exists()
+
+    def test_background_checks(self, clock: FakeClock, reports: List[str]):
+        watchdog = RequestWatchdog(10.0, reports.append, check_interval=0.001, clock=clock)
+        with watchdog.tracking('http://slow.url'):
+            clock.now += 20
+            for _ in range(1000):
+                if reports:
+                    break
+                threading.Event().wait(0.001)
+        watchdog.stop()
+
+        assert len(reports) == 1
+
+
+def test_state_files_of_dead_processes_are_ignored(tmp_path: Path):
+    FileWriter.write_json_to_file(tmp_path / '1234.json', {'pid': 1234, 'requests': []})
+
+    assert read_in_flight_requests(tmp_path, FileReader(), max_age=-1) == {}
+    assert read_in_flight_requests(tmp_path, FileReader()) == {1234: []}
+    assert read_in_flight_requests(tmp_path / 'missing', FileReader()) == {}
@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from kata.data.catalog import CatalogSnapshot
+from kata.data.io.file import FileWriter
+
+
+@pytest.fixture
+def catalog(tmp_path: Path):
+    return CatalogSnapshot(tmp_path / 'catalog.json', FileWriter())
+
+
+def test_empty_snapshot(catalog: CatalogSnapshot):
+    assert catalog.languages() == []
+    assert catalog.templates('java') == []
+
+
+def test_record_languages_and_templates(catalog: CatalogSnapshot):
+    catalog.record_languages(['rust', 'java'])
+    catalog.record_templates('java', ['junit5', 'hamcrest'])
+
+    assert catalog.languages() == ['java', 'rust']
+    assert catalog.templates('java') == ['hamcrest', 'junit5']
+    assert catalog.templates('rust') == []
+
+
+def test_snapshot_is_shared_across_instances(tmp_path: Path):
+    CatalogSnapshot(tmp_path / 'catalog.json', FileWriter()).record_languages(['java'])
+    assert CatalogSnapshot(tmp_path / 'catalog.json', FileWriter()).languages() == ['java']
+
+
+def test_corrupted_snapshot_is_ignored(tmp_path: Path):
+    snapshot_file = tmp_path / 'catalog.json'
+    snapshot_file.write_text('{not json')
+    assert CatalogSnapshot(snapshot_file, FileWriter()).languages() == []
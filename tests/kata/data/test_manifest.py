@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pytest
+
+from kata.data.io.file import FileWriter
+from kata.data.manifest import KataManifestRepo
+from kata.domain.models import KataManifest, DownloadableFile
+from kata.domain.path_filter import PathFilter
+
+
+@pytest.fixture
+def manifest_repo():
+    return KataManifestRepo(FileWriter())
+
+
+def test_saved_in_the_kata(tmp_path: Path, manifest_repo: KataManifestRepo):
+    manifest = KataManifest(user='frank', repo='bootstraps', path='java/junit5',
+                            path_filter=PathFilter(exclude=('.idea',)),
+                            files=[DownloadableFile(Path('src/Kata.java'), 'http://url/src/Kata.java', 12,
+                                                    'ce013625030ba8dba906f756967f9e9ca394464a'),
+                                   DownloadableFile(Path('pom.xml'), 'http://url/pom.xml')])
+
+    manifest_repo.save(tmp_path, manifest)
+
+    assert manifest_repo.get(tmp_path) == manifest
+    assert (tmp_path / '.kata' / 'manifest.json').exists()
+
+
+def test_missing_or_unreadable(tmp_path: Path, manifest_repo: KataManifestRepo):
+    assert manifest_repo.get(tmp_path) is None
+
+    (tmp_path / '.kata').mkdir()
+    (tmp_path / '.kata' / 'manifest.json').write_text('{"user": "frank"}')
+    assert manifest_repo.get(tmp_path) is None
+
+
+def test_template_files_in_the_way(manifest_repo: KataManifestRepo):
+    def file(path: str):
+        return DownloadableFile(Path(path), f'http://url/{path}')
+
+    assert manifest_repo.in_the_way([file('.kata.json'), file('.kata/notes.md'), file('src/.kata')]) is None
+    assert manifest_repo.in_the_way([file('pom.xml'), file('.kata/manifest.json')]) == file('.kata/manifest.json')
+    assert manifest_repo.in_the_way([file('.kata')]) == file('.kata')
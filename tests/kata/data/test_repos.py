@@ -1,4 +1,6 @@
 import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List
 from unittest import mock
@@ -8,11 +10,17 @@ import pytest
 import yaml
 
 from kata import defaults
-from kata.data.io.file import FileReader, FileWriter
+from kata.data.catalog import CatalogSnapshot
+from kata.data.io.file import FileReader, FileWriter, ConfigCache
+from kata.data.io.network import UrlRewrite
 from kata.data.repos import KataTemplateRepo, KataLanguageRepo, ConfigRepo, HardCoded
 from kata.defaults import DEFAULT_CONFIG
-from kata.domain.exceptions import InvalidConfig
-from kata.domain.models import KataTemplate, KataLanguage
+from kata.domain.exceptions import InvalidConfig, ApiNotFound
+from kata.domain.models import KataTemplate, KataLanguage, KataGRepoSource
+from kata.domain.path_filter import PathFilter
+
+
+DEFAULT_SOURCE = KataGRepoSource('default', DEFAULT_CONFIG['KataGRepo']['User'], DEFAULT_CONFIG['KataGRepo']['Repo'])
 
 
 def extract_name_from_path(path):
@@ -60,6 +68,29 @@ def config_repo():
     return HardCoded.ConfigRepo()
 
 
+INTERNAL_SOURCE = KataGRepoSource('internal', 'my-company', 'internal-bootstraps', priority=10)
+
+
+@pytest.fixture
+def config_repo_with_internal_source(config_repo):
+    config_repo.config = dict(config_repo.config,
+                              KataGRepos=[{'Name': INTERNAL_SOURCE.name,
+                                           'User': INTERNAL_SOURCE.user,
+                                           'Repo': INTERNAL_SOURCE.repo,
+                                           'Priority': INTERNAL_SOURCE.priority}])
+    config_repo._config = config_repo.config
+    return config_repo
+
+
+def contents_per_repo(contents_of_repo: dict):
+    def contents(_user, repo, _path):
+        if repo not in contents_of_repo:
+            raise ApiNotFound(repo)
+        return contents_of_repo[repo]
+
+    return contents
+
+
 class TestKataTemplateRepo:
 
     @pytest.fixture
@@ -92,8 +123,9 @@ class TestKataTemplateRepo:
                     java_available_templates = kata_template_repo.get_for_language(KataLanguage('java'))
 
                     # Then: Only one is available and it is the root template (template_name == None)
-                    assert java_available_templates == [KataTemplate(KataLanguage('java'), template_name='template1'),
-                                                        KataTemplate(KataLanguage('java'), template_name='template2')]
+                    assert java_available_templates == [
+                        KataTemplate(KataLanguage('java'), template_name='template1', source=DEFAULT_SOURCE),
+                        KataTemplate(KataLanguage('java'), template_name='template2', source=DEFAULT_SOURCE)]
 
                 def test_template_at_root(self,
                                           mock_api: MagicMock,
@@ -108,7 +140,8 @@ class TestKataTemplateRepo:
                     rust_available_templates = kata_template_repo.get_for_language(KataLanguage('rust'))
 
                     # Then: Only one is available and it is the root template (template_name == None)
-                    assert rust_available_templates == [KataTemplate(KataLanguage('rust'), template_name=None)]
+                    assert rust_available_templates == [
+                        KataTemplate(KataLanguage('rust'), template_name=None, source=DEFAULT_SOURCE)]
 
             class TestInfoIsNotInConfig:
                 def test_check_if_has_readme(self,
@@ -129,7 +162,8 @@ class TestKataTemplateRepo:
 
                     # Then: Only one is available and it is the root template (template_name == None)
                     assert len(available_java_templates) == 1
-                    assert available_java_templates[0] == KataTemplate(KataLanguage('golang'), template_name=None)
+                    assert available_java_templates[0] == KataTemplate(KataLanguage('golang'), template_name=None,
+                                                                           source=DEFAULT_SOURCE)
 
         def test_template_is_not_at_root(self,
                                          mock_api: MagicMock,
@@ -142,8 +176,70 @@ class TestKataTemplateRepo:
             available_java_templates = kata_template_repo.get_for_language(KataLanguage('java'))
 
             # Then: All available templates are returned
-            assert available_java_templates == [KataTemplate(KataLanguage('java'), 'junit5'),
-                                                KataTemplate(KataLanguage('java'), 'hamcrest')]
+            assert available_java_templates == [KataTemplate(KataLanguage('java'), 'junit5', DEFAULT_SOURCE),
+                                                KataTemplate(KataLanguage('java'), 'hamcrest', DEFAULT_SOURCE)]
+
+
+    def test_catalog_snapshot_is_refreshed(self, tmp_path: Path, mock_api: MagicMock, config_repo):
+        # Given: A repo with a catalog snapshot
+        catalog = CatalogSnapshot(tmp_path / 'catalog.json', FileWriter())
+        kata_template_repo = KataTemplateRepo(mock_api, config_repo, catalog)
+        mock_api.contents.return_value = [mock_dir_entry('java/junit5'),
+                                          mock_dir_entry('java/hamcrest')]
+
+        # When: Fetching the available templates for java
+        kata_template_repo.get_for_language(KataLanguage('java'))
+
+        # Then: Catalog snapshot now contains them
+        assert catalog.templates('java') == ['hamcrest', 'junit5']
+
+
+    class TestMultipleSources:
+        def test_templates_of_all_sources_highest_priority_first(self,
+                                                                 mock_api: MagicMock,
+                                                                 config_repo_with_internal_source):
+            # Given: Both sources have templates for java
+            kata_template_repo = KataTemplateRepo(mock_api, config_repo_with_internal_source)
+            mock_api.contents.side_effect = contents_per_repo({
+                DEFAULT_SOURCE.repo: [mock_dir_entry('java/junit5')],
+                INTERNAL_SOURCE.repo: [mock_dir_entry('java/junit5'), mock_dir_entry('java/spring')]})
+
+            # When: Fetching the available templates for java
+            java_templates = kata_template_repo.get_for_language(KataLanguage('java'))
+
+            # Then: Templates of the internal source, which has the highest priority, come first
+            assert java_templates == [KataTemplate(KataLanguage('java'), 'junit5', INTERNAL_SOURCE),
+                                      KataTemplate(KataLanguage('java'), 'spring', INTERNAL_SOURCE),
+                                      KataTemplate(KataLanguage('java'), 'junit5', DEFAULT_SOURCE)]
+
+        def test_source_without_the_language_is_skipped(self,
+                                                        mock_api: MagicMock,
+                                                        config_repo_with_internal_source):
+            kata_template_repo = KataTemplateRepo(mock_api, config_repo_with_internal_source)
+            mock_api.contents.side_effect = contents_per_repo({DEFAULT_SOURCE.repo: [mock_dir_entry('java/junit5')]})
+
+            java_templates = kata_template_repo.get_for_language(KataLanguage('java'))
+
+            assert java_templates == [KataTemplate(KataLanguage('java'), 'junit5', DEFAULT_SOURCE)]
+
+        def test_sources_are_queried_concurrently(self, mock_api: MagicMock, config_repo_with_internal_source):
+            # Given: Each source only answers once the other one has been queried as well
+            all_sources_queried = threading.Barrier(2, timeout=5)
+
+            def contents(_user, repo, _path):
+                all_sources_queried.wait()
+                return [mock_dir_entry(f'java/{repo}')]
+
+            mock_api.contents.side_effect = contents
+
+            # When: Fetching the available templates for java
+            with ThreadPoolExecutor() as executor:
+                kata_template_repo = KataTemplateRepo(mock_api, config_repo_with_internal_source, executor=executor)
+                java_templates = kata_template_repo.get_for_language(KataLanguage('java'))
+
+            # Then: Queries did not wait on each other, and results are still in priority order
+            assert [template.template_name for template in java_templates] == [INTERNAL_SOURCE.repo,
+                                                                                DEFAULT_SOURCE.repo]
 
 
 class TestKataLanguageRepo:
@@ -172,6 +268,34 @@ class TestKataLanguageRepo:
             assert all_languages == [KataLanguage('java'),
                                      KataLanguage('rust')]
 
+        def test_catalog_snapshot_is_refreshed(self, tmp_path: Path, mock_api: MagicMock, config_repo):
+            catalog = CatalogSnapshot(tmp_path / 'catalog.json', FileWriter())
+            kata_language_repo = KataLanguageRepo(mock_api, config_repo, catalog)
+            mock_api.contents.return_value = [mock_dir_entry('java'),
+                                              mock_file_entry('README.md'),
+                                              mock_dir_entry('rust')]
+
+            kata_language_repo.get_all()
+
+            assert catalog.languages() == ['java', 'rust']
+
+        def test_languages_of_all_sources_are_merged(self, mock_api: MagicMock, config_repo_with_internal_source):
+            kata_language_repo = KataLanguageRepo(mock_api, config_repo_with_internal_source)
+            mock_api.contents.side_effect = contents_per_repo({
+                DEFAULT_SOURCE.repo: [mock_dir_entry('java'), mock_dir_entry('rust')],
+                INTERNAL_SOURCE.repo: [mock_dir_entry('cobol'), mock_dir_entry('java')]})
+
+            assert kata_language_repo.get_all() == [KataLanguage('cobol'),
+                                                    KataLanguage('java'),
+                                                    KataLanguage('rust')]
+
+        def test_missing_source_is_skipped(self, mock_api: MagicMock, config_repo_with_internal_source):
+            kata_language_repo = KataLanguageRepo(mock_api, config_repo_with_internal_source)
+            mock_api.contents.side_effect = contents_per_repo({
+                DEFAULT_SOURCE.repo: [mock_dir_entry('java'), mock_dir_entry('rust')]})
+
+            assert kata_language_repo.get_all() == [KataLanguage('java'), KataLanguage('rust')]
+
     class TestGet:
         def test_request_contents_of_root_directory(self,
                                                     mock_api: MagicMock,
@@ -238,6 +362,54 @@ class TestConfigRepo:
             config_repo = ConfigRepo(config_file, mock_file_reader, mock_file_writer)
             assert config_repo.get_kata_grepo_reponame() == 'my_repo_name'
 
+        def test_get_kata_grepo_sources(self, valid_config, mock_file_reader, mock_file_writer):
+            # Given: An additional source with a higher priority, and one with a lower priority
+            config = valid_config
+            config['KataGRepos'] = [{'Name': 'archive', 'User': 'old_user', 'Repo': 'old_repo', 'Priority': -1},
+                                    {'Name': 'internal', 'User': 'company', 'Repo': 'bootstraps', 'Priority': 10}]
+            mock_file_reader.read_yaml.return_value = config
+
+            # When: Loading the config
+            config_repo = ConfigRepo(Path('NOT USED'), mock_file_reader, mock_file_writer)
+
+            # Then: All sources are returned, highest priority first
+            assert config_repo.get_kata_grepo_sources() == [KataGRepoSource('internal', 'company', 'bootstraps', 10),
+                                                            KataGRepoSource('default', 'some_user', 'some_repo', 0),
+                                                            KataGRepoSource('archive', 'old_user', 'old_repo', -1)]
+
+        def test_source_name_cannot_contain_colon(self, valid_config, mock_file_reader, mock_file_writer):
+            config = valid_config
+            config['KataGRepos'] = [{'Name': 'in:ternal', 'User': 'company', 'Repo': 'bootstraps'}]
+            mock_file_reader.read_yaml.return_value = config
+
+            with pytest.raises(InvalidConfig):
+                ConfigRepo(Path('NOT USED'), mock_file_reader, mock_file_writer)
+
+        def test_git_backend(self, valid_config, mock_file_reader, mock_file_writer):
+            config = valid_config
+            config['GitBackend'] = {'Enabled': True, 'UrlTemplate': 'file:///srv/git/{user}/{repo}.git'}
+            mock_file_reader.read_yaml.return_value = config
+
+            config_repo = ConfigRepo(Path('NOT USED'), mock_file_reader, mock_file_writer)
+
+            assert config_repo.use_git_backend() is True
+            assert config_repo.get_git_url_template() == 'file:///srv/git/{user}/{repo}.git'
+
+        def test_github_api_backend_by_default(self, config_repo):
+            assert config_repo.use_git_backend() is False
+
+        def test_path_filter_per_language(self, valid_config, mock_file_reader, mock_file_writer):
+            config = valid_config
+            config['Filters'] = {'java': {'Exclude': ['.idea', 'gradle/wrapper']},
+                                 'python': {'Include': ['*.py']}}
+            mock_file_reader.read_yaml.return_value = config
+
+            config_repo = ConfigRepo(Path('NOT USED'), mock_file_reader, mock_file_writer)
+
+            assert config_repo.get_path_filter(KataLanguage('java')) == PathFilter(exclude=('.idea', 'gradle/wrapper'))
+            assert config_repo.get_path_filter(KataLanguage('python')) == PathFilter(include=('*.py',))
+            assert config_repo.get_path_filter(KataLanguage('elixir')) == PathFilter()
+
     class TestHasTemplateAtRoot:
         @pytest.fixture
         def config_repo(self, mock_file_reader, valid_config, mock_file_writer):
@@ -292,6 +464,30 @@ class TestConfigRepo:
                 # Then: No exception thrown, token is None
                 assert token is None
 
+        class TestGetAuthTokens:
+            def test_token_and_token_pool(self, valid_config, mock_file_reader, mock_file_writer):
+                # Given: A main token and a pool of tokens
+                config_file = Path('NOT USED - MOCKED IN MOCK_FILE_READER')
+                config = valid_config
+                config['Auth']['Token'] = 'TOKEN1234'
+                config['Auth']['Tokens'] = ['TOKEN5678', 'TOKEN9012']
+                mock_file_reader.read_yaml.return_value = config
+
+                # When: Fetching all tokens
+                config_repo = ConfigRepo(config_file, mock_file_reader, mock_file_writer)
+                tokens = config_repo.get_auth_tokens()
+
+                # Then: Main token comes first
+                assert tokens == ['TOKEN1234', 'TOKEN5678', 'TOKEN9012']
+
+            def test_no_token(self, valid_config, mock_file_reader, mock_file_writer):
+                config_file = Path('NOT USED - MOCKED IN MOCK_FILE_READER')
+                mock_file_reader.read_yaml.return_value = valid_config
+
+                config_repo = ConfigRepo(config_file, mock_file_reader, mock_file_writer)
+
+                assert config_repo.get_auth_tokens() == []
+
         class TestSkipWarning:
             def test_do_not_skip(self, valid_config, mock_file_reader, mock_file_writer):
                 # Given: Config file with SkipNotLoggedInWarning == True
@@ -321,6 +517,38 @@ class TestConfigRepo:
                 # Then: Should skip
                 assert should_skip
 
+    class TestGithubEndpoints:
+        def test_defaults_to_public_github(self, valid_config, mock_file_reader, mock_file_writer):
+            # Given: No 'Github' section in the config
+            config_file = Path('NOT USED - MOCKED IN MOCK_FILE_READER')
+            mock_file_reader.read_yaml.return_value = valid_config
+
+            # When: Fetching the endpoints
+            config_repo = ConfigRepo(config_file, mock_file_reader, mock_file_writer)
+
+            # Then: Public Github endpoints are used, without any rewrite
+            assert config_repo.get_api_base_url() == 'https://api.github.com'
+            assert config_repo.get_raw_base_url() == 'https://raw.githubusercontent.com'
+            assert config_repo.get_url_rewrites() == []
+
+        def test_mirror(self, valid_config, mock_file_reader, mock_file_writer):
+            # Given: A 'Github' section pointing to a mirror
+            config_file = Path('NOT USED - MOCKED IN MOCK_FILE_READER')
+            config = valid_config
+            config['Github'] = {'ApiBaseUrl': 'http://mirror.local/api',
+                                'RawBaseUrl': 'http://mirror.local/raw',
+                                'UrlRewrites': [{'From': 'https://github.com/', 'To': 'http://mirror.local/git/'}]}
+            mock_file_reader.read_yaml.return_value = config
+
+            # When: Fetching the endpoints
+            config_repo = ConfigRepo(config_file, mock_file_reader, mock_file_writer)
+
+            # Then: Mirror endpoints are used
+            assert config_repo.get_api_base_url() == 'http://mirror.local/api'
+            assert config_repo.get_raw_base_url() == 'http://mirror.local/raw'
+            assert config_repo.get_url_rewrites() == [UrlRewrite(from_prefix='https://github.com/',
+                                                                 to_prefix='http://mirror.local/git/')]
+
     class TestConfigValidation:
         @pytest.fixture
         def assert_given_config_raises_when_calling_given_method(self, mock_file_reader, mock_file_writer):
@@ -419,6 +647,30 @@ class TestConfigRepo:
                 method_args=(),
                 regexes_to_match=[r'SkipNotLoggedInWarning', r'Missing'])
 
+        def test_invalid_api_base_url(self, valid_config, assert_given_config_raises_when_calling_given_method):
+            def config_with_invalid_api_base_url():
+                conf = valid_config
+                conf['Github'] = {'ApiBaseUrl': 'not-a-url'}
+                return conf
+
+            assert_given_config_raises_when_calling_given_method(
+                config=config_with_invalid_api_base_url(),
+                method_to_call='get_api_base_url',
+                method_args=(),
+                regexes_to_match=[r'ApiBaseUrl', r'not-a-url'])
+
+        def test_incomplete_url_rewrite(self, valid_config, assert_given_config_raises_when_calling_given_method):
+            def config_with_incomplete_url_rewrite():
+                conf = valid_config
+                conf['Github'] = {'UrlRewrites': [{'From': 'https://github.com/'}]}
+                return conf
+
+            assert_given_config_raises_when_calling_given_method(
+                config=config_with_incomplete_url_rewrite(),
+                method_to_call='get_url_rewrites',
+                method_args=(),
+                regexes_to_match=[r'To', r'Missing'])
+
     class TestIntegration:
         def test_valid_config(self, tmp_path: Path):
             def write_config(config_contents):
@@ -456,6 +708,40 @@ class TestConfigRepo:
             assert config_repo.has_template_at_root(KataLanguage('csharp')) is None
             assert config_repo.should_skip_not_logged_in_warning()
 
+        def test_validated_config_is_cached_until_file_changes(self, tmp_path: Path):
+            def config_repo_counting_reads():
+                file_reader = mock.Mock(wraps=FileReader())
+                config_repo = ConfigRepo(config_file, file_reader, FileWriter(), config_cache)
+                return config_repo, file_reader.read_yaml.call_count
+
+            # Given: A valid config file and a config cache
+            config_file = tmp_path / 'config.yml'
+            config_file.write_text(textwrap.dedent("""\
+                KataGRepo:
+                    User: frank
+                    Repo: 'awesome-repo'
+                HasTemplateAtRoot: {}
+                Auth:
+                    SkipNotLoggedInWarning: True
+            """))
+            config_cache = ConfigCache(tmp_path / 'config.cache', FileWriter())
+
+            # When: Loading the config multiple times
+            first_run, first_run_yaml_reads = config_repo_counting_reads()
+            second_run, second_run_yaml_reads = config_repo_counting_reads()
+
+            # Then: Yaml file is only parsed the first time
+            assert (first_run_yaml_reads, second_run_yaml_reads) == (1, 0)
+            assert second_run.get_kata_grepo_username() == 'frank'
+
+            # When: Config file changes
+            config_file.write_text(config_file.read_text().replace('frank', 'bob'))
+            third_run, third_run_yaml_reads = config_repo_counting_reads()
+
+            # Then: Yaml file is parsed again
+            assert third_run_yaml_reads == 1
+            assert third_run.get_kata_grepo_username() == 'bob'
+
         def test_missing_config_file_then_create_with_defaults(self, tmp_path: Path):
             # Given: A config path to a non-existing file
             config_path = tmp_path / 'config.yaml'
@@ -0,0 +1,108 @@
+import time
+import tracemalloc
+
+import pytest
+
+from kata.diagnostics import tracing
+from kata.diagnostics.memstats import MemStats, current_rss
+
+MIB = 1024 * 1024
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.start_tracing()
+    yield tracer
+    tracing.stop_tracing()
+
+
+@pytest.fixture
+def memstats():
+    memstats = MemStats(sampling_interval=0.001)
+    memstats.start()
+    return memstats
+
+
+def allocate_and_release(size: int):
+    allocated = bytearray(size)
+    del allocated
+
+
+def test_current_rss():
+    assert current_rss() > 0
+
+
+def test_peak_per_phase(memstats: MemStats, tracer: tracing.Tracer):
+    # Given: Only the second phase allocates a lot
+    with tracing.span('small_phase'):
+        allocate_and_release(1024)
+    with tracing.span('big_phase'):
+        allocate_and_release(20 * MIB)
+    with tracing.span('ignored_category', 'io'):
+        pass
+
+    # When: Stopping
+    memstats.stop()
+
+    # Then: The whole command comes first, then phases in the order they started
+    command, small_phase, big_phase = memstats.phases(tracer)
+    assert [command.name, small_phase.name, big_phase.name] == ['command', 'small_phase', 'big_phase']
+    assert big_phase.traced_peak >= 20 * MIB
+    assert command.traced_peak >= 20 * MIB
+    assert big_phase.rss_peak > 0
+
+
+def test_peak_per_phase_before_python_3_9(monkeypatch, tracer: tracing.Tracer):
+    # Given: No way to reset the traced peak, as before Python 3.9
+    monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+    memstats = MemStats(sampling_interval=0.001)
+    memstats.start()
+
+    # When: A phase allocates a lot, then another one holds little
+    with tracing.span('big_phase'):
+        allocate_and_release(20 * MIB)
+    time.sleep(0.05)
+    with tracing.span('later_phase'):
+        time.sleep(0.05)
+    memstats.stop()
+
+    # Then: The peak is only reported where it happened
+    command, big_phase, later_phase = memstats.phases(tracer)
+    assert big_phase.traced_peak >= 20 * MIB
+    assert command.traced_peak >= 20 * MIB
+    assert later_phase.traced_peak < 20 * MIB
+
+
+def test_without_tracer_only_the_whole_command_is_reported(memstats: MemStats):
+    allocate_and_release(20 * MIB)
+
+    memstats.stop()
+
+    [command] = memstats.phases()
+    assert command.traced_peak >= 20 * MIB
+
+
+def test_top_allocation_sites(memstats: MemStats):
+    # Given: Memory still held when stopping
+    held = [bytearray(MIB) for _ in range(5)]
+
+    # When: Stopping
+    memstats.stop()
+
+    # Then: The site holding it comes first
+    top_site = memstats.top_allocation_sites()[0]
+    assert top_site.location.startswith(f'{__file__}:')
+    assert top_site.size >= 5 * MIB
+    assert top_site.count >= 5
+    assert held
+
+
+def test_report(memstats: MemStats, tracer: tracing.Tracer):
+    with tracing.span('download_and_write'):
+        allocate_and_release(MIB)
+
+    memstats.stop()
+
+    report = memstats.report(tracer)
+    assert 'download_and_write' in report
+    assert 'Top allocation sites' in report
@@ -0,0 +1,50 @@
+import pytest
+
+from kata.diagnostics import metrics
+
+
+@pytest.fixture
+def registry():
+    registry = metrics.start_collecting()
+    yield registry
+    metrics.stop_collecting()
+
+
+def test_no_op_when_not_collecting():
+    metrics.inc('kata_files_written_total')
+    assert not metrics.enabled()
+    assert metrics.stop_collecting() is None
+
+
+def test_render_counters_and_gauges(registry: metrics.MetricsRegistry):
+    metrics.inc('kata_files_written_total')
+    metrics.inc('kata_files_written_total', 2)
+    metrics.set_gauge('kata_rate_limit_remaining', 4999, token='anonymous')
+
+    assert registry.render() == (
+        '# HELP kata_files_written_total Kata files written\n'
+        '# TYPE kata_files_written_total counter\n'
+        'kata_files_written_total 3\n'
+        '# HELP kata_rate_limit_remaining Remaining Github Api calls last reported, per (hashed) token\n'
+        '# TYPE kata_rate_limit_remaining gauge\n'
+        'kata_rate_limit_remaining{token="anonymous"} 4999\n')
+
+
+def test_render_histogram(registry: metrics.MetricsRegistry):
+    metrics.observe('kata_http_request_duration_seconds', 0.2, host='api.github.com', endpoint='contents')
+    metrics.observe('kata_http_request_duration_seconds', 3, host='api.github.com', endpoint='contents')
+
+    rendered = registry.render().splitlines()
+
+    labels = 'endpoint="contents",host="api.github.com"'
+    assert f'kata_http_request_duration_seconds_bucket{{{labels},le="0.1"}} 0' in rendered
+    assert f'kata_http_request_duration_seconds_bucket{{{labels},le="0.25"}} 1' in rendered
+    assert f'kata_http_request_duration_seconds_bucket{{{labels},le="5"}} 2' in rendered
+    assert f'kata_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in rendered
+    assert f'kata_http_request_duration_seconds_sum{{{labels}}} 3.2' in rendered
+    assert f'kata_http_request_duration_seconds_count{{{labels}}} 2' in rendered
+
+
+def test_label_values_are_escaped(registry: metrics.MetricsRegistry):
+    metrics.set_gauge('kata_command_duration_seconds', 1, command='say "hi"\\n')
+    assert 'kata_command_duration_seconds{command="say \\"hi\\"\\\\n"} 1\n' in registry.render()
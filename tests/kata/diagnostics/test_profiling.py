@@ -0,0 +1,50 @@
+import pstats
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from kata.diagnostics.profiling import Profiler
+
+
+def work_in_worker_thread():
+    time.sleep(0.05)
+    return sum(range(1000))
+
+
+def test_profile_all_threads(tmp_path: Path):
+    # Given: A profiler started before the executor
+    profiler = Profiler(sampling_interval=0.001)
+    profiler.start()
+
+    # When: Running work in executor threads
+    with ThreadPoolExecutor(4, thread_name_prefix='worker-') as executor:
+        list(executor.map(lambda _: work_in_worker_thread(), range(4)))
+    profiler.stop()
+    collapsed_stacks_file = profiler.write(tmp_path / 'out.prof')
+
+    # Then:
+    # - Work done in workers is in the pstats
+    profiled_stats = pstats.Stats(str(tmp_path / 'out.prof')).stats
+    profiled_functions = [function_name for _file, _line, function_name in profiled_stats]
+    assert 'work_in_worker_thread' in profiled_functions
+    # - And in the collapsed stacks, under the merged workers of the executor
+    collapsed_stacks = collapsed_stacks_file.read_text().splitlines()
+    assert collapsed_stacks_file == tmp_path / 'out.collapsed'
+    assert any(line.startswith('worker-;') and 'work_in_worker_thread' in line for line in collapsed_stacks)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in collapsed_stacks)
+
+
+def test_thread_still_running_when_stopped(tmp_path: Path):
+    # Given: A worker still running when profiling stops
+    profiler = Profiler(sampling_interval=0.001)
+    profiler.start()
+    with ThreadPoolExecutor(1) as executor:
+        still_running = executor.submit(work_in_worker_thread)
+        profiler.stop()
+
+        # When: Writing the profile
+        profiler.write(tmp_path / 'out.prof')
+        still_running.result()
+
+    # Then: Profiles were written without interfering with the worker
+    assert pstats.Stats(str(tmp_path / 'out.prof')).stats
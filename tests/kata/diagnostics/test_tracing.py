@@ -0,0 +1,67 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from kata.diagnostics import tracing
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.start_tracing()
+    yield tracer
+    tracing.stop_tracing()
+
+
+def spans(tracer: tracing.Tracer):
+    return [event for event in tracer.events() if event['ph'] == 'X']
+
+
+def test_no_op_when_not_tracing():
+    with tracing.span('some_span', url='http://example.com') as span:
+        span.set(status=200)
+    assert tracing.stop_tracing() is None
+
+
+def test_record_span_with_args(tracer: tracing.Tracer):
+    with tracing.span('GET', 'http', url='http://example.com') as span:
+        span.set(status=200)
+
+    [recorded_span] = spans(tracer)
+    assert recorded_span['name'] == 'GET'
+    assert recorded_span['cat'] == 'http'
+    assert recorded_span['args'] == {'url': 'http://example.com', 'status': 200}
+    assert recorded_span['dur'] >= 0
+
+
+def test_failing_span_is_recorded_with_error(tracer: tracing.Tracer):
+    with pytest.raises(ValueError):
+        with tracing.span('failing'):
+            raise ValueError()
+
+    assert spans(tracer)[0]['args'] == {'error': 'ValueError'}
+
+
+def test_spans_are_tagged_with_thread(tracer: tracing.Tracer):
+    def in_worker():
+        with tracing.span('in_worker'):
+            pass
+
+    worker = threading.Thread(target=in_worker, name='worker')
+    worker.start()
+    worker.join()
+
+    thread_name_event = [event for event in tracer.events() if event['ph'] == 'M'][0]
+    assert thread_name_event['tid'] == spans(tracer)[0]['tid'] == worker.ident
+    assert thread_name_event['args'] == {'name': 'worker'}
+
+
+def test_write_chrome_trace_format(tmp_path: Path, tracer: tracing.Tracer):
+    with tracing.span('some_span'):
+        pass
+
+    tracer.write(tmp_path / 'trace.json')
+
+    trace = json.loads((tmp_path / 'trace.json').read_text())
+    assert [event['name'] for event in trace['traceEvents']] == ['thread_name', 'some_span']
@@ -0,0 +1,235 @@
+from concurrent import futures
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from kata.domain.concurrency import AimdLimiter, LimitedScheduler
+from kata.domain.exceptions import ApiThrottled
+
+
+class ManualExecutor(futures.Executor):
+    """
+    Only runs what was submitted when asked to, one task at a time: dispatch order is deterministic
+    """
+
+    def __init__(self):
+        self._pending = []
+
+    def submit(self, fn, *args, **kwargs):
+        self._pending.append((fn, args, kwargs))
+        return futures.Future()
+
+    def run_all(self):
+        while self._pending:
+            fn, args, kwargs = self._pending.pop(0)
+            fn(*args, **kwargs)
+
+
+class TestAimdLimiter:
+    def test_grow_by_one_after_a_full_window_of_successes(self):
+        limiter = AimdLimiter(initial_limit=4)
+        for _ in range(4):
+            limiter.on_success(latency=0.1)
+        assert limiter.limit == 5
+
+    def test_never_grow_above_max(self):
+        limiter = AimdLimiter(initial_limit=2, max_limit=3)
+        for _ in range(100):
+            limiter.on_success(latency=0.1)
+        assert limiter.limit == 3
+
+    def test_halve_when_throttled(self):
+        limiter = AimdLimiter(initial_limit=8)
+        limiter.on_throttled()
+        assert limiter.limit == 4
+
+    def test_never_shrink_below_min(self):
+        limiter = AimdLimiter(initial_limit=2, min_limit=1)
+        for _ in range(10):
+            limiter.on_throttled()
+        assert limiter.limit == 1
+
+    def test_only_back_off_once_for_requests_already_in_flight(self):
+        # Given: 8 requests in flight
+        limiter = AimdLimiter(initial_limit=8)
+        for _ in range(8):
+            assert limiter.try_acquire()
+
+        # When: They all get throttled
+        for _ in range(8):
+            limiter.release()
+            limiter.on_throttled()
+
+        # Then: Limit was only halved once
+        assert limiter.limit == 4
+
+    def test_halve_when_latency_spikes(self):
+        # Given: Flat latency of 100ms
+        limiter = AimdLimiter(initial_limit=8, max_limit=8)
+        for _ in range(10):
+            limiter.on_success(latency=0.1)
+
+        # When: Latency suddenly spikes to 1s
+        for _ in range(5):
+            limiter.on_success(latency=1)
+
+        # Then: Limit has been reduced
+        assert limiter.limit < 8
+
+    def test_jitter_on_tiny_latencies_isn_t_a_spike(self):
+        limiter = AimdLimiter(initial_limit=4)
+        for latency in [0.0001, 0.003, 0.0001, 0.004] * 5:
+            limiter.on_success(latency)
+        assert limiter.limit > 4
+
+    def test_acquire_up_to_limit(self):
+        limiter = AimdLimiter(initial_limit=2)
+        assert limiter.try_acquire()
+        assert limiter.try_acquire()
+        assert not limiter.try_acquire()
+        limiter.release()
+        assert limiter.try_acquire()
+
+
+class TestLimitedScheduler:
+    def test_never_more_in_flight_than_limit(self, thread_pool_executor):
+        # Given: A limiter stuck at 3 concurrent tasks
+        limiter = AimdLimiter(initial_limit=3, max_limit=3)
+        scheduler = LimitedScheduler(thread_pool_executor, limiter)
+        in_flight = 0
+        max_in_flight = 0
+        lock = threading.Lock()
+
+        def task():
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight -= 1
+
+        # When: Submitting many tasks
+        all_futures = [scheduler.submit(task) for _ in range(20)]
+        for future in all_futures:
+            future.result()
+
+        # Then: Never more than 3 ran at the same time
+        assert max_in_flight == 3
+
+    def test_result_and_errors_are_forwarded(self, thread_pool_executor):
+        scheduler = LimitedScheduler(thread_pool_executor, AimdLimiter())
+
+        def fail():
+            raise ValueError('Expected error')
+
+        assert scheduler.submit(lambda a, b: a + b, 1, 2).result() == 3
+        with pytest.raises(ValueError, match='Expected error'):
+            scheduler.submit(fail).result()
+
+    def test_then_is_applied_outside_of_measured_latency(self, thread_pool_executor):
+        # Given: A slow step applied on the result
+        limiter = MagicMock(wraps=AimdLimiter())
+        scheduler = LimitedScheduler(thread_pool_executor, limiter)
+
+        def slow_double(result):
+            time.sleep(0.05)
+            return result * 2
+
+        # When: Running the task
+        future = scheduler.submit(lambda: 21, then=slow_double)
+
+        # Then: Result goes through `then`, but its duration isn't reported as latency
+        assert future.result() == 42
+        [(latency,), _kwargs] = limiter.on_success.call_args
+        assert latency < 0.05
+
+    def test_error_in_then_is_forwarded(self, thread_pool_executor):
+        scheduler = LimitedScheduler(thread_pool_executor, AimdLimiter())
+
+        def fail(_result):
+            raise ValueError('Expected error')
+
+        with pytest.raises(ValueError, match='Expected error'):
+            scheduler.submit(lambda: 1, then=fail).result()
+
+    def test_throttled_then_back_off_and_retry(self, thread_pool_executor):
+        # Given: The Api throttles the first attempt, asking to retry shortly after
+        limiter = AimdLimiter(initial_limit=8)
+        scheduler = LimitedScheduler(thread_pool_executor, limiter)
+        attempts = []
+
+        def throttled_once():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise ApiThrottled(429, retry_after=0.05)
+            return 'DONE'
+
+        # When: Running the task
+        result = scheduler.submit(throttled_once).result(timeout=5)
+
+        # Then: The limit is halved, and the task completes once retried after the time asked
+        assert result == 'DONE'
+        assert limiter.limit == 4
+        assert attempts[1] - attempts[0] >= 0.05
+
+    def test_still_throttled_after_all_attempts(self, thread_pool_executor):
+        # Given: The Api keeps throttling, without telling how long to wait
+        delays = []
+
+        def run_now(delay, fn):
+            delays.append(delay)
+            fn()
+
+        scheduler = LimitedScheduler(thread_pool_executor, AimdLimiter(initial_limit=8), run_later=run_now)
+
+        def throttled():
+            raise ApiThrottled(429)
+
+        # Then: Retried with an exponential backoff, then the error is forwarded
+        with pytest.raises(ApiThrottled):
+            scheduler.submit(throttled).result(timeout=5)
+        backoff = LimitedScheduler.THROTTLED_BACKOFF_IN_SECONDS
+        assert delays == [backoff, 2 * backoff]
+
+    def test_dispatch_by_priority_then_submission_order(self, thread_pool_executor):
+        # Given: A single slot, kept busy while other tasks are queued
+        scheduler = LimitedScheduler(thread_pool_executor, AimdLimiter(initial_limit=1, max_limit=1))
+        slot_busy = threading.Event()
+        execution_order = []
+
+        def record(name):
+            execution_order.append(name)
+
+        blocking_task = scheduler.submit(slot_busy.wait)
+        queued_tasks = [scheduler.submit(record, 'low_1', priority=2),
+                        scheduler.submit(record, 'high', priority=0),
+                        scheduler.submit(record, 'low_2', priority=2),
+                        scheduler.submit(record, 'medium', priority=1)]
+
+        # When: Freeing the slot
+        slot_busy.set()
+        for future in [blocking_task] + queued_tasks:
+            future.result()
+
+        # Then: Queued tasks ran by priority, then in submission order
+        assert execution_order == ['high', 'medium', 'low_1', 'low_2']
+
+    def test_longest_tasks_first_on_skewed_workload(self):
+        # Given: Two slots, and many short tasks submitted before a single long one
+        executor = ManualExecutor()
+        scheduler = LimitedScheduler(executor, AimdLimiter(initial_limit=2, max_limit=2))
+        started = []
+        durations = {f'short_{index}': 1 for index in range(1, 7)}
+        durations['long'] = 6
+        for name, duration in durations.items():
+            scheduler.submit(started.append, name, priority=-duration)
+
+        # When: Running all tasks
+        executor.run_all()
+
+        # Then: The long task takes the first slot freed, ahead of the short tasks queued before it
+        #   Note: The first 2 short tasks are dispatched before the long one is even submitted
+        assert started == ['short_1', 'short_2', 'long', 'short_3', 'short_4', 'short_5', 'short_6']
@@ -0,0 +1,90 @@
+import tracemalloc
+from pathlib import Path
+
+from kata.domain.file_tree import FileTree
+from kata.domain.models import DownloadableFile
+
+URL_PREFIX = 'https://raw.githubusercontent.com/frank/bootstraps/master/'
+
+
+def test_files_with_their_download_url():
+    tree = FileTree()
+    tree.add('README.md', URL_PREFIX + 'README.md', size=10)
+    tree.add('java/pom.xml', URL_PREFIX + 'java/pom.xml', size=20)
+    tree.add('java/src/Kata.java', 'https://elsewhere/Kata.java', size=30)
+
+    assert [*tree] == [DownloadableFile(Path('README.md'), URL_PREFIX + 'README.md', 10),
+                       DownloadableFile(Path('java/pom.xml'), URL_PREFIX + 'java/pom.xml', 20),
+                       DownloadableFile(Path('java/src/Kata.java'), 'https://elsewhere/Kata.java', 30)]
+    assert len(tree) == 3
+
+
+def test_files_with_their_sha():
+    tree = FileTree()
+    tree.add('README.md', URL_PREFIX + 'README.md', size=6, sha='ce013625030ba8dba906f756967f9e9ca394464a')
+    tree.add('LICENSE', 'https://elsewhere/LICENSE', sha='e69de29bb2d1d6434b8b29ae775ad8c2e48c5391')
+
+    assert [*tree] == [
+        DownloadableFile(Path('README.md'), URL_PREFIX + 'README.md', 6, 'ce013625030ba8dba906f756967f9e9ca394464a'),
+        DownloadableFile(Path('LICENSE'), 'https://elsewhere/LICENSE', 0, 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391')]
+
+
+class TestSubtree:
+    def test_paths_relative_to_the_subtree_and_urls_unchanged(self):
+        tree = FileTree()
+        tree.add('README.md', URL_PREFIX + 'README.md')
+        tree.add('java/junit5/pom.xml', URL_PREFIX + 'java/junit5/pom.xml')
+        tree.add('java/junit5/src/Kata.java', URL_PREFIX + 'java/junit5/src/Kata.java')
+
+        subtree = tree.subtree('java').subtree('junit5/')
+
+        assert [*subtree] == [DownloadableFile(Path('pom.xml'), URL_PREFIX + 'java/junit5/pom.xml'),
+                              DownloadableFile(Path('src/Kata.java'), URL_PREFIX + 'java/junit5/src/Kata.java')]
+
+    def test_shares_the_nodes_of_the_tree(self):
+        tree = FileTree()
+        tree.add('java/pom.xml', URL_PREFIX + 'java/pom.xml')
+        subtree = tree.subtree('java')
+
+        subtree.add('src/Kata.java', URL_PREFIX + 'java/src/Kata.java')
+
+        assert DownloadableFile(Path('java/src/Kata.java'), URL_PREFIX + 'java/src/Kata.java') in [*tree]
+
+    def test_missing_or_file(self):
+        tree = FileTree()
+        tree.add('java/pom.xml', URL_PREFIX + 'java/pom.xml')
+
+        assert [*tree.subtree('python')] == []
+        assert [*tree.subtree('java/pom.xml')] == []
+        assert tree.subtree('') is tree
+
+
+def test_several_times_smaller_than_a_list():
+    # Given: A large monorepo, where every file has its own name and sha
+    paths = [f'module_{module}/src/main/java/pkg_{package}/File{module}_{package}_{file}.java'
+             for module in range(10) for package in range(200) for file in range(10)]
+    shas = [f'{index + 1:040x}' for index in range(len(paths))]
+
+    def allocated_by(build):
+        tracemalloc.start()
+        try:
+            _result = build()
+            return tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+    def build_tree():
+        tree = FileTree()
+        for path, sha in zip(paths, shas):
+            tree.add(path, URL_PREFIX + path, size=1234, sha=sha)
+        return tree
+
+    # When: Storing its files in a tree, and in a list
+    tree_size = allocated_by(build_tree)
+    list_size = allocated_by(lambda: [DownloadableFile(Path(path), URL_PREFIX + path, 1234, sha)
+                                      for path, sha in zip(paths, shas)])
+
+    # Then: The tree is about 3 times smaller (~200 vs ~600 bytes per entry here, up to ~250 when the table of interned
+    #       strings grows meanwhile): it shares directory names, drops urls following the url prefix, and packs sizes
+    #       and raw shas, but still stores every file name
+    assert tree_size * 2 < list_size
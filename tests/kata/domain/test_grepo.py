@@ -5,11 +5,16 @@ from unittest import mock
 import pytest
 
 from kata.data.io.file import FileWriter
+from kata.data.io.git import GitCli, PartialClone
 from kata.data.io.network import GithubApi
-from kata.domain.grepo import GRepo
+from kata.domain.concurrency import AimdLimiter
+from kata.domain.grepo import GRepo, GitGRepo
 from kata.domain.models import DownloadableFile
+from kata.domain.path_filter import PathFilter
 
 NOT_USED = 'Not Used'
+# `git hash-object` of 'hello\n'
+HELLO_SHA = 'ce013625030ba8dba906f756967f9e9ca394464a'
 
 
 @pytest.fixture
@@ -295,6 +300,147 @@ class TestGetFileUrls:
             )])
 
 
+    def test_nested_directories_with_a_single_request_in_flight(self, mock_api, thread_pool_executor):
+        # Given: A limiter only allowing a single request at a time
+        grepo = GRepo(mock_api, FileWriter(), thread_pool_executor, AimdLimiter(initial_limit=1, max_limit=1))
+
+        # When: Exploring nested directories
+        result = grepo.get_files_to_download(user=NOT_USED, repo='nested_directories', path='')
+
+        # Then: Exploration completes, parent listings never wait on their children
+        assert len(result) == 4
+
+    def test_file_tree_of_a_sub_path(self, grepo):
+        file_tree = grepo.get_file_tree(user=NOT_USED, repo='nested_directories', path='dir_at_root/dir_at_level_1')
+
+        assert sort_by_file_path(file_tree) == sort_by_file_path(
+            grepo.get_files_to_download(user=NOT_USED, repo='nested_directories', path='dir_at_root/dir_at_level_1'))
+        assert len(file_tree) == 2
+
+
+class TestPriorityScheduling:
+    def test_small_files_first_then_large_files_biggest_first(self, tmp_path: Path, mock_api, thread_pool_executor):
+        # Given: A single request at a time, and files of various sizes
+        grepo = GRepo(mock_api, FileWriter(), thread_pool_executor, AimdLimiter(initial_limit=1, max_limit=1))
+        download_order = []
+
+        def record_download(url, _sha):
+            download_order.append(url)
+            return b'CONTENT'
+
+        mock_api.download_raw_file.side_effect = record_download
+        mock_api.download_raw_file_to.side_effect = lambda url, _partial_file, _size, _sha: download_order.append(url)
+        files_to_download = [DownloadableFile(Path('large.bin'), 'http://url/large.bin', size=200 * 1024),
+                             DownloadableFile(Path('small.txt'), 'http://url/small.txt', size=10),
+                             DownloadableFile(Path('huge.bin'), 'http://url/huge.bin', size=5000 * 1024),
+                             DownloadableFile(Path('tiny.txt'), 'http://url/tiny.txt', size=1)]
+
+        # When: Downloading
+        grepo.download_files_at_location(tmp_path, files_to_download)
+
+        # Then: The first file grabs the free slot, then small files go first and large files biggest first
+        assert download_order == ['http://url/large.bin',
+                                  'http://url/small.txt',
+                                  'http://url/tiny.txt',
+                                  'http://url/huge.bin']
+
+
+class TestStats:
+    def test_count_requests_and_expose_concurrency_limit(self, tmp_path: Path, mock_api, thread_pool_executor):
+        mock_api.download_raw_file.return_value = b'CONTENT'
+        grepo = GRepo(mock_api, FileWriter(), thread_pool_executor, AimdLimiter(initial_limit=3))
+
+        files = grepo.get_files_to_download(user=NOT_USED, repo='multiple_directories_containing_files', path='')
+        grepo.download_files_at_location(tmp_path, files)
+
+        stats = grepo.stats()
+        assert stats['listing_requests'] == 3
+        assert stats['download_requests'] == 6
+        assert stats['concurrency_limit'] >= 3
+
+
+class TestPathFilter:
+    def test_excluded_directories_are_never_listed(self, mock_api, grepo):
+        # Given: Excluding a directory and all markdown files
+        path_filter = PathFilter(exclude=('another_dir', '*.md'))
+
+        # When: Exploring
+        files = grepo.get_files_to_download(user=NOT_USED, repo='multiple_directories_containing_files', path='',
+                                            path_filter=path_filter)
+
+        # Then: Excluded files are skipped, and the excluded directory isn't even listed
+        assert sorted(str(file.file_path) for file in files) == ['some_dir/a_file.txt', 'some_dir/another_file.py']
+        assert 'another_dir' not in [call.args[2] for call in mock_api.contents.call_args_list]
+        stats = grepo.stats()
+        assert stats['listing_requests'] == 2
+        assert stats['skipped_listing_requests'] == 1
+        assert stats['skipped_download_requests'] == 1
+
+    def test_relative_to_the_template(self, grepo):
+        files = grepo.get_files_to_download(user=NOT_USED, repo='nested_directories', path='dir_at_root',
+                                            path_filter=PathFilter(include=('dir_at_level_1/*.txt',)))
+
+        assert [file.file_path for file in files] == [Path('dir_at_level_1/file_at_level_2.txt')]
+
+
+class TestResumableDownloads:
+    def test_large_files_are_streamed_to_disk(self, tmp_path: Path, mock_api, grepo):
+        mock_api.download_raw_file_to.side_effect = \
+            lambda _url, partial_file, _size, _sha: partial_file.append([b'LARGE'])
+        large_file = DownloadableFile(Path('dir/large.bin'), 'http://url/large.bin', size=GRepo.RESUMABLE_MIN_SIZE)
+
+        grepo.download_files_at_location(tmp_path, [large_file])
+
+        assert (tmp_path / 'dir/large.bin').read_bytes() == b'LARGE'
+        assert [path.name for path in (tmp_path / 'dir').iterdir()] == ['large.bin']
+
+    def test_already_complete_files_are_skipped(self, tmp_path: Path, mock_api, grepo):
+        # Given: A previous run was interrupted after writing the first file
+        mock_api.download_raw_file.return_value = b'CONTENT'
+        (tmp_path / 'done.txt').write_text('CONTENT')
+        files = [DownloadableFile(Path('done.txt'), 'http://url/done.txt', size=len('CONTENT')),
+                 DownloadableFile(Path('missing.txt'), 'http://url/missing.txt', size=len('CONTENT'))]
+
+        # When: Running again
+        grepo.download_files_at_location(tmp_path, files)
+
+        # Then: Only the missing file is downloaded
+        mock_api.download_raw_file.assert_called_once_with('http://url/missing.txt', None)
+        assert grepo.stats()['already_complete_files'] == 1
+
+    def test_parent_directory_now_a_file(self, tmp_path: Path, mock_api, thread_pool_executor):
+        # Given: A local file where the listing has a directory
+        mock_api.download_raw_file.return_value = b'CONTENT'
+        (tmp_path / 'src').write_text('CONTENT')
+        file_writer = mock.MagicMock()
+        grepo = GRepo(mock_api, file_writer, thread_pool_executor)
+
+        # When: Downloading a file of that directory
+        grepo.download_files_at_location(tmp_path, [DownloadableFile(Path('src/Kata.java'), 'http://url/Kata.java',
+                                                                     size=len('CONTENT'))])
+
+        # Then: The file is missing, and downloaded
+        mock_api.download_raw_file.assert_called_once_with('http://url/Kata.java', None)
+        file_writer.write_bytes_to_file_in_sub_path.assert_called_once_with(tmp_path, Path('src/Kata.java'),
+                                                                            b'CONTENT')
+        assert grepo.stats()['already_complete_files'] == 0
+
+    def test_local_files_matching_their_sha_are_trusted(self, tmp_path: Path, mock_api, grepo):
+        # Given: Two local files of the listed size, only one with the listed contents
+        mock_api.download_raw_file.return_value = b'hello\n'
+        (tmp_path / 'same.txt').write_text('hello\n')
+        (tmp_path / 'changed.txt').write_text('hellO\n')
+        files = [DownloadableFile(Path(name), f'http://url/{name}', size=len('hello\n'), sha=HELLO_SHA)
+                 for name in ['same.txt', 'changed.txt']]
+
+        # When: Downloading
+        grepo.download_files_at_location(tmp_path, files)
+
+        # Then: Only the file not matching its sha is downloaded, for its sha to be verified
+        mock_api.download_raw_file.assert_called_once_with('http://url/changed.txt', HELLO_SHA)
+        assert (tmp_path / 'changed.txt').read_text() == 'hello\n'
+
+
 class TestDownloadFilesAtLocation:
     class TestSingleFile:
         class SingleFileTestHelper:
@@ -306,14 +452,14 @@ class TestDownloadFilesAtLocation:
                                                                        root_dir: Path,
                                                                        file_to_download: DownloadableFile,
                                                                        file_content: str):
-                def return_file_content_only_for_correct_url(url):
+                def return_file_content_only_for_correct_url(url, _sha):
                     if url == file_to_download.download_url:
-                        return file_content
+                        return file_content.encode()
                     else:
                         pytest.fail(f"Api wasn't called with the correct url | Incorrect URL: {url}")
 
                 # Given: Mock Api returning the file contents only if queried with the correct url
-                self._mock_api.download_raw_text_file.side_effect = return_file_content_only_for_correct_url
+                self._mock_api.download_raw_file.side_effect = return_file_content_only_for_correct_url
 
                 # When: Downloading file at location
                 self._grepo.download_files_at_location(root_dir, [file_to_download])
@@ -367,6 +513,14 @@ class TestDownloadFilesAtLocation:
             expected_written_file_path = root_dir / 'expected/path/expected_name.md'
             assert expected_written_file_path.exists()
 
+        def test_binary_file_is_written_as_received(self, tmp_path: Path, mock_api: GithubApi, grepo: GRepo):
+            contents = b'\x89PNG\r\n\x1a\n\xff'
+            mock_api.download_raw_file.return_value = contents
+
+            grepo.download_files_at_location(tmp_path, [DownloadableFile(Path('logo.png'), 'http://url/logo.png')])
+
+            assert (tmp_path / 'logo.png').read_bytes() == contents
+
         def test_root_dir_doesnt_exist_then_create_it(self, tmp_path: Path, single_file_test_helper):
             file = DownloadableFile(file_path=Path('this/is/a/sub_path/file.txt'),
                                     download_url='http://this_is_the_url/this/is/a/sub_path/file.txt')
@@ -379,7 +533,7 @@ class TestDownloadFilesAtLocation:
 
     class TestMultipleFiles:
         def test_diverse_multiple_files(self, tmp_path: Path, mock_api: GithubApi, grepo: GRepo):
-            def return_file_content_for_correct_url(url):
+            def return_file_content_for_correct_url(url, _sha):
                 mock_content_for_url = {
                     'http://this_is_the_url/file_1.md': "CONTENT FOR 'file_1.md'",
                     'http://this_is_the_url/file_2.md': "CONTENT FOR 'file_2.md'",
@@ -389,10 +543,10 @@ class TestDownloadFilesAtLocation:
                 }
                 if url not in mock_content_for_url:
                     pytest.fail(f"Api wasn't called with the correct url | Incorrect URL: {url}")
-                return mock_content_for_url[url]
+                return mock_content_for_url[url].encode()
 
             # GIVEN: A list of DownloadableFiles w/ content available in the Mock Api
-            mock_api.download_raw_text_file.side_effect = return_file_content_for_correct_url
+            mock_api.download_raw_file.side_effect = return_file_content_for_correct_url
             files_to_download = [
                 DownloadableFile(file_path=Path('file_1.md'),
                                  download_url='http://this_is_the_url/file_1.md'),
@@ -422,11 +576,29 @@ class TestDownloadFilesAtLocation:
             assert_file_at_path_has_content(root_dir / 'sub/path/file_in_sub_path.md',
                                             "CONTENT FOR 'file_in_sub_path.md'")
 
+        def test_files_are_taken_from_the_listing_as_downloads_complete(self, tmp_path: Path, mock_api, grepo):
+            # Given: At most 2 queued downloads, and a listing of 10 files
+            grepo.MAX_QUEUED_DOWNLOADS = 2
+            started_downloads = []
+            mock_api.download_raw_file.side_effect = lambda url, _sha: started_downloads.append(url) or b'CONTENT'
+
+            def listing():
+                for index in range(10):
+                    # Then: A file is only taken from the listing once the ones before it are downloading
+                    assert len(started_downloads) >= index - 1
+                    yield DownloadableFile(Path(f'file_{index}.txt'), f'http://url/file_{index}.txt')
+
+            # When: Downloading
+            grepo.download_files_at_location(tmp_path, listing())
+
+            # Then: All files are downloaded
+            assert len(started_downloads) == 10
+
     @pytest.mark.usefixtures('ensure_mock_api_isn_t_called')
     class TestEdgeCases:
         @pytest.fixture
         def ensure_mock_api_isn_t_called(self, mock_api: GithubApi):
-            mock_api.download_raw_text_file.side_effect = NotImplementedError
+            mock_api.download_raw_file.side_effect = NotImplementedError
 
         def test_empty_list(self, tmp_path: Path, grepo: GRepo):
             root_dir = tmp_path
@@ -449,3 +621,52 @@ class TestDownloadFilesAtLocation:
                                                  files_to_download=[DownloadableFile(Path('file.txt'),
                                                                                      'http://url.com/file.txt')])
             assert raised_exception.match(r"Root dir '.*not_a_dir' is not a directory")
+
+
+class TestGitGRepo:
+    @pytest.fixture
+    def git_grepo(self, tmp_path: Path, bare_git_repo):
+        bare_git_repo.commit({'java/junit5/pom.xml': 'junit5',
+                              'java/junit5/src/Kata.java': 'class Kata {}',
+                              'java/hamcrest/pom.xml': 'hamcrest'})
+        git = GitCli()
+        return GitGRepo(PartialClone(tmp_path / 'clones', git, bare_git_repo.url_template), git, FileWriter())
+
+    def test_get_files_to_download(self, git_grepo: GitGRepo, bare_git_repo):
+        files = git_grepo.get_files_to_download(bare_git_repo.USER, bare_git_repo.REPO, 'java/junit5')
+        assert [file.file_path for file in files] == [Path('pom.xml'), Path('src/Kata.java')]
+
+    def test_path_filter(self, git_grepo: GitGRepo, bare_git_repo):
+        files = git_grepo.get_files_to_download(bare_git_repo.USER, bare_git_repo.REPO, 'java/junit5',
+                                                PathFilter(exclude=('src',)))
+
+        assert [file.file_path for file in files] == [Path('pom.xml')]
+        assert git_grepo.stats()['skipped_files'] == 1
+
+    def test_download_files_at_location(self, tmp_path: Path, git_grepo: GitGRepo, bare_git_repo):
+        # Given: Files of the 'junit5' template
+        files = git_grepo.get_files_to_download(bare_git_repo.USER, bare_git_repo.REPO, 'java/junit5')
+
+        # When: Downloading them
+        kata_dir = tmp_path / 'my_kata'
+        git_grepo.download_files_at_location(kata_dir, files)
+
+        # Then: Files are written without the template nesting
+        assert (kata_dir / 'pom.xml').read_text() == 'junit5'
+        assert (kata_dir / 'src/Kata.java').read_text() == 'class Kata {}'
+        assert sorted(path.name for path in kata_dir.rglob('*')) == ['Kata.java', 'pom.xml', 'src']
+
+    def test_files_matching_their_sha_are_not_checked_out_again(self, tmp_path: Path, git_grepo: GitGRepo,
+                                                                bare_git_repo):
+        # Given: A kata where one of the files was edited since
+        files = git_grepo.get_files_to_download(bare_git_repo.USER, bare_git_repo.REPO, 'java/junit5')
+        kata_dir = tmp_path / 'my_kata'
+        git_grepo.download_files_at_location(kata_dir, files)
+        (kata_dir / 'pom.xml').write_text('edited')
+
+        # When: Downloading again
+        git_grepo.download_files_at_location(kata_dir, files)
+
+        # Then: Only the edited file is restored
+        assert (kata_dir / 'pom.xml').read_text() == 'junit5'
+        assert git_grepo.stats()['already_complete_files'] == 1
@@ -0,0 +1,106 @@
+"""
+Performance regression suite for `GRepo`
+
+Each scenario explores then downloads a synthetic template from a `FakeGithubApi` with injected latency.
+Timings are read from a `VirtualClock` advanced by the injected latency only: they depend on how well `GRepo`
+overlaps requests, not on the machine running the suite.
+
+Deselected by default. Results are compared to 'grepo_performance_baseline.json':
+
+    python -m pytest -m performance tests/kata/domain/test_grepo_performance.py
+
+To accept new results as the baseline:
+
+    KATA_UPDATE_PERF_BASELINE=1 python -m pytest -m performance tests/kata/domain/test_grepo_performance.py
+"""
+import json
+import os
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+
+from kata.bench.shapes import TreeShape, wide, deep, many_tiny_files, few_huge_files, large_template, MIB
+from kata.data.io.file import FileWriter
+from kata.domain.concurrency import AimdLimiter
+from kata.domain.grepo import GRepo
+from tests.kata.bench.fake_api import FakeGithubApi, VirtualClock
+
+BASELINE_FILE = Path(__file__).parent / 'grepo_performance_baseline.json'
+UPDATE_BASELINE = os.environ.get('KATA_UPDATE_PERF_BASELINE') == '1'
+# Relative increase allowed before failing, on timings and peak memory. Request counts must not increase at all
+TOLERANCE = float(os.environ.get('KATA_PERF_TOLERANCE', '0.5'))
+LATENCY = 0.01
+
+SCENARIOS = {
+    'wide': wide(dirs=20, files_per_dir=5),
+    'deep': deep(depth=10),
+    'many_tiny_files': many_tiny_files(count=200),
+    'few_huge_files': few_huge_files(count=2, file_size=MIB),
+    # Catches the download path holding on to the contents of all files
+    'large_template': large_template(count=40, file_size=8 * MIB),
+}
+# Peak memory grows with the number of files in flight: only compared at a fixed concurrency
+PINNED_CONCURRENCY = {'large_template': 8}
+
+pytestmark = pytest.mark.performance
+
+
+def measure(shape: TreeShape, kata_dir: Path, concurrency: Optional[int] = None) -> Dict[str, float]:
+    """
+    :param concurrency: Fixed limit on concurrent requests. Otherwise adjusted by the `AimdLimiter`, as in real use
+    """
+    clock = VirtualClock()
+    api = FakeGithubApi(shape, latency=LATENCY, clock=clock)
+    limiter = AimdLimiter(initial_limit=concurrency, min_limit=concurrency, max_limit=concurrency) \
+        if concurrency else None
+    with ThreadPoolExecutor(64) as executor:
+        grepo = GRepo(api, FileWriter(), clock.propagated_to(executor), limiter)
+        tracemalloc.start()
+        try:
+            start = clock()
+            files = grepo.get_files_to_download('user', 'repo', '')
+            explored = clock()
+            grepo.download_files_at_location(kata_dir, files)
+            downloaded = clock()
+            _current, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {'exploration_time': round(explored - start, 4),
+            'download_time': round(downloaded - explored, 4),
+            'contents_calls': api.contents_calls,
+            'download_calls': api.download_calls,
+            'peak_memory': peak_memory}
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    baseline = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+    yield baseline
+    if UPDATE_BASELINE:
+        BASELINE_FILE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+def test_no_regression(scenario: str, baseline: dict, tmp_path: Path):
+    results = measure(SCENARIOS[scenario], tmp_path / 'kata', PINNED_CONCURRENCY.get(scenario))
+
+    if UPDATE_BASELINE:
+        baseline[scenario] = results
+        return
+    if scenario not in baseline:
+        pytest.fail(f"No baseline for '{scenario}'. Record it with KATA_UPDATE_PERF_BASELINE=1")
+
+    expected = baseline[scenario]
+    allowed = {'exploration_time': expected['exploration_time'] * (1 + TOLERANCE),
+               'download_time': expected['download_time'] * (1 + TOLERANCE),
+               'peak_memory': expected['peak_memory'] * (1 + TOLERANCE),
+               'contents_calls': expected['contents_calls'],
+               'download_calls': expected['download_calls']}
+    regressions = [f"{metric}: {results[metric]} (baseline: {expected[metric]}, allowed: {allowed[metric]:.4g})"
+                   for metric in allowed
+                   if results[metric] > allowed[metric]]
+    assert not regressions, f"Performance regression in '{scenario}':\n" + '\n'.join(regressions)
@@ -0,0 +1,54 @@
+import pytest
+
+from kata.domain.path_filter import PathFilter
+
+
+class TestExclude:
+    @pytest.mark.parametrize('pattern, path', [('.idea', '.idea'),
+                                               ('.idea', 'module/.idea/workspace.xml'),
+                                               ('*.png', 'docs/images/logo.png'),
+                                               ('gradle/wrapper', 'gradle/wrapper/gradle-wrapper.jar'),
+                                               ('docs/**/*.png', 'docs/logo.png'),
+                                               ('docs/**/*.png', 'docs/images/logo.png')])
+    def test_excluded(self, pattern, path):
+        assert not PathFilter(exclude=(pattern,)).accepts_file(path)
+
+    @pytest.mark.parametrize('pattern, path', [('.idea', 'idea.txt'),
+                                               ('*.png', 'logo.png.txt'),
+                                               ('gradle/wrapper', 'module/gradle/wrapper/gradle-wrapper.jar'),
+                                               ('src/*.java', 'src/main/Main.java')])
+    def test_not_excluded(self, pattern, path):
+        assert PathFilter(exclude=(pattern,)).accepts_file(path)
+
+    def test_excluded_directory(self):
+        assert PathFilter(exclude=('.github',)).excludes_dir('.github')
+        assert not PathFilter(exclude=('*.png',)).excludes_dir('src')
+
+    def test_everything_in_a_directory_excludes_the_directory(self):
+        path_filter = PathFilter(exclude=('docs/**',))
+
+        assert path_filter.excludes_dir('docs')
+        assert not path_filter.accepts_file('docs/images/logo.png')
+        assert not path_filter.excludes_dir('module/docs')
+
+
+class TestInclude:
+    def test_only_included_files_are_accepted(self):
+        path_filter = PathFilter(include=('src', 'pom.xml'))
+
+        assert path_filter.accepts_file('src/main/Main.java')
+        assert path_filter.accepts_file('pom.xml')
+        assert not path_filter.accepts_file('README.md')
+
+    def test_exclude_wins_over_include(self):
+        path_filter = PathFilter(include=('src',), exclude=('*.png',))
+
+        assert not path_filter.accepts_file('src/logo.png')
+
+    def test_directories_are_never_excluded_by_include(self):
+        assert not PathFilter(include=('*.java',)).excludes_dir('src')
+
+
+def test_empty_filter_accepts_everything():
+    assert not PathFilter()
+    assert PathFilter().accepts_file('anything/at/all.txt')
@@ -0,0 +1,226 @@
+from pathlib import Path
+from typing import Optional
+from unittest.mock import MagicMock
+
+import pytest
+
+from kata.data.io.file import FileReader, FileWriter
+from kata.domain.file_tree import FileTree
+from kata.domain.models import DownloadableFile
+from kata.domain.path_filter import PathFilter
+from kata.domain.planner import TemplateShape, PlannerStats, StrategyPlanner, PlannedGRepo, TYPICAL_TEMPLATE, \
+    CONTENTS, PARTIAL_CLONE, CACHED_CLONE, template_key
+
+SMALL_TEMPLATE = TemplateShape(files=3, dirs=0, depth=0, total_size=1024)
+LARGE_TEMPLATE = TemplateShape(files=200, dirs=30, depth=5, total_size=1024 * 1024)
+
+
+@pytest.fixture
+def stats():
+    return PlannerStats(None, FileReader(), FileWriter())
+
+
+def create_planner(stats: PlannerStats, cloned: Optional[bool] = None, remaining_rate_limit: Optional[int] = None,
+                   round_trip_time: Optional[float] = None):
+    """
+    :param cloned: None when partial clones are not available
+    """
+    return StrategyPlanner(stats,
+                           concurrency=4,
+                           is_cloned=None if cloned is None else lambda _user, _repo: cloned,
+                           remaining_rate_limit=lambda: remaining_rate_limit,
+                           round_trip_time=lambda: round_trip_time)
+
+
+def test_template_shape():
+    files = [DownloadableFile(Path('README.md'), 'url'),
+             DownloadableFile(Path('src/main/Main.java'), 'url', size=100),
+             DownloadableFile(Path('src/test/MainTest.java'), 'url', size=200)]
+
+    assert TemplateShape.of(files) == TemplateShape(files=3, dirs=3, depth=2, total_size=300)
+
+
+class TestStrategyPlanner:
+    def test_template_never_fetched_before(self, stats: PlannerStats):
+        plan = create_planner(stats).plan('frank', 'bootstraps', 'java/junit5')
+
+        assert plan.shape == TYPICAL_TEMPLATE
+        assert plan.shape_is_guessed
+        assert [estimate.strategy for estimate in plan.estimates] == [CONTENTS]
+
+    def test_small_template_from_the_api(self, stats: PlannerStats):
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), SMALL_TEMPLATE)
+
+        plan = create_planner(stats, cloned=False).plan('frank', 'bootstraps', 'java/junit5')
+
+        assert not plan.shape_is_guessed
+        assert [estimate.strategy for estimate in plan.estimates] == [CONTENTS, PARTIAL_CLONE]
+        assert plan.chosen.api_calls == 1
+        assert plan.chosen.requests == 4
+
+    def test_large_template_from_a_clone(self, stats: PlannerStats):
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), LARGE_TEMPLATE)
+
+        plan = create_planner(stats, cloned=True).plan('frank', 'bootstraps', 'java/junit5')
+
+        assert plan.chosen.strategy == CACHED_CLONE
+        assert plan.chosen.api_calls == 0
+
+    def test_strategies_over_the_remaining_rate_limit_come_last(self, stats: PlannerStats):
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), SMALL_TEMPLATE)
+
+        plan = create_planner(stats, cloned=False, remaining_rate_limit=0).plan('frank', 'bootstraps', 'java/junit5')
+
+        assert [(estimate.strategy, estimate.within_rate_limit) for estimate in plan.estimates] == [
+            (PARTIAL_CLONE, True), (CONTENTS, False)]
+
+    def test_calibrated_by_previous_runs(self, stats: PlannerStats):
+        # Given: The Api was 10 times slower than estimated on previous runs
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), SMALL_TEMPLATE)
+        uncalibrated = create_planner(stats, cloned=False).plan('frank', 'bootstraps', 'java/junit5')
+        for _ in range(3):
+            stats.record_run(CONTENTS, estimated_wall_time=1.0, actual_wall_time=10.0)
+
+        # When: Planning again
+        plan = create_planner(stats, cloned=False).plan('frank', 'bootstraps', 'java/junit5')
+
+        # Then: Estimate is scaled accordingly, and the clone is now cheaper
+        assert plan.chosen.strategy == PARTIAL_CLONE
+        [contents] = [estimate for estimate in plan.estimates if estimate.strategy == CONTENTS]
+        assert contents.calibration == 10.0
+        assert contents.wall_time == pytest.approx(uncalibrated.chosen.wall_time * 10)
+
+    def test_api_calls_are_part_of_the_cost(self, stats: PlannerStats):
+        # Given: A template with many directories, and clones 3 times slower than estimated
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), TemplateShape(40, 10, 2, 1024))
+        stats.record_run(CONTENTS, estimated_wall_time=1.0, actual_wall_time=1.0)
+        stats.record_run(PARTIAL_CLONE, estimated_wall_time=1.0, actual_wall_time=3.0)
+
+        plan = create_planner(stats, cloned=False).plan('frank', 'bootstraps', 'java/junit5')
+
+        # Then: The clone is chosen even though the Api is faster: it doesn't spend the rate limit
+        [contents] = [estimate for estimate in plan.estimates if estimate.strategy == CONTENTS]
+        assert contents.wall_time < plan.chosen.wall_time
+        assert plan.chosen.strategy == PARTIAL_CLONE
+
+    def test_measured_round_trip_time(self, stats: PlannerStats):
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), SMALL_TEMPLATE)
+
+        default = create_planner(stats).plan('frank', 'bootstraps', 'java/junit5')
+        measured = create_planner(stats, round_trip_time=StrategyPlanner.ROUND_TRIP_TIME / 10).plan(
+            'frank', 'bootstraps', 'java/junit5')
+
+        assert measured.chosen.wall_time < default.chosen.wall_time / 5
+
+    def test_strategy_never_timed_is_tried_when_close_to_the_best(self, stats: PlannerStats):
+        # Given: Only the Api was timed before
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), SMALL_TEMPLATE)
+        stats.record_run(CONTENTS, estimated_wall_time=1.0, actual_wall_time=1.0)
+
+        # When: Planning, a clone being estimated a bit slower
+        plan = create_planner(stats, cloned=False).plan('frank', 'bootstraps', 'java/junit5')
+
+        # Then: The clone is tried, to calibrate it
+        assert plan.exploring
+        assert [estimate.strategy for estimate in plan.estimates] == [PARTIAL_CLONE, CONTENTS]
+
+        # When: Once it was timed
+        stats.record_run(PARTIAL_CLONE, estimated_wall_time=1.0, actual_wall_time=1.0)
+        plan = create_planner(stats, cloned=False).plan('frank', 'bootstraps', 'java/junit5')
+
+        # Then: Best one is chosen again
+        assert not plan.exploring
+        assert plan.chosen.strategy == CONTENTS
+
+    def test_filtered_template_has_a_shape_of_its_own(self, stats: PlannerStats):
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5'), LARGE_TEMPLATE)
+        path_filter = PathFilter(exclude=('docs/**',))
+        stats.record_shape(template_key('frank', 'bootstraps', 'java/junit5', path_filter), SMALL_TEMPLATE)
+
+        assert create_planner(stats).plan('frank', 'bootstraps', 'java/junit5', path_filter).shape == SMALL_TEMPLATE
+
+
+class TestPlannerStats:
+    def test_persisted_between_runs(self, tmp_path: Path):
+        stats = PlannerStats(tmp_path / 'planner_stats.json', FileReader(), FileWriter())
+        stats.record_shape('frank/bootstraps/java', SMALL_TEMPLATE)
+        stats.record_run(CONTENTS, 1.0, 2.0)
+        stats.save()
+
+        reloaded_stats = PlannerStats(tmp_path / 'planner_stats.json', FileReader(), FileWriter())
+        assert reloaded_stats.shape_of('frank/bootstraps/java') == SMALL_TEMPLATE
+        assert reloaded_stats.calibration(CONTENTS) == 2.0
+
+    def test_unknown_size_does_not_override_known_size(self, stats: PlannerStats):
+        stats.record_shape('frank/bootstraps/java', SMALL_TEMPLATE)
+
+        stats.record_shape('frank/bootstraps/java', SMALL_TEMPLATE._replace(files=4, total_size=0))
+
+        assert stats.shape_of('frank/bootstraps/java') == SMALL_TEMPLATE._replace(files=4)
+
+
+class TestPlannedGRepo:
+    FILES = [DownloadableFile(Path('README.md'), 'url', size=100)]
+
+    @pytest.fixture
+    def contents_grepo(self):
+        grepo = MagicMock()
+        grepo.get_files_to_download.return_value = self.FILES
+        grepo.stats.return_value = {'listing_requests': 1}
+        return grepo
+
+    @pytest.fixture
+    def clone_grepo(self):
+        return MagicMock()
+
+    def test_fetch_with_the_planned_strategy(self, tmp_path: Path, stats: PlannerStats, contents_grepo, clone_grepo):
+        stats.record_shape(template_key('frank', 'bootstraps', 'java'), SMALL_TEMPLATE)
+        planned_grepo = PlannedGRepo(create_planner(stats, cloned=False), stats,
+                                     {CONTENTS: contents_grepo, PARTIAL_CLONE: clone_grepo})
+
+        files = planned_grepo.get_files_to_download('frank', 'bootstraps', 'java')
+        planned_grepo.download_files_at_location(tmp_path, files)
+
+        contents_grepo.download_files_at_location.assert_called_with(tmp_path, self.FILES)
+        clone_grepo.get_files_to_download.assert_not_called()
+        assert planned_grepo.stats() == {'strategy': CONTENTS, 'listing_requests': 1}
+
+    def test_shape_is_recorded(self, tmp_path: Path, stats: PlannerStats, contents_grepo):
+        planned_grepo = PlannedGRepo(create_planner(stats), stats, {CONTENTS: contents_grepo})
+
+        planned_grepo.get_files_to_download('frank', 'bootstraps', 'java')
+
+        assert stats.shape_of(template_key('frank', 'bootstraps', 'java')) == TemplateShape(1, 0, 0, 100)
+
+    def test_shape_is_recorded_per_path_filter(self, stats: PlannerStats, contents_grepo):
+        planned_grepo = PlannedGRepo(create_planner(stats), stats, {CONTENTS: contents_grepo})
+
+        planned_grepo.get_files_to_download('frank', 'bootstraps', 'java', PathFilter(include=('*.md',)))
+
+        assert stats.shape_of(template_key('frank', 'bootstraps', 'java')) is None
+        assert stats.shape_of(template_key('frank', 'bootstraps', 'java', PathFilter(include=('*.md',)))) == \
+               TemplateShape(1, 0, 0, 100)
+
+    def test_shape_of_a_file_tree_is_recorded(self, stats: PlannerStats, contents_grepo):
+        file_tree = FileTree()
+        file_tree.add('src/Main.java', 'url', size=100)
+        contents_grepo.get_file_tree.return_value = file_tree
+        planned_grepo = PlannedGRepo(create_planner(stats), stats, {CONTENTS: contents_grepo})
+
+        assert planned_grepo.get_file_tree('frank', 'bootstraps', '') is file_tree
+        assert stats.shape_of(template_key('frank', 'bootstraps', '')) == TemplateShape(1, 1, 1, 100)
+
+    def test_calibrated_only_when_the_shape_was_known(self, tmp_path: Path, stats: PlannerStats, contents_grepo):
+        planned_grepo = PlannedGRepo(create_planner(stats), stats, {CONTENTS: contents_grepo})
+
+        # Given: First run, the shape is guessed
+        planned_grepo.download_files_at_location(tmp_path, planned_grepo.get_files_to_download('frank', 'bootstraps',
+                                                                                               'java'))
+        assert stats.calibration(CONTENTS) == 1.0
+
+        # When: Second run, the shape is known
+        planned_grepo.download_files_at_location(tmp_path, planned_grepo.get_files_to_download('frank', 'bootstraps',
+                                                                                               'java'))
+
+        # Then: The run calibrates the strategy
+        assert stats.calibration(CONTENTS) != 1.0
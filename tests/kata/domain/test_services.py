@@ -1,16 +1,24 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import shutil
 from typing import Union
 from unittest import mock
 from unittest.mock import MagicMock
 
 import pytest
 
+from kata.data.io.file import FileReader, FileWriter
+from kata.data.manifest import KataManifestRepo
 from kata.data.repos import HardCoded
+from kata.diagnostics import tracing
 from kata.defaults import DEFAULT_CONFIG
-from kata.domain.exceptions import InvalidKataName, KataLanguageNotFound, KataTemplateNotFound
+from kata.domain.exceptions import InvalidKataName, KataLanguageNotFound, KataTemplateNotFound, KataManifestInTheWay
 from kata.domain.grepo import GRepo
-from kata.domain.models import DownloadableFile, KataLanguage, KataTemplate
-from kata.domain.services import InitKataService, LoginService
+from kata.domain.models import DownloadableFile, KataLanguage, KataTemplate, KataGRepoSource, KataManifest, \
+    KataStatus
+from kata.domain.path_filter import PathFilter
+from kata.domain.planner import StrategyPlanner, PlannerStats, CONTENTS, TemplateShape, template_key
+from kata.domain.services import InitKataService, LoginService, KataStatusService
 
 NOT_USED = 'Not Used'
 VALID_KATA_NAME = 'kata_name'
@@ -69,12 +77,137 @@ class TestInitKataService:
                 mock_grepo.get_files_to_download.assert_called_with(
                     user=DEFAULT_CONFIG['KataGRepo']['User'],
                     repo=DEFAULT_CONFIG['KataGRepo']['Repo'],
-                    path='java/junit5')
+                    path='java/junit5',
+                    path_filter=PathFilter())
                 # - Files are requested to be downloaded in parent_dir/kata_name
                 #   Note: MOCK_FILES_TO_DOWNLOAD are set in the mock_grepo fixture initialization
                 mock_grepo.download_files_at_location.assert_called_with(parent_dir / kata_name,
                                                                          MOCK_FILES_TO_DOWNLOAD)
 
+            def test_phases_are_traced(self,
+                                       tmp_path: Path,
+                                       kata_language_repo: HardCoded.KataLanguageRepo,
+                                       kata_template_repo: HardCoded.KataTemplateRepo,
+                                       init_kata_service: InitKataService):
+                kata_language_repo.available_languages = ['java']
+                kata_template_repo.available_templates = {'java': ['junit5']}
+
+                tracer = tracing.start_tracing()
+                try:
+                    init_kata_service.init_kata(tmp_path, 'my_kata', 'java', 'junit5')
+                finally:
+                    tracing.stop_tracing()
+
+                traced_phases = [event['name'] for event in tracer.events() if event['ph'] == 'X']
+                assert traced_phases == ['validate', 'resolve_language', 'resolve_template', 'list',
+                                         'download_and_write', 'init_kata']
+
+            def test_plan_without_downloading(self,
+                                              tmp_path: Path,
+                                              kata_language_repo: HardCoded.KataLanguageRepo,
+                                              kata_template_repo: HardCoded.KataTemplateRepo,
+                                              mock_grepo: MagicMock,
+                                              config_repo: HardCoded.ConfigRepo):
+                kata_language_repo.available_languages = ['java']
+                kata_template_repo.available_templates = {'java': ['junit5']}
+                planner = StrategyPlanner(PlannerStats(None, FileReader(), FileWriter()), concurrency=4)
+                init_kata_service = InitKataService(kata_language_repo, kata_template_repo, mock_grepo, config_repo,
+                                                    planner)
+
+                plan = init_kata_service.plan_kata(tmp_path, 'my_kata', 'java', 'junit5')
+
+                assert plan.chosen.strategy == CONTENTS
+                mock_grepo.get_files_to_download.assert_not_called()
+                mock_grepo.download_files_at_location.assert_not_called()
+                assert not (tmp_path / 'my_kata').exists()
+
+            def test_plan_with_the_path_filter(self,
+                                               tmp_path: Path,
+                                               kata_language_repo: HardCoded.KataLanguageRepo,
+                                               kata_template_repo: HardCoded.KataTemplateRepo,
+                                               mock_grepo: MagicMock,
+                                               config_repo: HardCoded.ConfigRepo):
+                # Given: The template was fetched before, once without any filter and once without its docs
+                kata_language_repo.available_languages = ['java']
+                kata_template_repo.available_templates = {'java': ['junit5']}
+                stats = PlannerStats(None, FileReader(), FileWriter())
+                user, repo = config_repo.get_kata_grepo_username(), config_repo.get_kata_grepo_reponame()
+                stats.record_shape(template_key(user, repo, 'java/junit5'), TemplateShape(500, 50, 5, 10 ** 6))
+                stats.record_shape(template_key(user, repo, 'java/junit5', PathFilter(exclude=('docs/**',))),
+                                   TemplateShape(5, 1, 1, 1000))
+                init_kata_service = InitKataService(kata_language_repo, kata_template_repo, mock_grepo, config_repo,
+                                                    StrategyPlanner(stats, concurrency=4))
+
+                # When: Planning without the docs
+                plan = init_kata_service.plan_kata(tmp_path, 'my_kata', 'java', 'junit5', exclude=('docs/**',))
+
+                # Then: The plan is for the filtered template
+                assert plan.shape == TemplateShape(5, 1, 1, 1000)
+
+            def test_path_filter_defaults_to_the_config(self,
+                                                        tmp_path: Path,
+                                                        kata_language_repo: HardCoded.KataLanguageRepo,
+                                                        kata_template_repo: HardCoded.KataTemplateRepo,
+                                                        mock_grepo: MagicMock,
+                                                        config_repo: HardCoded.ConfigRepo,
+                                                        init_kata_service: InitKataService):
+                # Given: Default filters for 'java' in the config
+                kata_language_repo.available_languages = ['java']
+                kata_template_repo.available_templates = {'java': ['junit5']}
+                config_repo._config = dict(config_repo.config, Filters={'java': {'Include': ['src'],
+                                                                                 'Exclude': ['.idea']}})
+
+                # When: Only overriding the excluded globs
+                init_kata_service.init_kata(tmp_path, 'my_kata', 'java', 'junit5', exclude=('*.png',))
+
+                # Then: Included globs are the default ones
+                _args, kwargs = mock_grepo.get_files_to_download.call_args
+                assert kwargs['path_filter'] == PathFilter(include=('src',), exclude=('*.png',))
+
+            def test_manifest_is_recorded_in_the_kata(self,
+                                                      tmp_path: Path,
+                                                      kata_language_repo: HardCoded.KataLanguageRepo,
+                                                      kata_template_repo: HardCoded.KataTemplateRepo,
+                                                      mock_grepo: MagicMock,
+                                                      config_repo: HardCoded.ConfigRepo):
+                kata_language_repo.available_languages = ['java']
+                kata_template_repo.available_templates = {'java': ['junit5']}
+                manifest_repo = KataManifestRepo(FileWriter())
+                init_kata_service = InitKataService(kata_language_repo, kata_template_repo, mock_grepo, config_repo,
+                                                    kata_manifest_repo=manifest_repo)
+
+                init_kata_service.init_kata(tmp_path, 'my_kata', 'java', 'junit5')
+
+                assert manifest_repo.get(tmp_path / 'my_kata') == KataManifest(
+                    user=DEFAULT_CONFIG['KataGRepo']['User'],
+                    repo=DEFAULT_CONFIG['KataGRepo']['Repo'],
+                    path='java/junit5',
+                    path_filter=PathFilter(),
+                    files=MOCK_FILES_TO_DOWNLOAD)
+
+            def test_template_file_in_the_way_of_the_manifest(self,
+                                                               tmp_path: Path,
+                                                               kata_language_repo: HardCoded.KataLanguageRepo,
+                                                               kata_template_repo: HardCoded.KataTemplateRepo,
+                                                               mock_grepo: MagicMock,
+                                                               config_repo: HardCoded.ConfigRepo):
+                # Given: A template with its own file where the manifest goes
+                kata_language_repo.available_languages = ['java']
+                kata_template_repo.available_templates = {'java': ['junit5']}
+                mock_grepo.get_files_to_download.return_value = [
+                    *MOCK_FILES_TO_DOWNLOAD,
+                    DownloadableFile(Path('.kata/manifest.json'), 'http://hello.com/.kata/manifest.json')]
+                init_kata_service = InitKataService(kata_language_repo, kata_template_repo, mock_grepo, config_repo,
+                                                    kata_manifest_repo=KataManifestRepo(FileWriter()))
+
+                # When: Initializing a kata
+                with pytest.raises(KataManifestInTheWay) as expected_error:
+                    init_kata_service.init_kata(tmp_path, 'my_kata', 'java', 'junit5')
+
+                # Then: Refused before anything is downloaded
+                assert expected_error.value.file_path == Path('.kata/manifest.json')
+                mock_grepo.download_files_at_location.assert_not_called()
+
             class TestNoExplicitTemplateNameBut:
                 def test_only_one_template_available_for_language(self,
                                                                   tmp_path: Path,
@@ -96,7 +229,8 @@ class TestInitKataService:
                     mock_grepo.get_files_to_download.assert_called_with(
                         user=DEFAULT_CONFIG['KataGRepo']['User'],
                         repo=DEFAULT_CONFIG['KataGRepo']['Repo'],
-                        path='java/junit5')
+                        path='java/junit5',
+                        path_filter=PathFilter())
 
                 def test_only_one_template_at_root(self,
                                                    tmp_path: Path,
@@ -118,7 +252,8 @@ class TestInitKataService:
                     mock_grepo.get_files_to_download.assert_called_with(
                         user=DEFAULT_CONFIG['KataGRepo']['User'],
                         repo=DEFAULT_CONFIG['KataGRepo']['Repo'],
-                        path='java')
+                        path='java',
+                        path_filter=PathFilter())
 
                 def test_default_specified_and_valid(self):
                     # TODO: Test the valid case: No explicit template name, but default is specified and valid
@@ -216,6 +351,51 @@ class TestInitKataService:
                     # TODO: Test when default template is invalid
                     pytest.skip('TODO')
 
+    class TestMultipleSources:
+        PUBLIC = KataGRepoSource('default', 'public_user', 'public_repo', priority=0)
+        INTERNAL = KataGRepoSource('internal', 'company', 'internal_repo', priority=10)
+
+        @pytest.fixture
+        def kata_template_repo(self):
+            templates_in_priority_order = [KataTemplate(KataLanguage('java'), 'junit5', self.INTERNAL),
+                                           KataTemplate(KataLanguage('java'), 'junit5', self.PUBLIC),
+                                           KataTemplate(KataLanguage('java'), 'hamcrest', self.PUBLIC)]
+            kata_template_repo = MagicMock()
+            kata_template_repo.get_for_language.return_value = templates_in_priority_order
+            return kata_template_repo
+
+        @pytest.fixture(autouse=True)
+        def java_is_available(self, kata_language_repo: HardCoded.KataLanguageRepo):
+            kata_language_repo.available_languages = ['java']
+
+        def test_highest_priority_source_having_the_template_wins(self,
+                                                                  tmp_path: Path,
+                                                                  mock_grepo: MagicMock,
+                                                                  init_kata_service: InitKataService):
+            init_kata_service.init_kata(tmp_path, VALID_KATA_NAME, 'java', 'junit5')
+            mock_grepo.get_files_to_download.assert_called_with(user='company', repo='internal_repo',
+                                                                 path='java/junit5', path_filter=PathFilter())
+
+        def test_template_only_in_lower_priority_source(self,
+                                                        tmp_path: Path,
+                                                        mock_grepo: MagicMock,
+                                                        init_kata_service: InitKataService):
+            init_kata_service.init_kata(tmp_path, VALID_KATA_NAME, 'java', 'hamcrest')
+            mock_grepo.get_files_to_download.assert_called_with(user='public_user', repo='public_repo',
+                                                                 path='java/hamcrest', path_filter=PathFilter())
+
+        def test_explicit_source(self, tmp_path: Path, mock_grepo: MagicMock, init_kata_service: InitKataService):
+            init_kata_service.init_kata(tmp_path, VALID_KATA_NAME, 'java', 'default:junit5')
+            mock_grepo.get_files_to_download.assert_called_with(user='public_user', repo='public_repo',
+                                                                 path='java/junit5', path_filter=PathFilter())
+
+        def test_explicit_source_without_the_template(self, tmp_path: Path, init_kata_service: InitKataService):
+            with pytest.raises(KataTemplateNotFound) as template_not_found_error:
+                init_kata_service.init_kata(tmp_path, VALID_KATA_NAME, 'java', 'internal:hamcrest')
+
+            assert template_not_found_error.value.available_templates == [
+                KataTemplate(KataLanguage('java'), 'junit5', self.INTERNAL)]
+
     class TestListLanguages:
         def test_valid_case(self,
                             init_kata_service: InitKataService,
@@ -246,6 +426,95 @@ class TestInitKataService:
             assert language_not_found_error.value.available_languages == [KataLanguage('java')]
 
 
+class TestKataStatusService:
+    # `git hash-object` of 'hello\n'
+    HELLO_SHA = 'ce013625030ba8dba906f756967f9e9ca394464a'
+
+    @pytest.fixture
+    def manifest_repo(self):
+        return KataManifestRepo(FileWriter())
+
+    @pytest.fixture
+    def kata_dir(self, tmp_path: Path, manifest_repo: KataManifestRepo):
+        """
+        Kata of a template with 3 files, and 1 file added since
+        """
+        kata_dir = tmp_path / 'my_kata'
+        (kata_dir / 'src').mkdir(parents=True)
+        for file_name in ['same.txt', 'edited.txt', 'src/added.txt']:
+            (kata_dir / file_name).write_text('hello\n')
+        (kata_dir / 'edited.txt').write_text('hellO\n')
+        manifest_repo.save(kata_dir, KataManifest('frank', 'bootstraps', 'java/junit5', PathFilter(), [
+            DownloadableFile(Path(file_name), f'http://url/{file_name}', size=len('hello\n'), sha=self.HELLO_SHA)
+            for file_name in ['same.txt', 'edited.txt', 'src/deleted.txt']]))
+        return kata_dir
+
+    def test_compared_with_the_files_recorded_by_init(self, kata_dir: Path, manifest_repo: KataManifestRepo):
+        status_service = KataStatusService(manifest_repo)
+
+        [kata_status] = status_service.status([kata_dir])
+
+        assert kata_status.kata_dir == kata_dir
+        assert kata_status.modified == [Path('edited.txt')]
+        assert kata_status.missing == [Path('src/deleted.txt')]
+        assert kata_status.unchanged == [Path('same.txt')]
+
+    def test_compared_with_a_fresh_listing(self, kata_dir: Path, manifest_repo: KataManifestRepo):
+        # Given: The template changed the same way as the kata since it was initialized
+        mock_grepo = MagicMock()
+        mock_grepo.get_files_to_download.return_value = [
+            DownloadableFile(Path('edited.txt'), 'http://url/edited.txt', size=len('hellO\n'),
+                             sha='4b32b59cf6f008703c95a6d2284f027e6ef86b54')]
+        status_service = KataStatusService(manifest_repo, grepo=mock_grepo)
+
+        # When: Checking the status
+        [kata_status] = status_service.status([kata_dir])
+
+        # Then: The template is listed again, the same way it was when initializing the kata
+        mock_grepo.get_files_to_download.assert_called_with(user='frank', repo='bootstraps', path='java/junit5',
+                                                            path_filter=PathFilter())
+        assert kata_status == KataStatus(kata_dir, modified=[], missing=[], unchanged=[Path('edited.txt')])
+
+    def test_files_are_hashed_in_parallel_by_chunks(self, kata_dir: Path, manifest_repo: KataManifestRepo):
+        # Given: Hashing is always worth spreading over a process pool
+        with ProcessPoolExecutor(max_workers=2) as process_pool:
+            status_service = KataStatusService(manifest_repo, process_pool)
+            status_service.PARALLEL_MIN_BYTES = 0
+            status_service.HASHING_CHUNK_SIZE = 1
+
+            # When: Checking the status
+            [kata_status] = status_service.status([kata_dir])
+
+        # Then: Same result as when hashing in process
+        assert kata_status.modified == [Path('edited.txt')]
+        assert kata_status.unchanged == [Path('same.txt')]
+
+    def test_not_initialized_by_init_is_unknown(self, tmp_path: Path, kata_dir: Path,
+                                                manifest_repo: KataManifestRepo):
+        # Given: A directory without a manifest, along with a kata
+        not_a_kata = tmp_path / 'not_a_kata'
+        not_a_kata.mkdir()
+
+        # When: Checking the status of both
+        not_a_kata_status, kata_status = KataStatusService(manifest_repo).status([not_a_kata, kata_dir])
+
+        # Then: The directory is reported as unknown, and the kata as usual
+        assert not_a_kata_status == KataStatus(not_a_kata, modified=[], missing=[], unchanged=[], unknown=True)
+        assert not kata_status.unknown
+        assert kata_status.modified == [Path('edited.txt')]
+
+    def test_parent_directory_now_a_file(self, kata_dir: Path, manifest_repo: KataManifestRepo):
+        # Given: The directory of a listed file was replaced by a file
+        shutil.rmtree(str(kata_dir / 'src'))
+        (kata_dir / 'src').write_text('hello\n')
+
+        # When: Checking the status
+        [kata_status] = KataStatusService(manifest_repo).status([kata_dir])
+
+        # Then: The listed file is missing
+        assert kata_status.missing == [Path('src/deleted.txt')]
+
+
 class TestLoginService:
     @pytest.fixture
     def login_service(self, config_repo):
@@ -256,10 +525,16 @@ class TestLoginService:
             config_repo.config['Auth']['Token'] = 'TOKEN1234'
             assert login_service.is_logged_in() is True
 
+        def test_is_logged_in_with_token_pool_only(self, login_service, config_repo: HardCoded.ConfigRepo):
+            config_repo.config['Auth'].pop('Token', None)
+            config_repo.config['Auth']['Tokens'] = ['TOKEN1234', 'TOKEN5678']
+            assert login_service.is_logged_in() is True
+
         def test_not_logged_in(self, login_service, config_repo: HardCoded.ConfigRepo):
             # As of now, 'Token' isn't by default in the 'valid_config',
             # but still popping to make the test resilient to future changes
             config_repo.config['Auth'].pop('Token', None)
+            config_repo.config['Auth'].pop('Tokens', None)
             assert login_service.is_logged_in() is False
 
     class TestShouldSkipWarning:
@@ -0,0 +1,46 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import kata
+
+SRC_DIR = Path(kata.__file__).parent.parent
+HEAVY_DEPENDENCIES = ['requests', 'yaml', 'schema']
+
+
+def modules_imported_when_running(cli_args, tmp_path: Path):
+    script = f"""
+import sys
+from click.testing import CliRunner
+from kata.presentation import cli
+cli.CONFIG_FILE = cli.Path({str(tmp_path / 'config')!r})
+cli.CACHE_DIR = cli.Path({str(tmp_path / 'cache')!r})
+CliRunner().invoke(cli.cli, {cli_args!r}, catch_exceptions=False)
+print(','.join(sys.modules))
+"""
+    output = subprocess.run([sys.executable, '-c', script],
+                            env={'PYTHONPATH': str(SRC_DIR)},
+                            stdout=subprocess.PIPE,
+                            check=True).stdout.decode()
+    return output.strip().split(',')
+
+
+class TestStartup:
+    @pytest.mark.parametrize('cli_args', [['--help'],
+                                          ['init', '--help'],
+                                          ['status', '--help'],
+                                          ['debug', 'debug']])
+    def test_heavy_dependencies_are_not_imported(self, cli_args, tmp_path: Path):
+        imported_modules = modules_imported_when_running(cli_args, tmp_path)
+        for heavy_dependency in HEAVY_DEPENDENCIES:
+            assert heavy_dependency not in imported_modules
+
+    def test_nothing_is_built_when_not_needed(self, tmp_path: Path):
+        # When: Running a command not requiring the config
+        modules_imported_when_running(['debug', 'debug'], tmp_path)
+
+        # Then: Config file wasn't created and nothing was written to the cache
+        assert not (tmp_path / 'config').exists()
+        assert not (tmp_path / 'cache').exists()
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import kata
+from kata.data.catalog import CatalogSnapshot
+from kata.data.io.file import FileWriter
+from kata.presentation.completion import suggest
+
+SRC_DIR = Path(kata.__file__).parent.parent
+KATA_BIN = SRC_DIR.parent / 'bin' / 'kata'
+
+
+@pytest.fixture
+def catalog(tmp_path: Path):
+    catalog = CatalogSnapshot(tmp_path / 'catalog.json', FileWriter())
+    catalog.record_languages(['java', 'javascript', 'rust'])
+    catalog.record_templates('java', ['junit5', 'hamcrest'])
+    return catalog
+
+
+class TestSuggest:
+    def test_languages_when_initializing(self, catalog):
+        assert suggest(['init', 'my_kata'], 'ja', catalog) == ['java', 'javascript']
+
+    def test_templates_of_language_when_initializing(self, catalog):
+        assert suggest(['init', 'my_kata', 'java'], '', catalog) == ['hamcrest', 'junit5']
+
+    def test_languages_when_listing_templates(self, catalog):
+        assert suggest(['--stats', 'list', 'templates'], 'r', catalog) == ['rust']
+
+    def test_other_positions_are_not_handled(self, catalog):
+        assert suggest([], 'in', catalog) is None
+        assert suggest(['init'], '', catalog) is None
+        assert suggest(['list'], '', catalog) is None
+
+
+class TestFastCompletion:
+    def complete(self, home: Path, shell: str, comp_words: str, comp_cword: str):
+        env = dict(os.environ,
+                   HOME=str(home),
+                   PYTHONPATH=str(SRC_DIR),
+                   _KATA_COMPLETE=f'{shell}_complete',
+                   COMP_WORDS=comp_words,
+                   COMP_CWORD=comp_cword)
+        return subprocess.run([sys.executable, str(KATA_BIN)], env=env, stdout=subprocess.PIPE,
+                              check=True).stdout.decode()
+
+    @pytest.fixture
+    def home(self, tmp_path: Path):
+        catalog = CatalogSnapshot(tmp_path / '.cache' / 'kata' / 'catalog.json', FileWriter())
+        catalog.record_languages(['java', 'javascript', 'rust'])
+        return tmp_path
+
+    def test_bash(self, home):
+        assert self.complete(home, 'bash', 'kata init my_kata ja', '3') == 'plain,java\nplain,javascript\n'
+
+    def test_zsh(self, home):
+        assert self.complete(home, 'zsh', 'kata init my_kata r', '3') == 'plain\nrust\n_\n'
+
+    def test_fish(self, home):
+        assert self.complete(home, 'fish', 'kata init my_kata r', 'r') == 'plain,rust\n'
+
+    def test_unhandled_position_falls_back_to_click(self, home):
+        assert self.complete(home, 'bash', 'kata in', '1') == 'plain,init\n'